@@ -58,6 +58,11 @@ def process_new_file(file_name):
         )
 
         with connection.cursor() as cursor:
+            # Movement / displacement are stored as ids of their lookup tables
+            for lookup, column in (("enr_movementlist", "Movement"), ("enr_displacementlist", "Displacement")):
+                labels = melted_df[column].dropna().astype(str).unique()
+                cursor.executemany(f"INSERT IGNORE INTO {lookup} (name) VALUES (%s)", [(label,) for label in labels])
+
             for row in melted_df.itertuples(index=False):
                 vessel_id = row.Vessel  # Since Excel now sends "1" instead of "Sakti"
                 parameter = row.Parameter
@@ -85,11 +90,12 @@ def process_new_file(file_name):
 
                 # Insert into EnrParameter
                 cursor.execute("""
-                INSERT INTO enr_enrparameter (vessel_id, date, movement, displacement, parameter_id, value)
-                VALUES (%s, %s, %s, %s, %s, %s)
+                INSERT INTO enr_enrparameter (vessel_id, date, movement_id, displacement_id, parameter_id, value)
+                VALUES (%s, %s, (SELECT id FROM enr_movementlist WHERE name = %s),
+                        (SELECT id FROM enr_displacementlist WHERE name = %s), %s, %s)
                 ON DUPLICATE KEY UPDATE 
-                    movement = VALUES(movement),
-                    displacement = VALUES(displacement),
+                    movement_id = VALUES(movement_id),
+                    displacement_id = VALUES(displacement_id),
                     value = VALUES(value);
                 """, (vessel_id, row.Date, row.Movement, row.Displacement, parameter_id, row.Value))
 
@@ -0,0 +1,594 @@
+"""
+Bulk ingestion of melted ENR / sea-trial workbooks into MySQL.
+
+Instead of looking up the vessel and parameter of every melted cell and
+upserting it on its own, a file is ingested with:
+
+* one query resolving all vessel ids of the file,
+* one query resolving all parameter codes (plus one batch insert for new codes),
+* one query reading the values already stored for the file's vessels and
+  date range, which the incoming cells are diffed against,
+* multi-row ``INSERT ... ON DUPLICATE KEY UPDATE`` statements of BATCH_SIZE rows
+  for the inserted and changed cells only, and one ``DELETE`` per batch of
+  cells that were emptied in the file,
+
+all inside a single transaction, so a failing file leaves nothing half written.
+Re-sending a workbook with a few corrected cells therefore costs a few writes.
+ENR files also recompute the calculated parameters (enr.formulas) of the
+vessel dates they changed and the day/week/month rollups (enr.rollups) of the
+periods they changed, in the same transaction.
+When anything was written, the table's row in enr_dataversion and the
+enr_partitionversion rows of the changed vessel months are bumped in the same
+transaction, which invalidates the API responses cached for that data.
+After the commit the changed vessel months of the optional columnar store
+(enr.storage) are rewritten, when COLUMNAR_STORE is set; a failure there is
+logged and leaves the import committed.
+"""
+import datetime
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+import pymysql
+
+from enr.formulas import STORED_COLUMNS, affected_formulas, formula_codes, load_formulas, recalculate_frames
+from enr.rollups import ROLLUP_KEYS, STATISTICS, refresh_frames, rollup_range
+from enr.storage import ENR_DATASET, SEATRIAL_DATASET, ColumnarStore, next_month, partitions_of
+
+logger = logging.getLogger(__name__)
+
+# MySQL connection settings
+DB_SETTINGS = {
+    "host": "127.0.0.1",
+    "user": "root",
+    "password": "admin123",
+    "database": "fleetsys",
+}
+
+# Directory of the columnar (Parquet) store kept next to the tables, same as the
+# ENR_COLUMNAR_STORE Django setting; None leaves it out
+COLUMNAR_STORE = os.environ.get("ENR_COLUMNAR_STORE") or None
+
+# Rows per multi-row INSERT statement
+BATCH_SIZE = 5000
+
+# Character columns, stored as text whatever type the workbook cell had
+TEXT_COLUMNS = {"session"}
+# Label columns stored as the id of their text in a lookup table
+LABEL_TABLES = {"movement_id": "enr_movementlist", "displacement_id": "enr_displacementlist"}
+
+
+@dataclass(frozen=True)
+class TargetTable:
+    """Where and how the melted rows of one workbook type are stored."""
+    name: str
+    key_columns: tuple       # melted frame columns copied as-is, in table column order
+    table_key_columns: tuple  # matching table columns
+    unique_columns: tuple    # table columns of the unique constraint
+    update_columns: tuple    # table columns refreshed when the row already exists
+    range_column: str        # table column bounding the bulk read of existing rows
+    version_name: str        # enr_dataversion row bumped when the table changes
+    rollups: bool = False    # keep enr_enrparameterrollup up to date (enr.rollups)
+    formulas: bool = False   # recompute calculated parameters (enr.formulas)
+    store_dataset: object = None  # enr.storage data set mirroring the table
+
+
+ENR_TABLE = TargetTable(
+    name="enr_enrparameter",
+    key_columns=("Date", "Movement", "Displacement"),
+    table_key_columns=("date", "movement_id", "displacement_id"),
+    unique_columns=("vessel_id", "date", "parameter_id"),
+    update_columns=("movement_id", "displacement_id", "value"),
+    range_column="date",
+    version_name="enr",
+    rollups=True,
+    formulas=True,
+    store_dataset=ENR_DATASET,
+)
+
+SEATRIAL_TABLE = TargetTable(
+    name="enr_seatrialparameter",
+    key_columns=("Session", "Timestamp", "Displacement"),
+    table_key_columns=("session", "timestamp", "displacement_id"),
+    unique_columns=("vessel_id", "session", "timestamp", "parameter_id"),
+    update_columns=("displacement_id", "value"),
+    range_column="timestamp",
+    version_name="seatrial",
+    store_dataset=SEATRIAL_DATASET,
+)
+
+
+@dataclass
+class IngestionResult:
+    rows_read: int = 0
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    unknown_vessels: tuple = ()
+    skipped_rows: int = 0
+    new_parameters: int = 0
+    calculated: int = 0      # calculated values written or deleted
+    seconds: float = 0.0
+
+    @property
+    def rows(self):
+        """Rows actually written (inserted or updated)."""
+        return self.inserted + self.updated
+
+    @property
+    def rows_per_sec(self):
+        return self.rows_read / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        summary = (f"{self.inserted} inserted, {self.updated} updated, "
+                   f"{self.deleted} deleted, {self.unchanged} unchanged")
+        if self.calculated:
+            summary += f", {self.calculated} calculated values refreshed"
+        return summary
+
+
+def connect():
+    """Open a connection with autocommit off, so one file is one transaction."""
+    return pymysql.connect(**DB_SETTINGS, cursorclass=pymysql.cursors.Cursor, autocommit=False)
+
+
+def _in_clause(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def resolve_vessels(cursor, vessel_ids):
+    """Return the subset of vessel_ids (as strings) that exist in enr_vessellist."""
+    vessel_ids = [vessel_id for vessel_id in vessel_ids if vessel_id is not None]
+    if not vessel_ids:
+        return set()
+    cursor.execute(f"SELECT id FROM enr_vessellist WHERE id IN ({_in_clause(vessel_ids)})", vessel_ids)
+    return {str(row[0]) for row in cursor.fetchall()}
+
+
+def resolve_parameters(cursor, codes, create=True):
+    """
+    Return {code: parameter id} for all codes, creating the missing
+    ParameterList rows in one batch. Returns the mapping and the number created.
+    """
+    codes = [str(code) for code in codes]
+    if not codes:
+        return {}, 0
+
+    select = f"SELECT code, id FROM enr_parameterlist WHERE code IN ({_in_clause(codes)})"
+    cursor.execute(select, codes)
+    mapping = dict(cursor.fetchall())
+
+    missing = [code for code in codes if code not in mapping]
+    if missing and create:
+        cursor.executemany(
+            "INSERT INTO enr_parameterlist (code, description, is_calculated) VALUES (%s, %s, %s)",
+            [(code, f"Description for {code}", 0) for code in missing],
+        )
+        cursor.execute(select, codes)
+        mapping = dict(cursor.fetchall())
+        return mapping, len(missing)
+    return mapping, 0
+
+
+def _labels(values):
+    """Text of the non-empty cells of a label column."""
+    return values.astype(object).where(values.isna(), values.astype(str))
+
+
+def resolve_labels(cursor, melted_df, table, create=True):
+    """
+    Return {table column: {label: id}} for the label columns of table,
+    creating the missing lookup rows in one batch per lookup table.
+    """
+    mapping = {}
+    for frame_column, table_column in zip(table.key_columns, table.table_key_columns):
+        if table_column not in LABEL_TABLES:
+            continue
+        lookup = LABEL_TABLES[table_column]
+        labels = [str(label) for label in _labels(melted_df[frame_column]).dropna().unique()]
+        if not labels:
+            mapping[table_column] = {}
+            continue
+        select = f"SELECT name, id FROM {lookup} WHERE name IN ({_in_clause(labels)})"
+        cursor.execute(select, labels)
+        ids = dict(cursor.fetchall())
+        missing = [label for label in labels if label not in ids]
+        if missing and create:
+            cursor.executemany(f"INSERT INTO {lookup} (name) VALUES (%s)", [(label,) for label in missing])
+            cursor.execute(select, labels)
+            ids = dict(cursor.fetchall())
+        mapping[table_column] = ids
+    return mapping
+
+
+def _none_for_missing(series):
+    return series.astype(object).where(series.notna(), None)
+
+
+def build_frame(melted_df, table, parameter_ids, label_ids, with_values=True):
+    """
+    Vectorized conversion of a melted frame into table columns, label_ids
+    being the resolve_labels mapping.
+    """
+    columns = {"vessel_id": melted_df["Vessel"].astype(str)}
+    for frame_column, table_column in zip(table.key_columns, table.table_key_columns):
+        values = melted_df[frame_column]
+        if table_column == "date":
+            values = pd.to_datetime(values).dt.date
+        elif table_column in TEXT_COLUMNS:
+            values = _labels(values)
+        elif table_column in LABEL_TABLES:
+            values = _labels(values).map(label_ids.get(table_column, {})).astype("Int64")
+        columns[table_column] = _none_for_missing(values)
+    columns["parameter_id"] = melted_df["Parameter"].astype(str).map(parameter_ids)
+    if with_values:
+        columns["value"] = melted_df["Value"].astype(float)
+    frame = pd.DataFrame(columns)
+    frame = frame[frame["parameter_id"].notna()]
+    frame["parameter_id"] = frame["parameter_id"].astype(int)
+    # The last cell wins when a workbook repeats a key, as it would with sequential upserts
+    return frame.drop_duplicates(subset=list(table.unique_columns), keep="last")
+
+
+def fetch_existing(cursor, table, frame):
+    """
+    Read the stored rows for the vessels, parameters and range covered by frame
+    in one query.
+    """
+    columns = ("id",) + table.unique_columns + tuple(
+        column for column in table.update_columns if column not in table.unique_columns
+    )
+    if frame.empty:
+        return pd.DataFrame(columns=columns)
+
+    vessels = list(frame["vessel_id"].unique())
+    parameters = [int(p) for p in frame["parameter_id"].unique()]
+    bounds = frame[table.range_column].dropna()
+    cursor.execute(
+        f"""
+        SELECT {", ".join(columns)} FROM {table.name}
+        WHERE vessel_id IN ({_in_clause(vessels)})
+          AND parameter_id IN ({_in_clause(parameters)})
+          AND {table.range_column} BETWEEN %s AND %s
+        """,
+        vessels + parameters + [bounds.min(), bounds.max()],
+    )
+    existing = pd.DataFrame(list(cursor.fetchall()), columns=columns)
+    existing["vessel_id"] = existing["vessel_id"].astype(str)
+    return existing
+
+
+def _normalize_keys(frame, table):
+    """Give both sides of the diff the same key dtypes so they merge reliably."""
+    frame = frame.copy()
+    if table.range_column == "timestamp":
+        frame["timestamp"] = pd.to_datetime(frame["timestamp"])
+    frame["parameter_id"] = frame["parameter_id"].astype(int)
+    return frame
+
+
+def _differs(left, right):
+    """Null-aware inequality of two aligned Series."""
+    both_missing = left.isna() & right.isna()
+    return ~both_missing & ((left != right) | left.isna() | right.isna())
+
+
+def diff_rows(incoming, existing, blank, table):
+    """
+    Compare the incoming cells with the stored rows.
+
+    Returns (upserts, deleted, counts): upserts are the incoming rows that
+    are new or differ in any update column, deleted the stored rows (with
+    their id) whose cell is present but empty in the workbook, and counts the
+    number of inserted, updated and unchanged cells.
+    """
+    unique = list(table.unique_columns)
+    incoming = _normalize_keys(incoming, table)
+    existing = _normalize_keys(existing, table)
+
+    merged = incoming.merge(existing, on=unique, how="left", suffixes=("", "_stored"), indicator=True)
+    is_new = merged["_merge"] == "left_only"
+    changed = pd.Series(False, index=merged.index)
+    for column in table.update_columns:
+        changed |= _differs(merged[column], merged[f"{column}_stored"])
+    write = is_new | changed
+    upserts = incoming[write.to_numpy()]
+
+    deleted = existing.iloc[0:0]
+    if not blank.empty and not existing.empty:
+        blank = _normalize_keys(blank[unique], table)
+        deleted = blank.merge(existing, on=unique, how="inner")
+    counts = {
+        "inserted": int(is_new.sum()),
+        "updated": int((changed & ~is_new).sum()),
+        "unchanged": int((~write).sum()),
+    }
+    return upserts, deleted, counts
+
+
+def upsert_sql(table, columns):
+    updates = ",\n            ".join(f"{column} = VALUES({column})" for column in table.update_columns)
+    return f"""
+        INSERT INTO {table.name} ({", ".join(columns)})
+        VALUES ({", ".join(["%s"] * len(columns))})
+        ON DUPLICATE KEY UPDATE
+            {updates}
+    """
+
+
+# (vessel, parameter, date) columns of a changed ENR cell
+ROLLUP_CHANGE_COLUMNS = ("vessel_id", "parameter_id", "date")
+ROLLUP_TABLE = "enr_enrparameterrollup"
+
+
+def refresh_rollups(cursor, changed, batch_size=BATCH_SIZE):
+    """
+    Recompute the day/week/month rollups of the periods touched by the changed
+    cells, with the same enr.rollups code as EnrParameterRollup.refresh.
+    """
+    changed = changed.rename(columns={"vessel_id": "vessel", "parameter_id": "parameter"})
+    changed = changed.assign(vessel=changed["vessel"].astype(int))
+    vessels = [int(v) for v in changed["vessel"].unique()]
+    parameters = [int(p) for p in changed["parameter"].unique()]
+    first, last = rollup_range(changed["date"])
+    cursor.execute(
+        f"""
+        SELECT vessel_id, parameter_id, date, value FROM enr_enrparameter
+        WHERE vessel_id IN ({_in_clause(vessels)})
+          AND parameter_id IN ({_in_clause(parameters)})
+          AND date BETWEEN %s AND %s
+        """,
+        vessels + parameters + [first, last],
+    )
+    raw = pd.DataFrame(list(cursor.fetchall()), columns=["vessel", "parameter", "date", "value"])
+    rollups, stale = refresh_frames(changed, raw)
+
+    stale_keys = list(stale[ROLLUP_KEYS].itertuples(index=False, name=None))
+    for offset in range(0, len(stale_keys), batch_size):
+        batch = stale_keys[offset:offset + batch_size]
+        cursor.execute(
+            f"DELETE FROM {ROLLUP_TABLE} WHERE (vessel_id, parameter_id, granularity, period_start) IN "
+            f"({', '.join(['(%s, %s, %s, %s)'] * len(batch))})",
+            [value for key in batch for value in key],
+        )
+
+    columns = ["vessel_id", "parameter_id", "granularity", "period_start", *STATISTICS]
+    updates = ", ".join(f"`{name}` = VALUES(`{name}`)" for name in STATISTICS)
+    sql = f"""
+        INSERT INTO {ROLLUP_TABLE} ({", ".join(f"`{column}`" for column in columns)})
+        VALUES ({", ".join(["%s"] * len(columns))})
+        ON DUPLICATE KEY UPDATE {updates}
+    """
+    rows = list(rollups[ROLLUP_KEYS + list(STATISTICS)].itertuples(index=False, name=None))
+    for offset in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[offset:offset + batch_size])
+
+
+def recalculate(cursor, changed, batch_size=BATCH_SIZE):
+    """
+    Recompute the calculated parameters depending on the changed cells, for
+    their vessel dates only, with the same enr.formulas code as
+    EnrParameter.recalculate. Returns the (vessel_id, parameter_id, date) of
+    the calculated values written or deleted.
+    """
+    written = pd.DataFrame(columns=list(ROLLUP_CHANGE_COLUMNS))
+    cursor.execute("SELECT id, code, formula FROM enr_parameterlist WHERE is_calculated = 1 AND formula <> ''")
+    formulas = load_formulas(cursor.fetchall())
+    if not formulas or changed.empty:
+        return written
+
+    parameters = [int(p) for p in changed["parameter_id"].unique()]
+    cursor.execute(f"SELECT code FROM enr_parameterlist WHERE id IN ({_in_clause(parameters)})", parameters)
+    formulas = affected_formulas(formulas, [row[0] for row in cursor.fetchall()])
+    if not formulas:
+        return written
+
+    changed = changed.rename(columns={"vessel_id": "vessel", "parameter_id": "parameter"})
+    changed = changed.assign(vessel=changed["vessel"].astype(int))
+    vessels = [int(v) for v in changed["vessel"].unique()]
+    codes = formula_codes(formulas)
+    cursor.execute(
+        f"""
+        SELECT e.id, e.vessel_id, e.date, e.movement_id, e.displacement_id, e.parameter_id, p.code, e.value
+        FROM enr_enrparameter e JOIN enr_parameterlist p ON p.id = e.parameter_id
+        WHERE e.vessel_id IN ({_in_clause(vessels)})
+          AND e.date BETWEEN %s AND %s
+          AND p.code IN ({_in_clause(codes)})
+        """,
+        vessels + [changed["date"].min(), changed["date"].max()] + codes,
+    )
+    stored = pd.DataFrame(list(cursor.fetchall()), columns=STORED_COLUMNS)
+    upserts, stale = recalculate_frames(changed, stored, formulas)
+
+    columns = ["vessel_id", "date", "movement_id", "displacement_id", "parameter_id", "value"]
+    upserts = upserts.rename(columns={
+        "vessel": "vessel_id", "parameter": "parameter_id", "movement": "movement_id", "displacement": "displacement_id",
+    })[columns]
+    rows = list(upserts.astype(object).where(upserts.notna(), None).itertuples(index=False, name=None))
+    sql = upsert_sql(ENR_TABLE, columns)
+    for offset in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[offset:offset + batch_size])
+    stale_ids = [int(i) for i in stale["id"]]
+    for offset in range(0, len(stale_ids), batch_size):
+        batch = stale_ids[offset:offset + batch_size]
+        cursor.execute(f"DELETE FROM {ENR_TABLE.name} WHERE id IN ({_in_clause(batch)})", batch)
+
+    stale = stale.rename(columns={"vessel": "vessel_id", "parameter": "parameter_id"})
+    return pd.concat([upserts[list(ROLLUP_CHANGE_COLUMNS)], stale[list(ROLLUP_CHANGE_COLUMNS)]], ignore_index=True)
+
+
+def sync_columnar_store(cursor, dataset, partitions, store):
+    """Rewrite the (vessel, month) partitions of the columnar store from the table, like enr.models.sync_columnar_store."""
+    table = f"enr_{'enrparameter' if dataset is ENR_DATASET else 'seatrialparameter'}"
+    # The store keeps the labels of the lookup columns
+    columns, joins = ["t.vessel_id"], []
+    for column in dataset.columns:
+        if f"{column}_id" in LABEL_TABLES:
+            joins.append(f"LEFT JOIN {LABEL_TABLES[column + '_id']} {column} ON {column}.id = t.{column}_id")
+            columns.append(f"{column}.name")
+        else:
+            columns.append(f"t.{column}_id" if column == "parameter" else f"t.{column}")
+    frames = []
+    for vessel, month in partitions:
+        start, end = month, next_month(month)
+        if dataset.range_column == "timestamp":
+            start, end = (datetime.datetime.combine(day, datetime.time()) for day in (start, end))
+        cursor.execute(
+            f"""
+            SELECT {", ".join(columns)} FROM {table} t {" ".join(joins)}
+            WHERE t.vessel_id = %s AND t.parameter_id IS NOT NULL
+              AND t.{dataset.range_column} >= %s AND t.{dataset.range_column} < %s
+            """,
+            [vessel, start, end],
+        )
+        frames.append(pd.DataFrame(list(cursor.fetchall()), columns=["vessel", *dataset.columns]))
+    store.write_partitions(dataset, pd.concat(frames, ignore_index=True), partitions,
+                           partition_versions(cursor, dataset.name, partitions))
+
+
+def partition_versions(cursor, dataset, partitions):
+    """Same as enr.models.PartitionVersion.versions, for writers outside of Django."""
+    vessels = sorted({vessel for vessel, _ in partitions})
+    cursor.execute(
+        f"SELECT vessel, month, version FROM enr_partitionversion WHERE dataset = %s AND vessel IN ({_in_clause(vessels)})",
+        [dataset, *vessels],
+    )
+    partitions = set(partitions)
+    return {(vessel, month): version for vessel, month, version in cursor.fetchall() if (vessel, month) in partitions}
+
+
+def bump_data_version(cursor, name):
+    """Same as enr.models.DataVersion.bump, for writers outside of Django."""
+    cursor.execute(
+        """
+        INSERT INTO enr_dataversion (name, version, updated_at) VALUES (%s, 1, UTC_TIMESTAMP(6))
+        ON DUPLICATE KEY UPDATE version = version + 1, updated_at = UTC_TIMESTAMP(6)
+        """,
+        [name],
+    )
+
+
+def bump_partition_versions(cursor, dataset, partitions):
+    """Same as enr.models.PartitionVersion.bump, for writers outside of Django."""
+    cursor.executemany(
+        """
+        INSERT INTO enr_partitionversion (dataset, vessel, month, version) VALUES (%s, %s, %s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+        """,
+        [(dataset, vessel, month) for vessel, month in partitions],
+    )
+
+
+def sync_committed_partitions(connection, dataset, partitions):
+    """
+    sync_columnar_store after the commit. The rows are imported whether the
+    store could be rewritten or not, so a failure is logged with the command
+    rebuilding the partitions rather than raised.
+    """
+    try:
+        with connection.cursor() as cursor:
+            sync_columnar_store(cursor, dataset, partitions, ColumnarStore(COLUMNAR_STORE))
+    except Exception:
+        vessels = " ".join(f"--vessel {vessel}" for vessel in sorted({vessel for vessel, _ in partitions}))
+        logger.exception(
+            "Columnar store not updated for %d %s vessel months, rebuild them with: "
+            "python manage.py build_columnar_store --dataset %s %s",
+            len(partitions), dataset.name, dataset.name, vessels,
+        )
+
+
+def ingest(melted_df, table, blank_df=None, connection=None, batch_size=BATCH_SIZE):
+    """
+    Write a melted frame (Vessel, <table key columns>, Parameter, Value) into table.
+    Only cells that are new or changed are upserted; stored values of cells
+    listed in blank_df (present in the workbook but empty or non-numeric)
+    are deleted. Everything runs in one transaction which is rolled back on
+    any error.
+
+    Emptying a cell in a re-sent workbook therefore deletes its stored value,
+    where the per-row parsers used to keep it. Cells the workbook does not
+    have at all (other dates, other parameter columns) are left alone.
+    """
+    start = time.perf_counter()
+    result = IngestionResult()
+    own_connection = connection is None
+    if own_connection:
+        connection = connect()
+
+    try:
+        with connection.cursor() as cursor:
+            vessels = melted_df["Vessel"].astype(str)
+            known_vessels = resolve_vessels(cursor, list(vessels.unique()))
+            known = vessels.isin(known_vessels)
+            result.unknown_vessels = tuple(sorted(set(vessels[~known])))
+            result.skipped_rows = int((~known).sum())
+            melted_df = melted_df[known]
+
+            parameter_ids, result.new_parameters = resolve_parameters(cursor, list(melted_df["Parameter"].unique()))
+            label_ids = resolve_labels(cursor, melted_df, table)
+            incoming = build_frame(melted_df, table, parameter_ids, label_ids)
+            result.rows_read = len(incoming)
+
+            blank = pd.DataFrame(columns=list(table.unique_columns))
+            if blank_df is not None and not blank_df.empty:
+                blank_df = blank_df[blank_df["Vessel"].astype(str).isin(known_vessels)]
+                # Emptied columns are looked up but never create new parameters
+                blank_codes = [code for code in blank_df["Parameter"].astype(str).unique() if code not in parameter_ids]
+                blank_ids, _ = resolve_parameters(cursor, blank_codes, create=False)
+                blank = build_frame(blank_df, table, {**parameter_ids, **blank_ids}, label_ids, with_values=False)
+
+            # One bulk read of the stored values covering both the filled and the emptied cells
+            existing = fetch_existing(cursor, table, pd.concat([incoming, blank], ignore_index=True))
+            upserts, deleted, counts = diff_rows(incoming, existing, blank, table)
+            deleted_ids = [int(i) for i in deleted["id"]]
+
+            rows = list(upserts.itertuples(index=False, name=None))
+            sql = upsert_sql(table, list(upserts.columns))
+            for offset in range(0, len(rows), batch_size):
+                # pymysql rewrites executemany of an INSERT ... VALUES into multi-row statements
+                cursor.executemany(sql, rows[offset:offset + batch_size])
+
+            for offset in range(0, len(deleted_ids), batch_size):
+                batch = deleted_ids[offset:offset + batch_size]
+                cursor.execute(f"DELETE FROM {table.name} WHERE id IN ({_in_clause(batch)})", batch)
+
+            result.inserted = counts["inserted"]
+            result.updated = counts["updated"]
+            result.unchanged = counts["unchanged"]
+            result.deleted = len(deleted_ids)
+
+            if (table.formulas or table.rollups) and (result.rows or result.deleted):
+                changed = pd.concat([upserts[list(ROLLUP_CHANGE_COLUMNS)], deleted[list(ROLLUP_CHANGE_COLUMNS)]])
+                if table.formulas:
+                    calculated = recalculate(cursor, changed, batch_size)
+                    result.calculated = len(calculated)
+                    changed = pd.concat([changed, calculated], ignore_index=True)
+                if table.rollups:
+                    refresh_rollups(cursor, changed, batch_size)
+            if result.rows or result.deleted:
+                bump_data_version(cursor, table.version_name)
+            if result.new_parameters:
+                bump_data_version(cursor, "parameters")
+            partitions = partitions_of(
+                list(upserts["vessel_id"]) + list(deleted["vessel_id"]),
+                list(upserts[table.range_column]) + list(deleted[table.range_column]),
+            )
+            if table.store_dataset and partitions:
+                bump_partition_versions(cursor, table.store_dataset.name, partitions)
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    else:
+        if COLUMNAR_STORE and table.store_dataset and partitions:
+            sync_committed_partitions(connection, table.store_dataset, partitions)
+    finally:
+        if own_connection:
+            connection.close()
+
+    result.seconds = time.perf_counter() - start
+    return result
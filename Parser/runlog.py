@@ -0,0 +1,145 @@
+"""
+Per-file run records and logging of the parser ingestion.
+
+Every workbook the parsers handle, imported or failed, becomes one row of
+enr_ingestionrun (enr.models.IngestionRun) with the sheet rows read, the
+cells melted, the cells skipped as non-numeric or of unknown vessels, the
+cells written, and the seconds spent reading the workbook, melting it and
+writing it. The rows are listed in the Django admin and at
+/api/ingestion/runs/, e.g. sorted by total_seconds to find the slow files.
+
+Progress and errors go through the logging module, a logger per module;
+configure_logging sets up the console output of the scripts.
+"""
+import contextlib
+import datetime
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+from ingestion import connect
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+LOG_LEVEL = os.environ.get("PARSER_LOG_LEVEL", "INFO")
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level=LOG_LEVEL):
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+def utc_now():
+    # DATETIME columns hold naive UTC values (Django USE_TZ)
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class ParseStats:
+    """What parse_file read and melted from one workbook, and how long it took."""
+    started_at: datetime.datetime
+    rows_read: int = 0         # Sheet rows
+    rows_melted: int = 0       # Numeric (key, parameter) cells
+    rows_non_numeric: int = 0  # Empty / non-numeric cells
+    read_seconds: float = 0.0
+    melt_seconds: float = 0.0
+
+    @classmethod
+    def start(cls):
+        return cls(started_at=utc_now())
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        """Add the time of the block to <phase>_seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            name = f"{phase}_seconds"
+            setattr(self, name, getattr(self, name) + time.perf_counter() - start)
+
+    def timed_iter(self, phase, iterable):
+        """The items of iterable, the time spent producing them added to <phase>_seconds."""
+        items = iter(iterable)
+        while True:
+            with self.timed(phase):
+                item = next(items, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+
+# enr_ingestionrun columns written by record_run
+RUN_COLUMNS = (
+    "file_name", "path", "target_table", "sha256", "status", "error", "started_at", "finished_at",
+    "rows_read", "rows_melted", "rows_non_numeric", "rows_unknown_vessel", "unknown_vessels",
+    "inserted", "updated", "deleted", "unchanged", "new_parameters", "calculated",
+    "read_seconds", "melt_seconds", "db_seconds", "total_seconds",
+)
+
+
+def run_row(file_name, table, stats=None, result=None, error=None, path="", sha256=""):
+    """
+    Values of the RUN_COLUMNS of one file from its ParseStats and
+    ingestion.IngestionResult, either missing when the run failed before.
+    """
+    finished_at = utc_now()
+    stats = stats or ParseStats(started_at=finished_at)
+    db_seconds = result.seconds if result else 0.0
+    return (
+        os.path.basename(file_name), path or "", table, sha256 or "",
+        "failed" if error is not None else "ok",
+        "" if error is None else f"{type(error).__name__}: {error}",
+        stats.started_at, finished_at,
+        stats.rows_read, stats.rows_melted, stats.rows_non_numeric,
+        result.skipped_rows if result else 0,
+        ", ".join(result.unknown_vessels) if result else "",
+        *((result.inserted, result.updated, result.deleted, result.unchanged, result.new_parameters, result.calculated)
+          if result else (0,) * 6),
+        stats.read_seconds, stats.melt_seconds, db_seconds,
+        stats.read_seconds + stats.melt_seconds + db_seconds,
+    )
+
+
+def record_run(file_name, table, stats=None, result=None, error=None, path="", sha256="", connection=None):
+    """
+    Insert the enr_ingestionrun row of one file. A failure to record is logged
+    rather than raised: it must not turn an import that was committed into a
+    failed one.
+    """
+    row = run_row(file_name, table, stats, result, error, path, sha256)
+    own_connection = connection is None
+    try:
+        if own_connection:
+            connection = connect()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO enr_ingestionrun ({', '.join(RUN_COLUMNS)}) VALUES ({', '.join(['%s'] * len(row))})",
+                row,
+            )
+        connection.commit()
+    except Exception:
+        logger.exception("Could not record the ingestion run of %s", file_name)
+    finally:
+        if own_connection and connection is not None:
+            connection.close()
+
+
+def process_file(path, parse, write, table):
+    """
+    Parse and write one workbook and record the run. Errors are recorded,
+    logged and raised again.
+    """
+    file_name = os.path.basename(path)
+    stats = ParseStats.start()
+    try:
+        parsed = parse(path)
+        stats = parsed[-1]
+        result = write(file_name, parsed)
+    except Exception as e:
+        logger.exception("Failed to import %s", file_name)
+        record_run(file_name, table, stats, error=e, path=path)
+        raise
+    record_run(file_name, table, stats, result, path=path)
+    return result
@@ -0,0 +1,588 @@
+"""
+Tests of the parser scripts:
+
+    python manage.py test Parser
+
+Only the ingestion tests use the database, and need it to be MySQL.
+"""
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+import pandas as pd
+import pymysql
+from django.db import connection
+from django.test import TransactionTestCase
+
+from enr.models import EnrParameter, IngestionRun, VesselList
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import enrv3_parser  # noqa: E402
+import ingestion  # noqa: E402
+import runlog  # noqa: E402
+import watcher  # noqa: E402
+import workbook  # noqa: E402
+from runlog import ParseStats, process_file  # noqa: E402
+
+
+class ImmediatePool:
+    """Executor running the parse in the calling thread, so dispatch_settled can be followed step by step."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class FileLedgerTests(unittest.TestCase):
+    def setUp(self):
+        self.ledger = watcher.FileLedger(":memory:")
+
+    def test_only_imported_files_are_processed(self):
+        self.ledger.record("a.xlsx", 1.0, "abc", status="ok")
+        self.ledger.record("b.xlsx", 1.0, "def", status="failed", detail="MySQL server has gone away")
+        self.assertTrue(self.ledger.is_processed("a.xlsx", 1.0, "abc"))
+        self.assertFalse(self.ledger.is_processed("b.xlsx", 1.0, "def"))
+
+    def test_changed_content_is_not_processed(self):
+        self.ledger.record("a.xlsx", 1.0, "abc", status="ok")
+        self.assertFalse(self.ledger.is_processed("a.xlsx", 2.0, "abc"))
+        self.assertFalse(self.ledger.is_processed("a.xlsx", 1.0, "xyz"))
+
+    def test_failed_file_that_imports_later_is_processed(self):
+        self.ledger.record("a.xlsx", 1.0, "abc", status="failed", detail="timeout")
+        self.ledger.record("a.xlsx", 1.0, "abc", status="ok", result=mock.Mock(inserted=3, updated=0, deleted=0, unchanged=1))
+        self.assertTrue(self.ledger.is_processed("a.xlsx", 1.0, "abc"))
+
+
+@mock.patch.object(watcher, "record_run")
+@mock.patch.object(watcher, "SETTLE_SECONDS", 0)
+class DispatchTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.ledger = watcher.FileLedger(":memory:")
+        self.parsed = ("melted", "invalid", ParseStats.start())
+        self.parse = mock.Mock(return_value=self.parsed)
+        self.folder = watcher.WatchedFolder(self.directory, self.parse, self.write, table=f"table_{id(self)}")
+
+    def write(self, file_name, parsed):
+        return mock.Mock(inserted=1, updated=0, deleted=0, unchanged=0)
+
+    def wait_until_written(self, service):
+        """Wait for the writer thread to be done with every dispatched file."""
+        for _ in range(100):
+            with service._lock:
+                if not service._in_flight:
+                    return
+            threading.Event().wait(0.05)
+        self.fail("The writer did not finish")
+
+    def watcher(self):
+        service = watcher.Watcher([self.folder], ledger=self.ledger, max_workers=1)
+        service.pool.shutdown()
+        service.pool = ImmediatePool()
+        return service
+
+    def workbook(self, name="enr.xlsx", content=b"PK workbook"):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as handle:
+            handle.write(content)
+        return path
+
+    def test_file_is_dispatched_once_settled(self, record_run):
+        path = self.workbook()
+        service = self.watcher()
+        service.scan()
+        # The first pass records size and mtime, the file is submitted once they held still
+        service.dispatch_settled()
+        self.parse.assert_not_called()
+        service.dispatch_settled()
+        self.parse.assert_called_once_with(path)
+        self.wait_until_written(service)
+
+    def test_growing_file_is_not_dispatched(self, record_run):
+        path = self.workbook()
+        service = self.watcher()
+        service.notice(self.folder, path)
+        service.dispatch_settled()
+        with open(path, "ab") as handle:
+            handle.write(b" still copying")
+        service.dispatch_settled()
+        self.parse.assert_not_called()
+        service.dispatch_settled()
+        self.parse.assert_called_once_with(path)
+        self.wait_until_written(service)
+
+    def test_unsettled_file_waits(self, record_run):
+        service = self.watcher()
+        service.notice(self.folder, self.workbook())
+        with mock.patch.object(watcher, "SETTLE_SECONDS", 60):
+            service.dispatch_settled()
+            service.dispatch_settled()
+        self.parse.assert_not_called()
+
+    def test_lock_files_and_other_files_are_ignored(self, record_run):
+        self.workbook("~$enr.xlsx")
+        self.workbook("notes.txt")
+        service = self.watcher()
+        service.scan()
+        service.dispatch_settled()
+        service.dispatch_settled()
+        self.parse.assert_not_called()
+
+    def test_imported_file_is_skipped_after_a_restart(self, record_run):
+        self.workbook()
+        service = self.watcher()
+        service.scan()
+        service.dispatch_settled()
+        service.dispatch_settled()
+        self.wait_until_written(service)
+
+        restarted = self.watcher()
+        restarted.scan()
+        restarted.dispatch_settled()
+        restarted.dispatch_settled()
+        self.parse.assert_called_once()
+
+    def test_failed_file_is_retried(self, record_run):
+        path = self.workbook()
+        self.parse.side_effect = [OSError("share unavailable"), self.parsed]
+        service = self.watcher()
+        service.scan()
+        service.dispatch_settled()
+        with self.assertLogs(watcher.logger, "ERROR"):
+            service.dispatch_settled()
+        self.assertEqual(record_run.call_args.kwargs["error"].args, ("share unavailable",))
+
+        # Not before its retry time
+        service.dispatch_settled()
+        service.dispatch_settled()
+        self.assertEqual(self.parse.call_count, 1)
+
+        with mock.patch.object(watcher.time, "monotonic", return_value=watcher.time.monotonic() + watcher.RETRY_SECONDS):
+            service.dispatch_settled()
+            service.dispatch_settled()
+        self.assertEqual(self.parse.call_count, 2)
+        self.parse.assert_called_with(path)
+        self.wait_until_written(service)
+
+    def test_failed_file_is_retried_after_a_restart(self, record_run):
+        self.workbook()
+        self.parse.side_effect = [OSError("share unavailable"), self.parsed]
+        service = self.watcher()
+        service.scan()
+        service.dispatch_settled()
+        with self.assertLogs(watcher.logger, "ERROR"):
+            service.dispatch_settled()
+
+        restarted = self.watcher()
+        restarted.scan()
+        restarted.dispatch_settled()
+        restarted.dispatch_settled()
+        self.assertEqual(self.parse.call_count, 2)
+        self.wait_until_written(restarted)
+
+
+class WorkbookTests(unittest.TestCase):
+    """parse_file melts a sheet as the parsers did with pd.read_excel, with either engine and any chunk size."""
+
+    def setUp(self):
+        from openpyxl import Workbook
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "enr.xlsx")
+        book = Workbook()
+        sheet = book.active
+        sheet.title = "Sheet3"
+        sheet.append(["Vessel", "Date", "Movement", "Displacement", "010001", "010002"])
+        rows = [
+            # The date is written once for a block of rows, as text in some workbooks
+            [101, datetime.datetime(2024, 1, 1), "Sea", "Laden", 1.5, 10],
+            [102, None, "Port", "Ballast", "n/a", 11],
+            [None, None, None, None, None, None],
+            [101, "2024-01-02", "Sea", "Laden", 2.5, None],
+            [102, None, "Sea", "Ballast", 3, 12.25],
+            [101, datetime.datetime(2024, 1, 3), "Sea", "Laden", 4, 13],
+        ]
+        for row in rows:
+            sheet.append(row)
+        # A column without a header after the parameters, only for notes
+        sheet["H2"] = "checked"
+        book.save(self.path)
+
+    def read_excel_melted(self):
+        """What the parsers returned when they read the sheet with pd.read_excel."""
+        df = pd.read_excel(self.path, sheet_name="Sheet3", dtype={'Vessel': str})
+        # read_excel keeps the columns without a header as "Unnamed: <n>" parameters
+        df = df.loc[:, ~df.columns.str.startswith("Unnamed:")].dropna(how='all')
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce').ffill()
+        return workbook.unpivot_frame(df, list(enrv3_parser.LAYOUT.keys), var_name='Parameter', value_name='Value')
+
+    def test_parse_matches_read_excel(self):
+        expected_melted, expected_invalid = self.read_excel_melted()
+        self.assertEqual(len(expected_melted), 8)
+        for engine in workbook.ENGINES:
+            for chunk_rows in (2, None):
+                with self.subTest(engine=engine, chunk_rows=chunk_rows):
+                    melted, invalid, stats = workbook.parse_file(
+                        self.path, enrv3_parser.LAYOUT, chunk_rows=chunk_rows, engine=engine,
+                    )
+                    # The row labels of the melted frames are not used
+                    for frame, expected in ((melted, expected_melted), (invalid, expected_invalid)):
+                        pd.testing.assert_frame_equal(
+                            frame.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False,
+                        )
+                    self.assertEqual((stats.rows_read, stats.rows_melted), (5, 8))
+
+
+class DiffTests(unittest.TestCase):
+    """Which melted cells ingest writes, from the frames of build_frame and fetch_existing."""
+
+    parameter_ids = {"010001": 1, "010002": 2}
+    label_ids = {"movement_id": {"Sea": 1, "Port": 2}, "displacement_id": {"Laden": 1}}
+
+    def melted(self, days=10, values=None, movement="Sea"):
+        """Cells of vessel 101 and both parameters over days, values defaulting to the day number."""
+        dates = pd.date_range("2024-01-01", periods=days)
+        return pd.DataFrame({
+            "Vessel": "101",
+            "Date": list(dates) * 2,
+            "Movement": movement,
+            "Displacement": "Laden",
+            "Parameter": ["010001"] * days + ["010002"] * days,
+            "Value": values if values is not None else [float(day) for day in range(days)] * 2,
+        })
+
+    def frame(self, melted, with_values=True):
+        return ingestion.build_frame(melted, ingestion.ENR_TABLE, self.parameter_ids, self.label_ids, with_values)
+
+    def stored(self, melted):
+        """The rows fetch_existing reads back once melted was written: ids, and dates as datetime.date."""
+        existing = self.frame(melted).reset_index(drop=True)
+        existing.insert(0, "id", range(1, len(existing) + 1))
+        existing["movement_id"] = existing["movement_id"].astype(object).where(existing["movement_id"].notna(), None)
+        return existing
+
+    def diff(self, melted, existing, blank=None):
+        blank = self.frame(blank, with_values=False) if blank is not None else pd.DataFrame(
+            columns=list(ingestion.ENR_TABLE.unique_columns)
+        )
+        return ingestion.diff_rows(self.frame(melted), existing, blank, ingestion.ENR_TABLE)
+
+    def test_build_frame_resolves_the_table_columns(self):
+        melted = self.melted(days=2)
+        melted.loc[1, "Movement"] = None
+        melted.loc[2, "Parameter"] = "999999"
+        frame = self.frame(melted)
+        self.assertEqual(list(frame.columns), [
+            "vessel_id", "date", "movement_id", "displacement_id", "parameter_id", "value",
+        ])
+        # Unknown parameter codes are dropped, an empty label is a null id
+        self.assertEqual(len(frame), 3)
+        self.assertEqual(list(frame["movement_id"]), [1, None, 1])
+        self.assertEqual(list(frame["date"]), [datetime.date(2024, 1, 1)] + [datetime.date(2024, 1, 2)] * 2)
+
+    def test_repeated_key_keeps_the_last_cell(self):
+        melted = self.melted(days=1)
+        melted = pd.concat([melted, melted.assign(Value=[7.0, 8.0])], ignore_index=True)
+        self.assertEqual(list(self.frame(melted)["value"]), [7.0, 8.0])
+
+    def test_new_rows_are_inserted(self):
+        upserts, deleted, counts = self.diff(self.melted(), self.stored(self.melted().iloc[:0]))
+        self.assertEqual(counts, {"inserted": 20, "updated": 0, "unchanged": 0})
+        self.assertEqual(len(upserts), 20)
+        self.assertTrue(deleted.empty)
+
+    def test_unchanged_workbook_writes_nothing(self):
+        upserts, deleted, counts = self.diff(self.melted(), self.stored(self.melted()))
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "unchanged": 20})
+        self.assertTrue(upserts.empty)
+        self.assertTrue(deleted.empty)
+
+    def test_ten_edited_cells_are_ten_upserts(self):
+        existing = self.stored(self.melted(days=100))
+        values = [float(day) for day in range(100)] * 2
+        for cell in range(0, 200, 20):
+            values[cell] += 0.5
+        upserts, deleted, counts = self.diff(self.melted(days=100, values=values), existing)
+        self.assertEqual(counts, {"inserted": 0, "updated": 10, "unchanged": 190})
+        self.assertEqual(list(upserts["value"]), [values[cell] for cell in range(0, 200, 20)])
+        self.assertTrue(deleted.empty)
+
+    def test_changed_label_is_an_update(self):
+        existing = self.stored(self.melted(days=2))
+        upserts, _, counts = self.diff(self.melted(days=2, movement="Port"), existing)
+        self.assertEqual(counts, {"inserted": 0, "updated": 4, "unchanged": 0})
+        self.assertEqual(set(upserts["movement_id"]), {2})
+
+    def test_null_movement_is_compared_as_a_value(self):
+        existing = self.stored(self.melted(days=2, movement=None))
+        # Null on both sides is unchanged
+        _, _, counts = self.diff(self.melted(days=2, movement=None), existing)
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "unchanged": 4})
+        # A movement where there was none, and none where there was one, are updates
+        _, _, counts = self.diff(self.melted(days=2), existing)
+        self.assertEqual(counts, {"inserted": 0, "updated": 4, "unchanged": 0})
+        upserts, _, counts = self.diff(self.melted(days=2, movement=None), self.stored(self.melted(days=2)))
+        self.assertEqual(counts, {"inserted": 0, "updated": 4, "unchanged": 0})
+        self.assertEqual(list(upserts["movement_id"]), [None] * 4)
+
+    def test_blank_cell_deletes_the_stored_value(self):
+        existing = self.stored(self.melted(days=3))
+        melted = self.melted(days=3)
+        # The first parameter is present but empty on the second day, the other cells are as stored
+        blank, filled = melted.iloc[[1]], melted.drop(index=1)
+        upserts, deleted, counts = self.diff(filled, existing, blank)
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "unchanged": 5})
+        self.assertTrue(upserts.empty)
+        self.assertEqual(list(deleted["id"]), [2])
+
+    def test_cells_missing_from_the_workbook_are_kept(self):
+        # A workbook with fewer days or without the second parameter deletes nothing
+        existing = self.stored(self.melted(days=3))
+        upserts, deleted, counts = self.diff(self.melted(days=3).iloc[:2], existing)
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "unchanged": 2})
+        self.assertTrue(deleted.empty)
+
+    def test_blank_cell_without_a_stored_value_is_ignored(self):
+        melted = self.melted(days=3)
+        _, deleted, counts = self.diff(melted.drop(index=1), self.stored(melted.iloc[:0]), melted.iloc[[1]])
+        self.assertEqual(counts, {"inserted": 5, "updated": 0, "unchanged": 0})
+        self.assertTrue(deleted.empty)
+
+    def test_timestamps_of_both_sides_are_compared_as_datetimes(self):
+        frame = pd.DataFrame({"parameter_id": ["1"], "timestamp": ["2024-02-01 00:00:01"]})
+        normalized = ingestion._normalize_keys(frame, ingestion.SEATRIAL_TABLE)
+        self.assertEqual(normalized["timestamp"].iloc[0], pd.Timestamp("2024-02-01 00:00:01"))
+        self.assertEqual(normalized["parameter_id"].dtype, int)
+        # The frame of the caller is not modified
+        self.assertEqual(frame["parameter_id"].iloc[0], "1")
+
+
+class FakeCursor:
+    """pymysql cursor answering the lookups of ingest from dicts and recording every statement."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=()):
+        self.connection.statements.append((" ".join(sql.split()), list(params)))
+        params = set(params)
+        if "FROM enr_vessellist" in sql:
+            self.rows = [(vessel,) for vessel in self.connection.vessels if str(vessel) in params]
+        elif "FROM enr_parameterlist" in sql:
+            self.rows = [(code, id_) for code, id_ in self.connection.parameters.items() if code in params]
+        elif "FROM enr_displacementlist" in sql:
+            self.rows = [(name, id_) for name, id_ in self.connection.displacements.items() if name in params]
+        elif f"FROM {ingestion.SEATRIAL_TABLE.name}" in sql:
+            self.rows = self.connection.stored
+        else:
+            self.rows = []
+
+    def executemany(self, sql, rows):
+        if self.connection.fail_on and self.connection.fail_on in sql:
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+        self.connection.batches.append((" ".join(sql.split()), list(rows)))
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, stored=(), fail_on=None):
+        self.vessels = [101]
+        self.parameters = {"010001": 1, "010002": 2}
+        self.displacements = {"Laden": 1}
+        self.stored = list(stored)
+        self.fail_on = fail_on
+        self.statements, self.batches = [], []
+        self.commits = self.rollbacks = self.closes = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closes += 1
+
+    def sql_batches(self, prefix):
+        return [rows for sql, rows in self.batches if sql.startswith(prefix)]
+
+    def sql_statements(self, prefix):
+        return [params for sql, params in self.statements if sql.startswith(prefix)]
+
+
+@mock.patch.object(ingestion, "COLUMNAR_STORE", None)
+class IngestTests(unittest.TestCase):
+    """The statements ingest sends, on a fake connection."""
+
+    table = ingestion.SEATRIAL_TABLE
+
+    def melted(self, minutes=5, vessel="101"):
+        return pd.DataFrame({
+            "Vessel": vessel,
+            "Session": "S1",
+            "Timestamp": pd.date_range("2024-02-01", periods=minutes, freq="min"),
+            "Displacement": "Laden",
+            "Parameter": "010001",
+            "Value": [float(minute) for minute in range(minutes)],
+        })
+
+    def stored(self, minutes):
+        """fetch_existing rows (id, unique columns, displacement_id, value) of the first minutes of melted."""
+        return [
+            (minute + 1, 101, "S1", datetime.datetime(2024, 2, 1, 0, minute), 1, 1, float(minute))
+            for minute in range(minutes)
+        ]
+
+    def test_upsert_sql(self):
+        columns = ["vessel_id", "date", "movement_id", "displacement_id", "parameter_id", "value"]
+        self.assertEqual(" ".join(ingestion.upsert_sql(ingestion.ENR_TABLE, columns).split()), (
+            "INSERT INTO enr_enrparameter (vessel_id, date, movement_id, displacement_id, parameter_id, value) "
+            "VALUES (%s, %s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE movement_id = VALUES(movement_id), "
+            "displacement_id = VALUES(displacement_id), value = VALUES(value)"
+        ))
+
+    def test_rows_are_upserted_in_batches_in_one_transaction(self):
+        connection = FakeConnection()
+        result = ingestion.ingest(self.melted(), self.table, connection=connection, batch_size=2)
+
+        batches = connection.sql_batches(f"INSERT INTO {self.table.name}")
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0][0], ("101", "S1", pd.Timestamp("2024-02-01 00:00"), 1, 1, 0.0))
+        self.assertEqual((result.inserted, result.updated, result.rows_read), (5, 0, 5))
+        self.assertEqual((connection.commits, connection.rollbacks, connection.closes), (1, 0, 0))
+        self.assertEqual(connection.sql_statements("INSERT INTO enr_dataversion"), [["seatrial"]])
+        self.assertEqual(connection.sql_batches("INSERT INTO enr_partitionversion"),
+                         [[("seatrial", 101, datetime.date(2024, 2, 1))]])
+
+    def test_lookups_are_one_query_each(self):
+        connection = FakeConnection()
+        ingestion.ingest(self.melted(minutes=50), self.table, connection=connection)
+        selects = [sql.split(" WHERE")[0] for sql, _ in connection.statements if sql.startswith("SELECT")]
+        self.assertEqual(len(selects), 4)
+        self.assertEqual(len(set(selects)), 4)
+
+    def test_unknown_vessels_and_new_parameters(self):
+        connection = FakeConnection()
+        melted = pd.concat([self.melted(), self.melted(vessel="999")], ignore_index=True)
+        melted.loc[:4, "Parameter"] = "010003"
+        result = ingestion.ingest(melted, self.table, connection=connection)
+        self.assertEqual((result.unknown_vessels, result.skipped_rows), (("999",), 5))
+        self.assertEqual(connection.sql_batches("INSERT INTO enr_parameterlist"),
+                         [[("010003", "Description for 010003", 0)]])
+
+    def test_emptied_cells_are_deleted_in_batches(self):
+        connection = FakeConnection(stored=self.stored(5))
+        melted = self.melted()
+        result = ingestion.ingest(melted.iloc[3:], self.table, blank_df=melted.iloc[:3], connection=connection,
+                                  batch_size=2)
+        deletes = connection.sql_statements(f"DELETE FROM {self.table.name}")
+        self.assertEqual(deletes, [[1, 2], [3]])
+        self.assertEqual(connection.sql_batches(f"INSERT INTO {self.table.name}"), [])
+        self.assertEqual((result.deleted, result.unchanged), (3, 2))
+
+    def test_unchanged_file_writes_nothing(self):
+        connection = FakeConnection(stored=self.stored(5))
+        result = ingestion.ingest(self.melted(), self.table, connection=connection)
+        self.assertEqual(result.summary(), "0 inserted, 0 updated, 0 deleted, 5 unchanged")
+        self.assertEqual(connection.batches, [])
+        self.assertEqual(connection.sql_statements("INSERT INTO enr_dataversion"), [])
+
+    def test_failed_batch_is_rolled_back(self):
+        connection = FakeConnection(fail_on=f"INSERT INTO {self.table.name}")
+        with self.assertRaises(pymysql.err.OperationalError):
+            ingestion.ingest(self.melted(), self.table, connection=connection, batch_size=2)
+        self.assertEqual((connection.commits, connection.rollbacks), (0, 1))
+        # Nothing after the failed statement was sent
+        self.assertEqual(connection.sql_statements("INSERT INTO enr_dataversion"), [])
+
+    def test_own_connection_is_closed(self):
+        connection = FakeConnection(fail_on=f"INSERT INTO {self.table.name}")
+        with mock.patch.object(ingestion, "connect", return_value=connection):
+            with self.assertRaises(pymysql.err.OperationalError):
+                ingestion.ingest(self.melted(), self.table)
+        self.assertEqual((connection.rollbacks, connection.closes), (1, 1))
+
+    def test_failed_import_records_a_failed_run(self):
+        connection, run_connection = FakeConnection(fail_on=f"INSERT INTO {self.table.name}"), FakeConnection()
+        melted = self.melted()
+        parse = mock.Mock(return_value=(melted, melted.iloc[:0], ParseStats.start()))
+
+        def write(file_name, parsed):
+            return ingestion.ingest(parsed[0], self.table, blank_df=parsed[1], connection=connection)
+
+        with mock.patch.object(runlog, "connect", return_value=run_connection), \
+                self.assertLogs(runlog.logger, "ERROR"), self.assertRaises(pymysql.err.OperationalError):
+            process_file("/share/trial.xlsx", parse, write, self.table.name)
+
+        self.assertEqual(connection.rollbacks, 1)
+        [row] = run_connection.sql_statements("INSERT INTO enr_ingestionrun")
+        run = dict(zip(runlog.RUN_COLUMNS, row))
+        self.assertEqual(
+            (run["file_name"], run["target_table"], run["status"], run["inserted"]),
+            ("trial.xlsx", self.table.name, "failed", 0),
+        )
+        self.assertEqual(run["error"], "OperationalError: (2006, 'MySQL server has gone away')")
+        self.assertEqual(run_connection.commits, 1)
+
+
+@unittest.skipUnless(connection.vendor == "mysql", "The Parser ingestion writes to MySQL")
+class IngestionTests(TransactionTestCase):
+    def setUp(self):
+        VesselList.objects.create(id=101, vesselname="V101", description="")
+        database = connection.settings_dict
+        patcher = mock.patch.dict(ingestion.DB_SETTINGS, {
+            "host": database["HOST"] or "127.0.0.1", "port": int(database["PORT"] or 3306),
+            "user": database["USER"], "password": database["PASSWORD"], "database": database["NAME"],
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failed_store_sync_keeps_the_import(self):
+        melted = pd.DataFrame({
+            "Vessel": ["101", "101"], "Date": pd.to_datetime(["2024-01-01", "2024-02-01"]),
+            "Movement": ["Sea", "Sea"], "Displacement": ["Laden", "Laden"],
+            "Parameter": ["010001", "010001"], "Value": [1.0, 2.0],
+        })
+        parse = mock.Mock(return_value=(melted, melted.iloc[:0], ParseStats.start()))
+        with tempfile.TemporaryDirectory() as store, \
+                mock.patch.object(ingestion, "COLUMNAR_STORE", store), \
+                mock.patch.object(ingestion, "sync_columnar_store", side_effect=OSError("No space left on device")), \
+                self.assertLogs(ingestion.logger, "ERROR") as logs:
+            result = process_file("enr.xlsx", parse, enrv3_parser.write_file, ingestion.ENR_TABLE.name)
+
+        self.assertEqual(result.inserted, 2)
+        self.assertIn("build_columnar_store --dataset enr --vessel 101", logs.output[0])
+        self.assertEqual(
+            sorted(EnrParameter.objects.values_list("vessel", "date", "value")),
+            [(101, datetime.date(2024, 1, 1), 1.0), (101, datetime.date(2024, 2, 1), 2.0)],
+        )
+        self.assertEqual(list(IngestionRun.objects.values_list("status", "inserted", "error")), [("ok", 2, "")])
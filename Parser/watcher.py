@@ -0,0 +1,319 @@
+"""
+Folder watcher service for the ENR and sea-trial parsers.
+
+* New or changed workbooks are detected with inotify (through ``watchdog``,
+  which uses the native API on each OS) and by polling when watchdog is not
+  installed.
+* Every file is recorded in a durable SQLite ledger keyed by path + mtime +
+  SHA-256, so a restart neither skips nor reprocesses files. The ledger also
+  keeps the per-file change summary (cells inserted, updated, deleted and
+  unchanged) reported by the writer.
+* A failed file is retried after RETRY_SECONDS, doubling up to MAX_ATTEMPTS
+  tries, and again on the next start, until it imports or its content changes.
+* Workbooks are parsed in a process pool, several at a time, while each target
+  table has exactly one writer thread, so upserts into a table never race.
+* Every file, imported or failed, is also recorded as an IngestionRun row with
+  its row counts and phase timings (runlog.py).
+
+    python Parser/watcher.py            # watch the ENR and sea-trial folders
+"""
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+# Make the shared enr modules importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from runlog import configure_logging, record_run  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Seconds between directory scans when watchdog is not available
+POLL_INTERVAL = 10
+# A file is only picked up once its size and mtime stayed the same this long
+SETTLE_SECONDS = 2
+# Seconds before a failed file is tried again, doubled after every failure
+RETRY_SECONDS = 30
+# Tries of an unchanged file per run of the watcher
+MAX_ATTEMPTS = 6
+# Workbooks parsed in parallel
+MAX_WORKERS = max(1, min(4, (os.cpu_count() or 1)))
+# Ledger of processed files, next to this script unless overridden
+LEDGER_PATH = os.environ.get(
+    "PARSER_LEDGER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "processed_files.sqlite3")
+)
+
+
+@dataclass(frozen=True)
+class WatchedFolder:
+    """A folder of workbooks, how to parse them and how to write them."""
+    path: str
+    parse: object   # parse(file_path) -> (melted, invalid, runlog.ParseStats), must be picklable (module level)
+    write: object   # write(file_name, parsed) -> IngestionResult, called on the table's writer thread
+    table: str      # target table, one writer thread per table
+    suffix: str = ".xlsx"
+
+
+class FileLedger:
+    """Durable record of processed files keyed by (path, mtime, sha256)."""
+
+    CHANGE_COLUMNS = ("inserted", "updated", "deleted", "unchanged")
+
+    def __init__(self, path=LEDGER_PATH):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS processed_files (
+                path TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL,
+                status TEXT NOT NULL,
+                detail TEXT,
+                processed_at TEXT NOT NULL,
+                PRIMARY KEY (path, mtime, sha256)
+            )
+        """)
+        # Ledgers created before change summaries were recorded
+        existing = {row[1] for row in self._connection.execute("PRAGMA table_info(processed_files)")}
+        for column in self.CHANGE_COLUMNS:
+            if column not in existing:
+                self._connection.execute(f"ALTER TABLE processed_files ADD COLUMN {column} INTEGER")
+        self._connection.commit()
+
+    def is_processed(self, path, mtime, sha256):
+        """True when this exact file content was already imported; failed files are tried again."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM processed_files WHERE path = ? AND mtime = ? AND sha256 = ? AND status = 'ok'",
+                (path, mtime, sha256),
+            ).fetchone()
+        return row is not None
+
+    def record(self, path, mtime, sha256, status, detail=None, result=None):
+        """Record the outcome of a file, with its change summary when result is given."""
+        changes = [getattr(result, column, None) for column in self.CHANGE_COLUMNS]
+        with self._lock:
+            self._connection.execute(
+                f"""
+                INSERT OR REPLACE INTO processed_files
+                    (path, mtime, sha256, status, detail, processed_at, {", ".join(self.CHANGE_COLUMNS)})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (path, mtime, sha256, status, detail, datetime.now().isoformat(timespec="seconds"), *changes),
+            )
+            self._connection.commit()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_candidate(folder, file_name):
+    # "~$name.xlsx" are Excel lock files of workbooks that are still open
+    return file_name.endswith(folder.suffix) and not file_name.startswith("~$")
+
+
+class Watcher:
+    """Dispatches settled files to the parser pool and parsed frames to the table writers."""
+
+    def __init__(self, folders, ledger=None, max_workers=MAX_WORKERS):
+        self.folders = folders
+        self.ledger = ledger or FileLedger()
+        self.pool = ProcessPoolExecutor(max_workers=max_workers)
+        self._pending = {}       # path -> (folder, (size, mtime), first seen) while waiting to settle
+        self._in_flight = set()  # paths queued, parsing or writing
+        self._checked = {}       # path -> (size, mtime) last hashed, avoids rehashing unchanged files
+        self._retries = {}       # path -> ((size, mtime), failures, monotonic time of the next try)
+        self._lock = threading.Lock()
+        self._writers = {}
+        for folder in folders:
+            if folder.table not in self._writers:
+                writer_queue = queue.Queue()
+                thread = threading.Thread(target=self._write_loop, args=(writer_queue,), daemon=True,
+                                          name=f"writer-{folder.table}")
+                thread.start()
+                self._writers[folder.table] = writer_queue
+
+    def notice(self, folder, path):
+        """A file was created or modified, check it once it has settled."""
+        if not _is_candidate(folder, os.path.basename(path)):
+            return
+        with self._lock:
+            if path not in self._in_flight:
+                self._pending[path] = (folder, None, None)
+
+    def scan(self):
+        """Notice every file of the watched folders (startup and polling)."""
+        for folder in self.folders:
+            for entry in os.scandir(folder.path):
+                if entry.is_file():
+                    self.notice(folder, entry.path)
+
+    def dispatch_settled(self):
+        """Submit pending files whose size and mtime did not change for SETTLE_SECONDS."""
+        now = time.monotonic()
+        with self._lock:
+            pending = list(self._pending.items())
+        for path, (folder, signature, since) in pending:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                with self._lock:
+                    self._pending.pop(path, None)
+                continue
+            current = (stat.st_size, stat.st_mtime)
+            if current != signature:
+                with self._lock:
+                    self._pending[path] = (folder, current, now)
+                continue
+            if now - since < SETTLE_SECONDS:
+                continue
+            with self._lock:
+                # The writer threads record the failures
+                retry = self._retries.get(path)
+                if retry is not None and retry[0] == current and now < retry[2]:
+                    # Failed before, left pending until its next try
+                    continue
+                self._pending.pop(path, None)
+                if self._checked.get(path) == current:
+                    continue
+                self._checked[path] = current
+            sha256 = file_digest(path)
+            if self.ledger.is_processed(path, stat.st_mtime, sha256):
+                continue
+            with self._lock:
+                self._in_flight.add(path)
+            future = self.pool.submit(folder.parse, path)
+            future.add_done_callback(
+                lambda done, folder=folder, key=(path, stat.st_mtime, sha256): self._parsed(folder, key, done)
+            )
+
+    def _parsed(self, folder, key, future):
+        path = key[0]
+        error = future.exception()
+        if error is not None:
+            logger.error("Failed to parse %s", os.path.basename(path), exc_info=error)
+            self.ledger.record(*key, status="failed", detail=str(error))
+            record_run(path, folder.table, error=error, path=path, sha256=key[2])
+            self._failed(path)
+            self._done(folder, path)
+            return
+        self._writers[folder.table].put((folder, key, future.result()))
+
+    def _write_loop(self, writer_queue):
+        while True:
+            folder, key, parsed = writer_queue.get()
+            path, stats = key[0], parsed[-1]
+            try:
+                result = folder.write(os.path.basename(path), parsed)
+            except Exception as e:
+                # The writer thread has to keep serving the table, the failure is logged and recorded
+                logger.exception("Failed to import %s", os.path.basename(path))
+                self.ledger.record(*key, status="failed", detail=str(e))
+                record_run(path, folder.table, stats, error=e, path=path, sha256=key[2])
+                self._failed(path)
+            else:
+                self.ledger.record(*key, status="ok", result=result)
+                record_run(path, folder.table, stats, result, path=path, sha256=key[2])
+                with self._lock:
+                    self._retries.pop(path, None)
+            finally:
+                self._done(folder, path)
+
+    def _failed(self, path):
+        """Schedule the next try of a failed file, unless it failed MAX_ATTEMPTS times unchanged."""
+        with self._lock:
+            signature = self._checked.get(path)
+            previous = self._retries.get(path)
+            failures = previous[1] + 1 if previous is not None and previous[0] == signature else 1
+            if failures >= MAX_ATTEMPTS:
+                logger.error("Giving up on %s after %d failures, until it changes or the watcher restarts",
+                             os.path.basename(path), failures)
+                self._retries.pop(path, None)
+                return
+            delay = RETRY_SECONDS * 2 ** (failures - 1)
+            self._retries[path] = (signature, failures, time.monotonic() + delay)
+            # Hashed and checked against the ledger again on the next try
+            self._checked.pop(path, None)
+        logger.info("Retrying %s in %ds", os.path.basename(path), delay)
+
+    def _done(self, folder, path):
+        with self._lock:
+            self._in_flight.discard(path)
+        # Catch changes made while the file was being processed, the ledger skips unchanged files
+        self.notice(folder, path)
+
+    def run(self):
+        self.scan()
+        observer = _start_observer(self)
+        if observer is None:
+            logger.info("Polling %s every %ss (watchdog not installed)",
+                        ", ".join(f.path for f in self.folders), POLL_INTERVAL)
+        try:
+            last_scan = time.monotonic()
+            while True:
+                if observer is None and time.monotonic() - last_scan >= POLL_INTERVAL:
+                    self.scan()
+                    last_scan = time.monotonic()
+                self.dispatch_settled()
+                time.sleep(0.5)
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            self.pool.shutdown(wait=True)
+
+
+def _start_observer(watcher):
+    """Start a watchdog observer (inotify on Linux) or return None to fall back to polling."""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def __init__(self, folder):
+            self.folder = folder
+
+        def on_created(self, event):
+            if not event.is_directory:
+                watcher.notice(self.folder, event.src_path)
+
+        def on_modified(self, event):
+            self.on_created(event)
+
+        def on_moved(self, event):
+            if not event.is_directory:
+                watcher.notice(self.folder, event.dest_path)
+
+    observer = Observer()
+    for folder in watcher.folders:
+        observer.schedule(Handler(folder), folder.path, recursive=False)
+    observer.start()
+    logger.info("Watching %s", ", ".join(f.path for f in watcher.folders))
+    return observer
+
+
+def watch(folders, **kwargs):
+    Watcher(folders, **kwargs).run()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import enrv3_parser
+    import seatrial_parser
+
+    configure_logging()
+    watch([enrv3_parser.WATCHED_FOLDER, seatrial_parser.WATCHED_FOLDER])
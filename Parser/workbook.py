@@ -0,0 +1,219 @@
+"""
+Reading and melting of the workbook sheets the parsers import.
+
+pd.read_excel(path, sheet_name=...) with its default openpyxl engine wraps
+every cell of the sheet in a cell object, converts the cells one by one into a
+list of rows and only then infers the column types. iter_sheet reads the
+values of the one sheet instead, with python-calamine (a Rust reader) when it
+is installed, else with openpyxl in read-only, values-only mode, and yields
+them as frames of at most chunk_rows rows.
+
+Columns without a header are skipped, "n/a"-like text read as empty as
+read_excel does, empty rows dropped, the dtype columns
+converted explicitly (Vessel ids as text, 101 rather than 101.0), and the
+fill_down columns, e.g. a date written once for a block of rows, take the
+value above them, across chunks too.
+
+parse_file melts the frames of a SheetLayout as they are read and returns the
+melted cells of the whole workbook, which write_file imports into MySQL in
+one transaction. Chunks bound how many rows are converted from Python objects
+at a time, not the memory of a parse.
+"""
+import logging
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from enr.pivot import unpivot_frame
+from ingestion import ingest
+from runlog import ParseStats
+
+try:
+    import python_calamine
+except ImportError:  # optional dependency
+    python_calamine = None
+
+CHUNK_ROWS = int(os.environ.get("PARSER_CHUNK_ROWS", 50000))
+ENGINES = ("calamine", "openpyxl")
+DEFAULT_ENGINE = os.environ.get("PARSER_EXCEL_ENGINE") or ("calamine" if python_calamine else "openpyxl")
+# Text read_excel reads as a missing value, as it does by default
+NA_TEXT = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+# Format of dates written as text; the cells Excel stores as dates are read as dates whatever it is
+DATE_FORMAT = os.environ.get("PARSER_DATE_FORMAT", "ISO8601")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SheetLayout:
+    """Which sheet of one workbook type the parser reads and how its rows are keyed."""
+    sheet: str
+    keys: tuple        # columns of every melted cell, the others are parameter codes
+    date_column: str   # written once for a block of rows, filled down
+
+
+def parse_file(file_path, layout, chunk_rows=None, engine=None):
+    """
+    Read a workbook and melt it into one row per (key, parameter) value.
+    Returns the numeric cells, the empty / non-numeric ones and the ParseStats.
+    """
+    stats = ParseStats.start()
+    melted, invalid = [], []
+    sheet = iter_sheet(file_path, layout.sheet, dtype={'Vessel': str}, fill_down=[layout.date_column],
+                       chunk_rows=chunk_rows, engine=engine)
+    for df in stats.timed_iter("read", sheet):
+        stats.rows_read += len(df)
+        with stats.timed("melt"):
+            chunk_melted, chunk_invalid = melt_sheet(df, layout)
+        melted.append(chunk_melted)
+        invalid.append(chunk_invalid)
+
+    with stats.timed("melt"):
+        melted_df = pd.concat(melted, ignore_index=True) if len(melted) > 1 else melted[0]
+        invalid_values = pd.concat(invalid, ignore_index=True) if len(invalid) > 1 else invalid[0]
+    stats.rows_melted = len(melted_df)
+    stats.rows_non_numeric = len(invalid_values)
+
+    # Log rows where Value was originally a string
+    if not invalid_values.empty:
+        logger.warning("Skipped %d cells of %s due to non-numeric 'Value'", len(invalid_values),
+                       os.path.basename(file_path))
+        logger.debug("First skipped cells:\n%s", invalid_values[[*layout.keys, 'Parameter', 'Value']].head(5))
+
+    return melted_df, invalid_values, stats
+
+
+def melt_sheet(df, layout):
+    """Clean the rows of the sheet and melt them, see parse_file."""
+    # Drop completely empty rows
+    df = df.dropna(how='all')
+
+    # Convert the date column to datetime format (force errors to NaT), with the same
+    # format for every chunk rather than one inferred from the first text date of each
+    df[layout.date_column] = pd.to_datetime(df[layout.date_column], errors='coerce', format=DATE_FORMAT)
+
+    # Fill NaT values in the date column with the previous row's date
+    df[layout.date_column] = df[layout.date_column].ffill()
+
+    # Melt the DataFrame to transform it into the desired format,
+    # converting values to numeric and splitting off non-numeric ones
+    return unpivot_frame(df, list(layout.keys), var_name='Parameter', value_name='Value')
+
+
+def write_file(file_name, parsed, table):
+    """Write the changed cells of one parsed workbook into the MySQL table of the ingestion.TargetTable."""
+    melted_df, invalid_values, _ = parsed
+
+    # Resolve vessels/parameters in bulk and write only inserted, changed or emptied cells
+    result = ingest(melted_df, table, blank_df=invalid_values)
+
+    if result.unknown_vessels:
+        logger.warning("Skipped %d rows of %s because vessel_id %s does not exist in VesselList",
+                       result.skipped_rows, file_name, ", ".join(result.unknown_vessels))
+
+    logger.info("Imported %s into fleetsys.%s: %s (%.0f rows/sec)",
+                file_name, table.name, result.summary(), result.rows_per_sec)
+    return result
+
+
+def iter_sheet(path, sheet, dtype=None, fill_down=(), chunk_rows=None, engine=None):
+    """
+    Frames of the rows of sheet under its header row, at most chunk_rows rows
+    each (CHUNK_ROWS by default). At least one frame is yielded, an empty one
+    for an empty sheet. engine defaults to DEFAULT_ENGINE.
+    """
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    engine = engine or DEFAULT_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    rows = _read_calamine(path, sheet) if engine == "calamine" else _read_openpyxl(path, sheet)
+    names = _column_names(next(rows, ()))
+    used = [i for i, name in enumerate(names) if name is not None]
+    columns = [names[i] for i in used]
+    fill_down = [column for column in fill_down if column in columns]
+
+    above = {}
+    yielded = False
+    while True:
+        chunk = [row for _, row in zip(range(chunk_rows), rows)]
+        if not chunk and yielded:
+            return
+        frame = _frame(chunk, used, columns, dtype or {})
+        for column in fill_down:
+            frame[column] = frame[column].ffill()
+            if column in above:
+                frame[column] = frame[column].fillna(above[column])
+            filled = frame[column].dropna()
+            if len(filled):
+                above[column] = filled.iloc[-1]
+        yielded = True
+        yield frame
+        if len(chunk) < chunk_rows:
+            return
+
+
+def read_sheet(path, sheet, dtype=None, fill_down=(), engine=None):
+    """The whole sheet as one frame, see iter_sheet."""
+    frames = list(iter_sheet(path, sheet, dtype, fill_down, engine=engine))
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def _read_calamine(path, sheet):
+    if python_calamine is None:
+        raise ImportError("The calamine engine needs the python-calamine package")
+    workbook = python_calamine.CalamineWorkbook.from_path(os.fspath(path))
+    try:
+        yield from workbook.get_sheet_by_name(sheet).iter_rows()
+    finally:
+        workbook.close()
+
+
+def _read_openpyxl(path, sheet):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        yield from workbook[sheet].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _column_names(header):
+    """Header cells as column names, None for the empty ones; repeated names get .1, .2 like read_excel."""
+    names, seen = [], {}
+    for cell in header:
+        if cell is None or cell == "":
+            names.append(None)
+            continue
+        name = str(int(cell)) if isinstance(cell, float) and cell.is_integer() else str(cell)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _frame(rows, used, columns, dtype):
+    # Rows may be shorter than the header when their last cells are empty
+    frame = pd.DataFrame(rows).reindex(columns=used)
+    frame.columns = columns
+    # calamine reads empty cells as "", openpyxl as None; both become NaN like in read_excel
+    frame = frame.replace([*NA_TEXT, None], np.nan).dropna(how="all").reset_index(drop=True)
+    for column, kind in dtype.items():
+        if column in frame:
+            frame[column] = _as_text(frame[column]) if kind is str else frame[column].astype(kind)
+    return frame
+
+
+def _as_text(series):
+    """Cells as text, the whole numbers without a decimal part, the empty cells left NaN."""
+    def text(value):
+        return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+    return series.map(text, na_action="ignore").astype(object)
@@ -0,0 +1,216 @@
+"""
+Async versions of the read endpoints, served in place of the views in
+api.views when the API runs under ASGI (fleetsys/asgi.py sets API_ASYNC_VIEWS).
+
+The view classes subclass the sync ones, so filters, validation and the API
+schema are shared; only the handlers differ. Rows are read with the async
+ORM, pandas work runs in worker threads and exports are streamed from an async
+iterator, so a request waiting on the database, on a pivot or on a slow client
+does not hold a worker thread. Authentication, permissions and throttling are
+the sync DRF checks, run in a thread before the handler.
+
+The parameter, vessel and regression endpoints stay sync: they are small,
+cached or CPU bound, and Django runs sync views under ASGI in a thread.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from rest_framework.response import Response
+
+from enr.models import DataVersion, DisplacementList, EnrParameter, MovementList, ParameterList
+from enr.storage import ENR_DATASET, SEATRIAL_DATASET
+
+from .caching import cached_by_partitions, cached_by_version
+from .exports import EXPORT_FORMATS, aiter_stream, iter_export_blocks, iter_frame_blocks
+from .instrumentation import add_rows
+from .pivot import (
+    aauto_resolution,
+    aclean_pivot_rows,
+    compare_rows,
+    aget_pivot_parameter_ids,
+    apivot_all_rows,
+    pivot_frame_rows,
+    pivot_queryset,
+)
+from .serializers import lean_data, lean_queryset
+from .views import (
+    DownloadExcelView,
+    ENRCompareAPIView,
+    ENRMultipleParameterAPIView,
+    ENRSingleParameterAPIView,
+    FilterOptionsView,
+    SeaTrialParameterAPIView,
+    _downsample_params,
+    _downsample_select,
+    compare_payload,
+    downsample_trial_rows,
+)
+
+
+def in_thread(func):
+    """func run in a worker thread of its own, for pandas / file work without database access."""
+    return sync_to_async(func, thread_sensitive=False)
+
+
+class AsyncDispatchMixin:
+    """APIView.dispatch awaiting the async handlers of the view."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication reads the user from the database
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncLeanListMixin(AsyncDispatchMixin):
+    """LeanListMixin.list with the keyset page read by the async ORM."""
+
+    async def get(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        queryset = lean_queryset(self.filter_queryset(self.get_queryset()), serializer_class)
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        add_rows(len(page))
+        return self.get_paginated_response(lean_data(page, serializer_class))
+
+
+class AsyncENRSingleParameterAPIView(AsyncLeanListMixin, ENRSingleParameterAPIView):
+    pass
+
+
+class AsyncSeaTrialParameterAPIView(AsyncLeanListMixin, SeaTrialParameterAPIView):
+    @cached_by_partitions("seatrial", SEATRIAL_DATASET, DataVersion.PARAMETERS)
+    async def get(self, request, *args, **kwargs):
+        try:
+            max_points, method = _downsample_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if not max_points:
+            return await super().get(request, *args, **kwargs)
+
+        serializer_class = self.get_serializer_class()
+        rows = [row async for row in lean_queryset(self.filter_queryset(self.get_queryset()), serializer_class)]
+        return Response(await in_thread(downsample_trial_rows)(rows, serializer_class, max_points, method))
+
+
+class AsyncENRMultipleParameterAPIView(AsyncDispatchMixin, ENRMultipleParameterAPIView):
+    @cached_by_partitions("multiple", ENR_DATASET)
+    async def get(self, request, *args, **kwargs):
+        full_data_requested = request.GET.get("full_data") == "true"
+        try:
+            selected_parameters = self.get_selected_parameters()
+            resolution = self.requested_resolution()
+            if resolution == "auto":
+                resolution = await aauto_resolution(
+                    self.get_rollups(), request.GET.get("start_date"), request.GET.get("end_date"),
+                )
+            statistic = self.get_statistic()
+            select = _downsample_select(request)
+            columnar = self.get_columnar()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        queryset, pivot = self.get_pivot_source(resolution, statistic)
+
+        if full_data_requested and resolution == "raw":
+            # Not in_thread, read_columnar checks the PartitionVersion rows
+            frame = await sync_to_async(self.read_columnar)(ENR_DATASET, selected_parameters or None)
+            if frame is not None:
+                parameter_ids = selected_parameters or sorted(set(frame["parameter"]))
+                results = await in_thread(pivot_frame_rows)(frame, parameter_ids, select, columnar=columnar)
+                return Response({"resolution": resolution, "results": results})
+
+        parameter_ids = await aget_pivot_parameter_ids(queryset, selected_parameters)
+
+        if full_data_requested:
+            return Response({
+                "resolution": resolution,
+                "results": await apivot_all_rows(queryset, parameter_ids, select=select, columnar=columnar, **pivot),
+            })
+
+        pivoted = pivot_queryset(queryset, parameter_ids, **pivot)
+        page = await self.paginator.apaginate_queryset(pivoted, request, view=self)
+        response = self.get_paginated_response(self.page_results(await aclean_pivot_rows(page), pivot, columnar))
+        response.data["resolution"] = resolution
+        return response
+
+
+class AsyncENRCompareAPIView(AsyncDispatchMixin, ENRCompareAPIView):
+    @cached_by_partitions("compare", ENR_DATASET)
+    async def get(self, request, *args, **kwargs):
+        try:
+            vessels = self.get_vessels()
+            selected_parameters = self.get_selected_parameters()
+            resolution = self.requested_resolution()
+            if resolution == "auto":
+                resolution = await aauto_resolution(
+                    self.get_rollups(), request.GET.get("start_date"), request.GET.get("end_date"),
+                )
+            statistic = self.get_statistic()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        queryset, value = self.get_compare_source(resolution, statistic)
+        parameter_ids = await aget_pivot_parameter_ids(queryset, selected_parameters)
+        rows = [row async for row in compare_rows(queryset, parameter_ids, value)]
+        return Response(await in_thread(compare_payload)(resolution, rows, vessels or None, parameter_ids))
+
+
+class AsyncFilterOptionsView(AsyncDispatchMixin, FilterOptionsView):
+    @cached_by_version(DataVersion.ENR)
+    async def get(self, request):
+        return Response({
+            "movements": [name async for name in MovementList.objects.order_by("name").values_list("name", flat=True)],
+            "displacements": [
+                name async for name in DisplacementList.objects.order_by("name").values_list("name", flat=True)
+            ],
+        })
+
+
+class AsyncDownloadExcelView(AsyncDispatchMixin, DownloadExcelView):
+    async def get(self, request):
+        """
+        DownloadExcelView.get returning an async stream: the rows of each block
+        are read and encoded in the worker thread of the request, one block at
+        a time, while the event loop sends the previous one.
+        """
+        error = self.export_format_error()
+        if error is not None:
+            return error
+        content_type, extension, writer, _ = EXPORT_FORMATS[request.GET.get("format", "xlsx")]
+        try:
+            selected_parameters = self.get_selected_parameters()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        queryset = self.get_filtered_queryset(EnrParameter.objects.all())
+        frame = await sync_to_async(self.read_columnar)(ENR_DATASET, selected_parameters or None)
+        if frame is not None:
+            parameter_ids = selected_parameters or sorted(set(frame["parameter"]))
+            blocks = iter_frame_blocks(frame, parameter_ids)
+        else:
+            parameter_ids = await aget_pivot_parameter_ids(queryset, selected_parameters)
+            blocks = iter_export_blocks(queryset, parameter_ids)
+
+        parameter_mapping = {
+            pk: description async for pk, description in ParameterList.objects.values_list("id", "description")
+        }
+        content = aiter_stream(writer(self.get_columns(parameter_ids, parameter_mapping), blocks))
+        return self.export_response(content, content_type, extension)
@@ -0,0 +1,321 @@
+"""
+Version-keyed response caching and HTTP revalidation for the lookup endpoints,
+and the result cache of the performance queries (cached_by_partitions).
+
+Responses are cached under the request URL plus the current DataVersion of the
+data they are built from, so a save in the admin or an ingestion run (which both
+bump the version) makes the next request rebuild the response; entries of older
+versions are never read again and expire after CACHE_TIMEOUT. The same versions
+give the ETag and Last-Modified headers, so browsers revalidate with a 304.
+Works on the ``get`` of the sync views and of the async ones (api.async_views).
+"""
+import datetime
+import functools
+import hashlib
+import inspect
+import json
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db.models import Count, Sum
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+from enr.models import DataVersion, PartitionVersion
+from enr.storage import month_start
+
+# Seconds a cached response is kept, stale versions simply expire
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Cache alias of the performance query results (settings.CACHES)
+PERFORMANCE_CACHE = "performance"
+# Results with more rows are computed on every request rather than filling the cache
+CACHE_MAX_ROWS = 50000
+# The months covered by a date range are widened by these margins: a week rollup
+# starting at the end of a month reads the next one, and sea-trial dates are
+# local dates of UTC timestamps
+COVERAGE_BEFORE = datetime.timedelta(days=1)
+COVERAGE_AFTER = datetime.timedelta(days=6)
+CACHE_OUTCOMES = ("hit", "miss", "bypass")
+# Endpoint names of the cached_by_partitions views, for cache_metrics
+CACHED_ENDPOINTS = set()
+
+
+def data_versions(request, names):
+    """[(name, version, updated_at)] of names, read from the database once per request."""
+    memo = request.__dict__.setdefault("_data_versions", {})
+    if names not in memo:
+        memo[names] = _versions(DataVersion.objects.filter(name__in=names), names)
+    return memo[names]
+
+
+async def adata_versions(request, names):
+    """data_versions with the async ORM, later data_versions calls of the request read the memo."""
+    memo = request.__dict__.setdefault("_data_versions", {})
+    if names not in memo:
+        memo[names] = _versions([row async for row in DataVersion.objects.filter(name__in=names)], names)
+    return memo[names]
+
+
+def _versions(rows, names):
+    stored = {row.name: row for row in rows}
+    return [
+        (name, stored[name].version, stored[name].updated_at) if name in stored else (name, 0, None)
+        for name in names
+    ]
+
+
+def versions_etag(request, names):
+    return "-".join(f"{name}.{version}" for name, version, _ in data_versions(request, names))
+
+
+def versions_last_modified(request, names):
+    updated = [updated_at for _, _, updated_at in data_versions(request, names) if updated_at]
+    return max(updated) if updated else None
+
+
+def _cache_key(request, names):
+    path = hashlib.md5(request.get_full_path().encode("utf-8")).hexdigest()
+    return f"api:{path}:{versions_etag(request, names)}"
+
+
+def cached_by_version(*names):
+    """
+    Decorator for the ``get`` method of a read-only APIView whose response only
+    depends on the URL and on the data sets in names. Answers If-None-Match /
+    If-Modified-Since with 304, serves the body from the cache when the versions
+    are unchanged and asks browsers to always revalidate.
+    """
+    names = tuple(names)
+
+    def decorator(get):
+        if inspect.iscoroutinefunction(get):
+            return _async_cached(get, names)
+
+        @functools.wraps(get)
+        def cached_get(self, request, *args, **kwargs):
+            key = _cache_key(request, names)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+            response = get(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, CACHE_TIMEOUT)
+            return response
+
+        conditional_get = method_decorator(_conditional(names))(cached_get)
+
+        @functools.wraps(get)
+        def wrapper(self, request, *args, **kwargs):
+            response = conditional_get(self, request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _conditional(names):
+    return condition(
+        etag_func=lambda request, *args, **kwargs: versions_etag(request, names),
+        last_modified_func=lambda request, *args, **kwargs: versions_last_modified(request, names),
+    )
+
+
+def _async_cached(get, names):
+    @functools.wraps(get)
+    async def cached_get(self, request, *args, **kwargs):
+        key = _cache_key(request, names)
+        data = await cache.aget(key)
+        if data is not None:
+            return Response(data)
+        response = await get(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            await cache.aset(key, response.data, CACHE_TIMEOUT)
+        return response
+
+    conditional_get = method_decorator(_conditional(names))(cached_get)
+
+    @functools.wraps(get)
+    async def wrapper(self, request, *args, **kwargs):
+        # The ETag / Last-Modified functions are sync, they read the versions loaded here
+        await adata_versions(request, names)
+        response = await conditional_get(self, request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return wrapper
+
+
+def performance_cache():
+    return caches[PERFORMANCE_CACHE if PERFORMANCE_CACHE in settings.CACHES else "default"]
+
+
+def normalized_query(request):
+    """
+    The query parameters in a canonical form: names sorted, empty values
+    dropped, the parameters list deduplicated and sorted, so requests for the
+    same data share an entry whatever the order of their parameters.
+    """
+    query = []
+    for name in sorted(request.GET):
+        values = [value for value in request.GET.getlist(name) if value != ""]
+        if name == "parameters":
+            values = sorted({str(int(value)) if value.isdigit() else value for value in values})
+        if values:
+            query.append([name, values])
+    return query
+
+
+def covered_partitions(request, dataset):
+    """
+    PartitionVersion rows of the vessel months the filters of request can read
+    from dataset (enr.storage). Raises ValueError when the filters are invalid.
+    """
+    partitions = PartitionVersion.objects.filter(dataset=dataset.name)
+    vessel = request.GET.get("vessel")
+    if vessel:
+        partitions = partitions.filter(vessel=int(vessel))
+    vessels = request.GET.getlist("vessels")
+    if vessels:
+        partitions = partitions.filter(vessel__in=[int(vessel) for vessel in vessels])
+    start_date, end_date = request.GET.get("start_date"), request.GET.get("end_date")
+    if start_date and end_date:
+        start = datetime.date.fromisoformat(start_date) - COVERAGE_BEFORE
+        end = datetime.date.fromisoformat(end_date) + COVERAGE_AFTER
+        partitions = partitions.filter(month__range=(month_start(start), month_start(end)))
+    return partitions
+
+
+def _partition_cache_key(request, endpoint, totals, etag):
+    # Versions only grow, so (count, sum) of the covered ones changes with every write
+    query = json.dumps([request.scheme, request.get_host(), request.path, normalized_query(request)])
+    digest = hashlib.md5(query.encode("utf-8")).hexdigest()
+    return f"api:{endpoint}:{digest}:{totals['partitions']}.{totals['versions'] or 0}:{etag}"
+
+
+def _partition_totals():
+    return {"partitions": Count("id"), "versions": Sum("version")}
+
+
+def _row_count(data):
+    """
+    Rows of the response data: its results, as a list of rows or as
+    layout=columnar lists of column values, or the dates times the vessels of
+    a compare response.
+    """
+    if isinstance(data, dict) and "results" not in data and "dates" in data:
+        return len(data["dates"]) * len(data["vessels"])
+    results = data.get("results", ()) if isinstance(data, dict) else data
+    if isinstance(results, dict):
+        return len(results["values"][0]) if results["values"] else 0
+    return len(results)
+
+
+def _cacheable(response):
+    return response.status_code == 200 and _row_count(response.data) <= CACHE_MAX_ROWS
+
+
+def _metric_key(endpoint, outcome):
+    return f"api:metrics:{endpoint}:{outcome}"
+
+
+def _mark(response, outcome):
+    response["X-Cache"] = outcome.upper()
+    return response
+
+
+def count_outcome(cache_, endpoint, outcome):
+    key = _metric_key(endpoint, outcome)
+    if not cache_.add(key, 1, timeout=None):
+        cache_.incr(key)
+
+
+async def acount_outcome(cache_, endpoint, outcome):
+    key = _metric_key(endpoint, outcome)
+    if not await cache_.aadd(key, 1, timeout=None):
+        await cache_.aincr(key)
+
+
+def cache_metrics():
+    """{endpoint: hit / miss / bypass counts and hit ratio} of the performance cache."""
+    cache_ = performance_cache()
+    metrics = {}
+    for endpoint in sorted(CACHED_ENDPOINTS):
+        counts = cache_.get_many([_metric_key(endpoint, outcome) for outcome in CACHE_OUTCOMES])
+        counts = {outcome: counts.get(_metric_key(endpoint, outcome), 0) for outcome in CACHE_OUTCOMES}
+        lookups = counts["hit"] + counts["miss"]
+        metrics[endpoint] = {**counts, "hit_ratio": counts["hit"] / lookups if lookups else None}
+    return metrics
+
+
+def cached_by_partitions(endpoint, dataset, *names):
+    """
+    Decorator for the list (sync views) or get (async views) of a performance
+    query. The response data is cached in the performance cache under the
+    normalized query and the PartitionVersion of every vessel month of dataset
+    the filters cover, plus the DataVersion of names. A write therefore only
+    invalidates the entries whose vessel and date range include it.
+
+    Responses carry X-Cache: HIT, MISS or BYPASS (filters that cannot be
+    keyed, which the view then rejects) and the outcomes are counted per
+    endpoint, see cache_metrics.
+    """
+    names = tuple(names)
+    CACHED_ENDPOINTS.add(endpoint)
+
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+            return _async_partition_cached(handler, endpoint, dataset, names)
+
+        @functools.wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            cache_ = performance_cache()
+            try:
+                totals = covered_partitions(request, dataset).aggregate(**_partition_totals())
+            except ValueError:
+                count_outcome(cache_, endpoint, "bypass")
+                return _mark(handler(self, request, *args, **kwargs), "bypass")
+            key = _partition_cache_key(request, endpoint, totals, versions_etag(request, names))
+
+            data = cache_.get(key)
+            if data is not None:
+                count_outcome(cache_, endpoint, "hit")
+                return _mark(Response(data), "hit")
+            response = handler(self, request, *args, **kwargs)
+            if _cacheable(response):
+                cache_.set(key, response.data, CACHE_TIMEOUT)
+            count_outcome(cache_, endpoint, "miss")
+            return _mark(response, "miss")
+
+        return wrapper
+
+    return decorator
+
+
+def _async_partition_cached(handler, endpoint, dataset, names):
+    @functools.wraps(handler)
+    async def wrapper(self, request, *args, **kwargs):
+        cache_ = performance_cache()
+        try:
+            totals = await covered_partitions(request, dataset).aaggregate(**_partition_totals())
+        except ValueError:
+            await acount_outcome(cache_, endpoint, "bypass")
+            return _mark(await handler(self, request, *args, **kwargs), "bypass")
+        await adata_versions(request, names)
+        key = _partition_cache_key(request, endpoint, totals, versions_etag(request, names))
+
+        data = await cache_.aget(key)
+        if data is not None:
+            await acount_outcome(cache_, endpoint, "hit")
+            return _mark(Response(data), "hit")
+        response = await handler(self, request, *args, **kwargs)
+        if _cacheable(response):
+            await cache_.aset(key, response.data, CACHE_TIMEOUT)
+        await acount_outcome(cache_, endpoint, "miss")
+        return _mark(response, "miss")
+
+    return wrapper
@@ -0,0 +1,315 @@
+"""
+Streaming bulk exports of pivoted vessel performance data.
+
+Rows are read from the database in blocks of dates and pivoted one block at a
+time, and every writer yields bytes as soon as a block is encoded, so peak
+memory depends on the block size rather than on the size of the export.
+"""
+import csv
+import datetime
+import functools
+import io
+import math
+import numbers
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+
+from enr.pivot import long_frame, wide_frame
+
+from .instrumentation import add_rows, timed
+from .pivot import PIVOT_KEYS, PIVOT_ORDERING, label_lookups
+
+# Number of distinct dates pivoted per block
+EXPORT_BLOCK_DATES = 100
+# Rows fetched per round trip from the database cursor
+EXPORT_CHUNK_SIZE = 5000
+
+
+def iter_export_blocks(queryset, parameter_ids, block_dates=EXPORT_BLOCK_DATES):
+    """
+    Yield wide DataFrames of the filtered queryset, newest dates first.
+    The distinct dates are read once, then each block of dates is streamed
+    through ``QuerySet.iterator()`` (a server-side cursor where the backend
+    supports it) and pivoted with the vectorized enr.pivot helpers.
+    """
+    queryset = queryset.filter(parameter__in=parameter_ids)
+    dates = list(queryset.order_by("-date").values_list("date", flat=True).distinct())
+
+    for start in range(0, len(dates), block_dates):
+        block = dates[start:start + block_dates]
+        rows = (
+            queryset.filter(date__range=(block[-1], block[0]))
+            .order_by(*PIVOT_ORDERING)
+            .values_list(*label_lookups(PIVOT_KEYS), "parameter", "value")
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        with timed("db"):
+            rows = list(rows)
+        add_rows(len(rows))
+        with timed("pivot"):
+            wide = wide_frame(long_frame(rows, PIVOT_KEYS), PIVOT_KEYS, parameters=parameter_ids)
+        yield wide
+
+
+def iter_frame_blocks(frame, parameter_ids, block_dates=EXPORT_BLOCK_DATES):
+    """iter_export_blocks over a long frame already in memory, e.g. read from the columnar store."""
+    frame = frame[frame["parameter"].isin(parameter_ids)]
+    dates = sorted(frame["date"].unique(), reverse=True)
+    for start in range(0, len(dates), block_dates):
+        with timed("pivot"):
+            block = frame[frame["date"].isin(dates[start:start + block_dates])].sort_values(
+                ["date", "vessel", "movement", "displacement"],
+                ascending=[False, True, True, True], na_position="first", kind="stable",
+            )
+            wide = wide_frame(block[[*PIVOT_KEYS, "parameter", "value"]], PIVOT_KEYS, parameters=parameter_ids)
+        add_rows(len(block))
+        yield wide
+
+
+async def aiter_stream(chunks):
+    """
+    Async iterator over the byte chunks of a writer, each chunk encoded (and its
+    rows read) in the worker thread of the request. Under ASGI Django has to
+    read a sync iterator whole before sending it, an async one is streamed.
+    """
+    chunks = iter(chunks)
+    done = object()
+    while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+        yield chunk
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Unseekable write-only buffer that hands out what was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# Characters that are not allowed in XML 1.0 documents
+_ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_EXCEL_EPOCH = datetime.date(1899, 12, 30)
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Style 0 is the default, style 1 formats a serial number as a date
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+    '<borders count="1"><border/></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Integral):
+        return f"<c><v>{int(value)}</v></c>"
+    if isinstance(value, numbers.Real):
+        if not math.isfinite(value):
+            return "<c/>"
+        return f"<c><v>{float(value)!r}</v></c>"
+    if isinstance(value, datetime.datetime):
+        delta = value.replace(tzinfo=None) - datetime.datetime(1899, 12, 30)
+        return f'<c s="1"><v>{delta.total_seconds() / 86400!r}</v></c>'
+    if isinstance(value, datetime.date):
+        return f'<c s="1"><v>{(value - _EXCEL_EPOCH).days}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t>{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return "<row>" + "".join(_xlsx_cell(value) for value in values) + "</row>"
+
+
+def stream_xlsx(columns, blocks, sheet_name="Sheet1"):
+    """
+    Yield an XLSX workbook with one sheet as a sequence of bytes chunks,
+    headed by the headers of columns ((name, header) pairs).
+    Cells are written as inline strings / numbers straight into the zip
+    stream, so nothing but the current block is held in memory.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        workbook.writestr("_rels/.rels", _ROOT_RELS)
+        workbook.writestr("xl/workbook.xml", _WORKBOOK.format(sheet_name=escape(sheet_name)))
+        workbook.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        workbook.writestr("xl/styles.xml", _STYLES)
+        yield buffer.drain()
+
+        with workbook.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as sheet:
+            sheet.write((_SHEET_START + _xlsx_row(header for _, header in columns)).encode("utf-8"))
+            for block in blocks:
+                for values in block.itertuples(index=False, name=None):
+                    sheet.write(_xlsx_row(values).encode("utf-8"))
+                yield buffer.drain()
+            sheet.write(_SHEET_END.encode("utf-8"))
+    yield buffer.drain()
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(columns, blocks):
+    """Yield a CSV document, one chunk per block."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow([header for _, header in columns])
+    for block in blocks:
+        yield "".join(
+            writer.writerow(["" if value != value or value is None else value for value in values])
+            for values in block.itertuples(index=False, name=None)
+        )
+
+
+def _arrow_schema(columns, pa):
+    """
+    Fields named like the block columns: parameter descriptions are not unique,
+    so they go into the field metadata rather than the names.
+    """
+    key_types = {"vessel": pa.int64(), "date": pa.date32(), "movement": pa.string(), "displacement": pa.string()}
+    return pa.schema([
+        pa.field(name, key_types[name]) if name in key_types
+        else pa.field(name, pa.float64(), metadata={"description": header})
+        for name, header in columns
+    ])
+
+
+def _arrow_table(schema, block, pa):
+    """Build an Arrow table from a wide block column by column, without going through rows."""
+    arrays = []
+    for field in schema:
+        values = block[field.name]
+        if pa.types.is_floating(field.type):
+            arrays.append(pa.array(values.to_numpy(), type=field.type, from_pandas=True))
+        else:
+            arrays.append(pa.array(values.tolist(), type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _stream_arrow_writer(columns, blocks, open_writer):
+    import pyarrow as pa
+
+    buffer = _StreamBuffer()
+    schema = _arrow_schema(columns, pa)
+    # Opened before the first block, so an export without rows is still a valid, empty file
+    writer = open_writer(buffer, schema)
+    yield buffer.drain()
+    for block in blocks:
+        writer.write_table(_arrow_table(schema, block, pa))
+        yield buffer.drain()
+    writer.close()
+    yield buffer.drain()
+
+
+def stream_parquet(columns, blocks):
+    """Yield a Parquet file with one row group per block."""
+    import pyarrow.parquet as pq
+
+    return _stream_arrow_writer(columns, blocks, lambda sink, schema: pq.ParquetWriter(sink, schema))
+
+
+def stream_arrow(columns, blocks):
+    """Yield an Arrow IPC stream with one record batch per block."""
+    import pyarrow as pa
+
+    return _stream_arrow_writer(columns, blocks, lambda sink, schema: pa.ipc.new_stream(sink, schema))
+
+
+# format= value -> (content type, file extension, writer, requires pyarrow)
+EXPORT_FORMATS = {
+    "xlsx": (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "xlsx",
+        functools.partial(stream_xlsx, sheet_name="Performance Data"),
+        False,
+    ),
+    "csv": ("text/csv", "csv", stream_csv, False),
+    "parquet": ("application/vnd.apache.parquet", "parquet", stream_parquet, True),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows", stream_arrow, True),
+}
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,310 @@
+"""
+Per-request instrumentation of the API, enabled by settings.API_INSTRUMENTATION.
+
+InstrumentationMiddleware records for every request the number and time of
+the SQL queries, the time of the phases the views mark with timed() (pivot,
+serialize, export, compress), the rows they read (add_rows) and the response
+size. Phases count their own time only: the SQL and the nested phases they
+run are subtracted, so db + pivot + serialize + ... add up to at most the
+total. The numbers are sent back in a Server-Timing header, shown next to the
+request by the browser developer tools, and summed per endpoint into the
+counters of render_metrics (Prometheus text format, served at metrics/).
+
+Streamed responses (exports) get the header before their body is written, the
+export phase and the bytes sent are only counted in the metrics. The metrics
+live in the memory of each process, like a prometheus_client registry without
+its multiprocess mode: scrape every worker, or run a single one.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_PREFIX = "fleetsys_api"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """What one request spent, filled in by the query timer, timed() and add_rows()."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.rows = 0
+        self.bytes = 0
+        self.phases = {}
+        # Seconds already attributed to a phase, subtracted from the enclosing ones
+        self.accounted = 0.0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.accounted += seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Server-Timing header value, durations in milliseconds."""
+        entries = [f'db;dur={self.phases.get("db", 0.0) * 1000:.1f};desc="{self.queries} queries"']
+        entries += [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in self.phases.items() if phase != "db"]
+        entries += [
+            f"total;dur={self.elapsed() * 1000:.1f}",
+            f'rows;desc="{self.rows}"',
+        ]
+        if self.bytes:
+            entries.append(f'bytes;desc="{self.bytes}"')
+        return ", ".join(entries)
+
+
+def current_metrics():
+    """RequestMetrics of the request being served, None outside of an instrumented request."""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """Count the time of the block, less the SQL and nested phases it runs, as phase of the request."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start, accounted = time.perf_counter(), metrics.accounted
+    try:
+        yield
+    finally:
+        metrics.add(phase, time.perf_counter() - start - (metrics.accounted - accounted))
+
+
+def add_rows(count):
+    """Count rows read by the request."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.rows += count
+
+
+def _time_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.add("db", time.perf_counter() - start)
+
+
+def _install_query_timer(connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def install_query_timer():
+    """Time the queries of every connection, the open ones and those opened later by any thread."""
+    connection_created.connect(_install_query_timer, dispatch_uid="api.instrumentation")
+    for connection in connections.all(initialized_only=True):
+        _install_query_timer(connection)
+
+
+class MetricsRegistry:
+    """Per endpoint sums of the RequestMetrics of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.requests = {}
+            self.endpoints = {}
+
+    def record(self, endpoint, method, status, metrics):
+        duration = metrics.elapsed()
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            totals = self.endpoints.setdefault(endpoint, {
+                "count": 0, "seconds": 0.0, "buckets": [0] * len(DURATION_BUCKETS),
+                "queries": 0, "rows": 0, "bytes": 0, "phases": {},
+            })
+            totals["count"] += 1
+            totals["seconds"] += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    totals["buckets"][i] += 1
+            totals["queries"] += metrics.queries
+            totals["rows"] += metrics.rows
+            totals["bytes"] += metrics.bytes
+            for phase, seconds in metrics.phases.items():
+                totals["phases"][phase] = totals["phases"].get(phase, 0.0) + seconds
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {
+                endpoint: {**totals, "buckets": list(totals["buckets"]), "phases": dict(totals["phases"])}
+                for endpoint, totals in self.endpoints.items()
+            }
+            return dict(self.requests), endpoints
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _labels(**labels):
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _family(lines, name, kind, help_text):
+    lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+    lines.append(f"# TYPE {METRICS_PREFIX}_{name} {kind}")
+
+
+def render_metrics(cache_counts=None):
+    """
+    The request metrics of the process in the Prometheus text format, plus
+    the performance cache outcomes of cache_counts ({endpoint: {outcome:
+    count}}, see api.caching.cache_metrics).
+    """
+    requests, endpoints = REGISTRY.snapshot()
+    lines = []
+    _family(lines, "requests_total", "counter", "Requests served, by endpoint, method and status.")
+    for (endpoint, method, status), count in sorted(requests.items()):
+        lines.append(f"{METRICS_PREFIX}_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}")
+
+    _family(lines, "request_duration_seconds", "histogram", "Time from the request to the last byte of the response.")
+    for endpoint, totals in sorted(endpoints.items()):
+        for bound, count in zip(DURATION_BUCKETS, totals["buckets"]):
+            lines.append(f"{METRICS_PREFIX}_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {count}")
+        lines.append(
+            f"{METRICS_PREFIX}_request_duration_seconds_bucket{_labels(endpoint=endpoint, le='+Inf')} {totals['count']}"
+        )
+        lines.append(f"{METRICS_PREFIX}_request_duration_seconds_sum{_labels(endpoint=endpoint)} {totals['seconds']}")
+        lines.append(f"{METRICS_PREFIX}_request_duration_seconds_count{_labels(endpoint=endpoint)} {totals['count']}")
+
+    _family(lines, "phase_seconds_total", "counter", "Time spent per phase: db (SQL), pivot, serialize, export, compress.")
+    for endpoint, totals in sorted(endpoints.items()):
+        for phase, seconds in sorted(totals["phases"].items()):
+            lines.append(f"{METRICS_PREFIX}_phase_seconds_total{_labels(endpoint=endpoint, phase=phase)} {seconds}")
+
+    for name, field, help_text in (
+        ("queries_total", "queries", "SQL queries run."),
+        ("rows_total", "rows", "Rows read from the database or the columnar store."),
+        ("response_bytes_total", "bytes", "Response body bytes sent, after compression."),
+    ):
+        _family(lines, name, "counter", help_text)
+        for endpoint, totals in sorted(endpoints.items()):
+            lines.append(f"{METRICS_PREFIX}_{name}{_labels(endpoint=endpoint)} {totals[field]}")
+
+    if cache_counts is not None:
+        _family(lines, "cache_requests_total", "counter", "Performance cache lookups, by endpoint and outcome.")
+        for endpoint, counts in sorted(cache_counts.items()):
+            for outcome in ("hit", "miss", "bypass"):
+                lines.append(
+                    f"{METRICS_PREFIX}_cache_requests_total{_labels(endpoint=endpoint, outcome=outcome)} {counts[outcome]}"
+                )
+    return "\n".join(lines) + "\n"
+
+
+class InstrumentationMiddleware:
+    """
+    Put first in MIDDLEWARE, so the total and the bytes include the other
+    middleware and the compression. Not loaded when API_INSTRUMENTATION is off.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.API_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install_query_timer()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        if not response.streaming:
+            metrics.bytes = len(response.content)
+        response["Server-Timing"] = metrics.server_timing()
+        if not response.streaming:
+            self.record(request, response, metrics)
+        elif response.is_async:
+            response.streaming_content = self.astream(response.streaming_content, request, response, metrics)
+        else:
+            response.streaming_content = self.stream(response.streaming_content, request, response, metrics)
+        return response
+
+    def stream(self, content, request, response, metrics):
+        """The chunks of content, produced with the request metrics active and timed as export."""
+        chunks, done = iter(content), object()
+        try:
+            while True:
+                token = _current.set(metrics)
+                try:
+                    with timed("export"):
+                        chunk = next(chunks, done)
+                finally:
+                    _current.reset(token)
+                if chunk is done:
+                    break
+                metrics.bytes += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, response, metrics)
+
+    async def astream(self, content, request, response, metrics):
+        chunks = aiter(content)
+        try:
+            while True:
+                token = _current.set(metrics)
+                try:
+                    with timed("export"):
+                        chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    _current.reset(token)
+                metrics.bytes += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, response, metrics)
+
+    @staticmethod
+    def record(request, response, metrics):
+        match = getattr(request, "resolver_match", None)
+        endpoint = match.view_name if match is not None else "unmatched"
+        REGISTRY.record(endpoint, request.method, response.status_code, metrics)
@@ -0,0 +1,261 @@
+"""
+Keyset (cursor) pagination for the performance and sea-trial lists.
+
+Pages are addressed by the ordering values of the row they continue from
+instead of an OFFSET, so every page is one indexed range read of page_size + 1
+rows, whether it is the first page or the five hundredth. The queryset must be
+ordered by fields that make a row unique, e.g. ("date", "id") or the pivot keys.
+
+The total count costs a COUNT(*) over the whole filtered range and is only
+returned when asked for with ``count=true``, otherwise it is null.
+
+NULL sorts before every other value, as it does in MySQL and SQLite.
+"""
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_cursor(position, reverse):
+    values = [value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+              for value in position]
+    payload = json.dumps({"p": values, "r": int(reverse)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor, fields):
+    """
+    (position, reverse) of cursor, its values converted by fields (one per
+    ordering name, None to keep the JSON value). NotFound for a cursor that
+    was not made by _encode_cursor for this ordering.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        position, reverse = payload["p"], bool(payload["r"])
+    except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+        raise NotFound("Invalid cursor")
+    if not isinstance(position, list) or len(position) != len(fields):
+        raise NotFound("Invalid cursor")
+    if not all(value is None or isinstance(value, (str, int, float)) for value in position):
+        raise NotFound("Invalid cursor")
+    try:
+        position = [
+            value if value is None or field is None else field.to_python(value)
+            for field, value in zip(fields, position)
+        ]
+    except (ValidationError, TypeError, ValueError):
+        raise NotFound("Invalid cursor")
+    return position, reverse
+
+
+def _field(queryset, name):
+    """Model field of name, or the output field of the annotation name (e.g. the rollup "date"); None if neither."""
+    try:
+        return queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        annotation = queryset.query.annotations.get(name)
+        return annotation.output_field if annotation is not None else None
+
+
+def _is_nullable(queryset, name):
+    try:
+        return queryset.model._meta.get_field(name).null
+    except FieldDoesNotExist:
+        # Annotations such as the rollup "date"
+        return False
+
+
+def keyset_filter(queryset, ordering, position):
+    """
+    Q of the rows that come after position in ordering (field names, "-" for
+    descending): (a > x) OR (a = x AND b > y) OR ..., with NULL the smallest
+    value. None when no row can come after it.
+    """
+    equal = Q()
+    after = []
+    for (name, descending), value in zip(ordering, position):
+        nullable = _is_nullable(queryset, name)
+        if value is None:
+            # Nothing sorts below NULL
+            greater = None if descending else Q(**{f"{name}__isnull": False})
+            same = Q(**{f"{name}__isnull": True})
+        else:
+            greater = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            if descending and nullable:
+                greater |= Q(**{f"{name}__isnull": True})
+            same = Q(**{name: value})
+        if greater is not None:
+            after.append(equal & greater)
+        equal &= same
+    if not after:
+        return None
+
+    condition = after[0]
+    for term in after[1:]:
+        condition |= term
+    # Bound on the leading column alone, so the database reads an index range
+    (name, descending), value = ordering[0], position[0]
+    if value is not None and not _is_nullable(queryset, name):
+        condition &= Q(**{f"{name}__{'lte' if descending else 'gte'}": value})
+    return condition
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over the ordering of the queryset. Responses keep the
+    shape of PageNumberPagination: count (null unless ``count=true``), next,
+    previous and results, next/previous being URLs with a ``cursor``.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 10000
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value:
+            try:
+                size = int(value)
+            except ValueError:
+                size = 0
+            if size > 0:
+                return min(size, self.max_page_size)
+        return self.page_size
+
+    def get_ordering(self, queryset):
+        ordering = []
+        for field in queryset.query.order_by:
+            if not isinstance(field, str):
+                raise TypeError("KeysetPagination needs a queryset ordered by field names")
+            ordering.append((field.lstrip("-"), field.startswith("-")))
+        if not ordering:
+            raise TypeError("KeysetPagination needs an ordered queryset")
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page, position = self._prepare(queryset, request)
+        if self.count is not None:
+            self.count = queryset.count()
+        return self._finish(list(page), position)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset with the async ORM, for the async views."""
+        page, position = self._prepare(queryset, request)
+        if self.count is not None:
+            self.count = await queryset.acount()
+        return self._finish([row async for row in page], position)
+
+    def _prepare(self, queryset, request):
+        """(page + 1 rows queryset, cursor position) of the request, self.count 0 when it is asked for."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        names = [name for name, _ in self.ordering]
+        self.count = 0 if request.query_params.get(self.count_query_param) == "true" else None
+
+        # values() rows must carry the ordering fields to build the next cursor
+        fields = getattr(queryset, "_fields", None)
+        if fields:
+            missing = [name for name in names if name not in fields]
+            if missing:
+                queryset = queryset.values(*fields, *missing)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position, self.reverse = _decode_cursor(cursor, [_field(queryset, name) for name in names])
+        else:
+            position, self.reverse = None, False
+        ordering = [(name, descending != self.reverse) for name, descending in self.ordering]
+        if self.reverse:
+            queryset = queryset.order_by(*[f"-{name}" if descending else name for name, descending in ordering])
+        if position is not None:
+            condition = keyset_filter(queryset, ordering, position)
+            queryset = queryset.filter(condition) if condition is not None else queryset.none()
+        return queryset[:self.page_size + 1], position
+
+    def _finish(self, rows, position):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        # Reading backwards there are rows after this page, reading forwards there were rows before it
+        self.has_next = has_more if not self.reverse else position is not None
+        self.has_previous = has_more if self.reverse else position is not None
+        self.first = self._position(rows[0]) if rows else None
+        self.last = self._position(rows[-1]) if rows else None
+        return rows
+
+    def _position(self, row):
+        if isinstance(row, dict):
+            return [row[name] for name, _ in self.ordering]
+        return [getattr(row, name) for name, _ in self.ordering]
+
+    def _link(self, position, reverse):
+        url = remove_query_param(self.request.build_absolute_uri(), self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, _encode_cursor(position, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self._link(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self._link(self.first, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("count", self.count),
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer", "nullable": True, "example": None},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "true to include the total number of results.",
+                "schema": {"type": "boolean"},
+            },
+        ]
@@ -0,0 +1,253 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.db.models import F, Max, Min, Q
+
+from enr.downsample import series_indices
+from enr.models import DisplacementList, EnrParameterRollup, MovementList
+from enr.pivot import ENR_KEYS, parameter_column, pivot_columns, pivot_records
+from enr.rollups import GRANULARITIES
+
+from .instrumentation import add_rows, timed
+
+# Columns that identify one row of the pivoted (wide) performance table
+PIVOT_KEYS = tuple(ENR_KEYS)
+PIVOT_ORDERING = ("-date", "vessel", "movement", "displacement")
+
+# Rollup rows are keyed by vessel and period, the period start is returned as "date"
+ROLLUP_PIVOT_KEYS = ("vessel", "date")
+ROLLUP_PIVOT_ORDERING = ("-date", "vessel")
+
+# Pivot keys stored as lookup ids, read as their labels
+LABEL_LOOKUPS = {"movement": "movement__name", "displacement": "displacement__name"}
+LABEL_MODELS = {"movement": MovementList, "displacement": DisplacementList}
+
+RESOLUTIONS = ("auto", "raw") + GRANULARITIES
+# Shapes of the pivoted results: one object per row, or one list per column
+LAYOUTS = ("rows", "columnar")
+# resolution=auto: (longest span in days, resolution), raw daily values for up to two years
+AUTO_RESOLUTIONS = ((731, "raw"), (366 * 8, "week"), (None, "month"))
+
+
+def get_pivot_parameter_ids(queryset, selected_parameters=None):
+    """
+    Parameter ids that become columns of the pivot.
+    Uses the explicit selection when given, otherwise the distinct parameters
+    present in the filtered queryset (one DISTINCT query).
+    """
+    if selected_parameters:
+        return sorted({int(parameter_id) for parameter_id in selected_parameters})
+    return sorted(_present_parameters(queryset))
+
+
+async def aget_pivot_parameter_ids(queryset, selected_parameters=None):
+    if selected_parameters:
+        return sorted({int(parameter_id) for parameter_id in selected_parameters})
+    return sorted([parameter_id async for parameter_id in _present_parameters(queryset)])
+
+
+def _present_parameters(queryset):
+    return queryset.order_by().exclude(parameter__isnull=True).values_list("parameter", flat=True).distinct()
+
+
+def pivot_queryset(queryset, parameter_ids, keys=PIVOT_KEYS, ordering=PIVOT_ORDERING, value="value"):
+    """
+    Pivot EnrParameter rows inside the database.
+    Rows are grouped by keys and every parameter becomes a conditional
+    aggregate column, so COUNT, ORDER BY and LIMIT/OFFSET all run on the
+    grouped keys and a page only reads the rows belonging to its keys.
+    """
+    if not parameter_ids:
+        return queryset.order_by(*ordering).none()
+
+    aggregates = {
+        parameter_column(parameter_id): Max(value, filter=Q(parameter=parameter_id))
+        for parameter_id in parameter_ids
+    }
+    return (
+        queryset.order_by()
+        .values(*keys)
+        .annotate(**aggregates)
+        .order_by(*ordering)
+    )
+
+
+def pivot_all_rows(queryset, parameter_ids, keys=PIVOT_KEYS, ordering=PIVOT_ORDERING, value="value", select=None,
+                   columnar=False):
+    """
+    Pivot the whole filtered queryset without paging.
+    Reads the long rows in one ordered scan and reshapes them with the
+    vectorized enr.pivot helpers instead of one GROUP BY per request.
+    columnar returns the enr.pivot.pivot_columns layout instead of rows.
+    """
+    with timed("db"):
+        rows = list(_long_rows(queryset, parameter_ids, keys, ordering, value))
+    add_rows(len(rows))
+    with timed("pivot"):
+        return _pivot_function(columnar)(rows, keys, parameters=parameter_ids, select=select)
+
+
+async def apivot_all_rows(queryset, parameter_ids, keys=PIVOT_KEYS, ordering=PIVOT_ORDERING, value="value", select=None,
+                          columnar=False):
+    """pivot_all_rows reading with the async ORM, the pivot itself runs in a worker thread."""
+    with timed("db"):
+        rows = [row async for row in _long_rows(queryset, parameter_ids, keys, ordering, value)]
+    add_rows(len(rows))
+    with timed("pivot"):
+        return await sync_to_async(_pivot_function(columnar), thread_sensitive=False)(
+            rows, keys, parameters=parameter_ids, select=select,
+        )
+
+
+def _pivot_function(columnar):
+    return pivot_columns if columnar else pivot_records
+
+
+def _long_rows(queryset, parameter_ids, keys, ordering, value):
+    return (
+        queryset.filter(parameter__in=parameter_ids)
+        .order_by(*ordering)
+        .values_list(*label_lookups(keys), "parameter", value)
+    )
+
+
+def compare_rows(queryset, parameter_ids, value="value"):
+    """
+    (vessel, date, parameter, value) rows of the selected parameters for
+    enr.pivot.series_cube, read in one scan. EnrParameter and the rollups both
+    hold one row per vessel, date and parameter, so nothing is grouped.
+    """
+    return queryset.filter(parameter__in=parameter_ids).order_by().values_list("vessel", "date", "parameter", value)
+
+
+def label_lookups(keys):
+    """values() lookups of keys, the labels instead of the ids of movement and displacement."""
+    return [LABEL_LOOKUPS.get(key, key) for key in keys]
+
+
+def decode_labels(rows):
+    """
+    Replace the movement / displacement ids of grouped rows by their labels,
+    with one query per lookup table for the ids present.
+    """
+    for field, model in LABEL_MODELS.items():
+        ids = {row[field] for row in rows if row.get(field) is not None}
+        if ids:
+            _replace_labels(rows, field, dict(model.objects.filter(pk__in=ids).values_list("id", "name")))
+    return rows
+
+
+async def adecode_labels(rows):
+    for field, model in LABEL_MODELS.items():
+        ids = {row[field] for row in rows if row.get(field) is not None}
+        if ids:
+            labels = {pk: name async for pk, name in model.objects.filter(pk__in=ids).values_list("id", "name")}
+            _replace_labels(rows, field, labels)
+    return rows
+
+
+def _replace_labels(rows, field, labels):
+    for row in rows:
+        if row.get(field) is not None:
+            row[field] = labels.get(row[field])
+
+
+def pivot_frame_rows(frame, parameter_ids, select=None, columnar=False):
+    """
+    pivot_all_rows over a long frame of PIVOT_KEYS, parameter and value columns,
+    e.g. read from the columnar store, in the same PIVOT_ORDERING.
+    """
+    add_rows(len(frame))
+    with timed("pivot"):
+        frame = frame[frame["parameter"].isin(parameter_ids)].sort_values(
+            ["date", "vessel", "movement", "displacement"],
+            ascending=[False, True, True, True], na_position="first", kind="stable",
+        )
+        rows = frame[[*PIVOT_KEYS, "parameter", "value"]].itertuples(index=False, name=None)
+        return _pivot_function(columnar)(rows, PIVOT_KEYS, parameters=parameter_ids, select=select)
+
+
+def downsample_selector(max_points, method="lttb"):
+    """
+    select= callback for pivot_all_rows keeping at most max_points points of
+    every (vessel, parameter) series along the date axis. A row kept for one
+    series keeps its values of the other parameters too.
+    """
+    def select(key_frame, matrix):
+        vessels = key_frame["vessel"].fillna(-1).to_numpy(dtype=np.int64)
+        dates = pd.to_datetime(key_frame["date"]).to_numpy(dtype="datetime64[D]").astype(np.int64)
+        order = np.lexsort((dates, vessels))
+        kept = series_indices(vessels[order], dates[order], matrix[order], max_points, method)
+        # Back to the requested row order
+        return np.sort(order[kept])
+    return select
+
+
+def rollup_queryset(granularity):
+    """EnrParameterRollup rows of one granularity, with period_start exposed as date."""
+    return EnrParameterRollup.objects.filter(granularity=granularity).annotate(date=F("period_start"))
+
+
+def auto_resolution(rollups, start_date=None, end_date=None):
+    """
+    Resolution for resolution=auto: raw values for short ranges, week or month
+    rollups as the range grows. Without a date range the span of the stored
+    monthly rollups (filtered like the request) is used.
+    """
+    if start_date and end_date:
+        return _resolution_of_span(datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date))
+    span = rollups.filter(granularity="month").aggregate(first=Min("period_start"), last=Max("period_start"))
+    return _resolution_of_span(span["first"], span["last"])
+
+
+async def aauto_resolution(rollups, start_date=None, end_date=None):
+    if start_date and end_date:
+        return _resolution_of_span(datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date))
+    span = await rollups.filter(granularity="month").aaggregate(first=Min("period_start"), last=Max("period_start"))
+    return _resolution_of_span(span["first"], span["last"])
+
+
+def _resolution_of_span(first, last):
+    if first is None:
+        return "raw"
+    days = (last - first).days
+    for longest, resolution in AUTO_RESOLUTIONS:
+        if longest is None or days <= longest:
+            return resolution
+
+
+def clean_pivot_rows(rows):
+    """
+    Drop empty parameter columns so each row only carries the values it has,
+    and show movement / displacement as labels. The rows are grouped on the
+    lookup ids, which are narrower than the labels.
+    """
+    add_rows(len(rows))
+    with timed("pivot"):
+        rows = _drop_empty(rows)
+    return decode_labels(rows)
+
+
+async def aclean_pivot_rows(rows):
+    add_rows(len(rows))
+    with timed("pivot"):
+        rows = _drop_empty(rows)
+    return await adecode_labels(rows)
+
+
+def _drop_empty(rows):
+    return [{key: value for key, value in row.items() if value is not None or key in PIVOT_KEYS} for row in rows]
+
+
+def columnar_rows(rows, keys):
+    """
+    Pivoted rows (dicts that may lack empty parameter columns) in the
+    enr.pivot.pivot_columns layout: the key columns, then every other column
+    in order of appearance.
+    """
+    columns = list(keys)
+    for row in rows:
+        columns.extend(column for column in row if column not in columns)
+    return {"columns": columns, "values": [[row.get(column) for row in rows] for column in columns]}
@@ -1,5 +1,7 @@
+from django.db import models
 from rest_framework import serializers
-from enr.models import EnrParameter, SeaTrialParameter, ParameterList, VesselList
+from enr.models import EnrParameter, IngestionRun, SeaTrialParameter, ParameterList, VesselList
+from .instrumentation import timed
 
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
@@ -19,13 +21,16 @@ class VesselListSerializer(serializers.ModelSerializer):
 class ParameterListSerializer(serializers.ModelSerializer):
     class Meta:
         model = ParameterList
-        fields = ['id', 'code', 'description']
+        fields = ['id', 'code', 'description', 'is_calculated', 'formula']
 
 # ENR SERIALIZER
 
 class EnrParameterSerializer(serializers.ModelSerializer):
     # Ensures that the 'description' from the related ParameterList model is included
     description = serializers.CharField(source='parameter.description', read_only=True, default=None)
+    # Labels of the movement / displacement lookups, as before they were normalized
+    movement = serializers.CharField(source='movement.name', read_only=True, default=None)
+    displacement = serializers.CharField(source='displacement.name', read_only=True, default=None)
     
     class Meta:
         model = EnrParameter
@@ -36,7 +41,61 @@ class EnrParameterSerializer(serializers.ModelSerializer):
 class SeaTrialParameterSerializer(serializers.ModelSerializer):
     # Ensures that the 'description' from the related ParameterList model is included
     description = serializers.CharField(source='parameter.description', read_only=True, default=None)
+    displacement = serializers.CharField(source='displacement.name', read_only=True, default=None)
     
     class Meta:
         model = SeaTrialParameter
         fields = ['vessel', 'session', 'timestamp', 'displacement', 'parameter', 'description', 'value']
+
+# INGESTION SERIALIZER
+
+class IngestionRunSerializer(serializers.ModelSerializer):
+    rows_upserted = serializers.IntegerField(read_only=True)
+    rows_per_sec = serializers.FloatField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = IngestionRun
+        fields = [
+            'id', 'file_name', 'path', 'target_table', 'sha256', 'status', 'error', 'started_at', 'finished_at',
+            'rows_read', 'rows_melted', 'rows_non_numeric', 'rows_unknown_vessel', 'unknown_vessels',
+            'rows_upserted', 'inserted', 'updated', 'deleted', 'unchanged', 'new_parameters', 'calculated',
+            'read_seconds', 'melt_seconds', 'db_seconds', 'total_seconds', 'rows_per_sec',
+        ]
+
+# LEAN READ PATH
+
+# Serializer fields read from a related table -> values() lookup
+RELATED_FIELDS = {
+    "description": "parameter__description",
+    "movement": "movement__name",
+    "displacement": "displacement__name",
+}
+
+def lean_queryset(queryset, serializer_class):
+    """
+    values() rows for the fields of a parameter serializer, with the parameter
+    description and the movement / displacement labels joined in the same
+    query instead of one lookup per row.
+    """
+    fields = [RELATED_FIELDS.get(field, field) for field in serializer_class.Meta.fields]
+    return queryset.values(*fields)
+
+def lean_data(rows, serializer_class):
+    """Shape values() rows like serializer_class(rows, many=True).data, without model instances."""
+    fields = serializer_class.Meta.fields
+    model = serializer_class.Meta.model
+    # Datetimes go through DRF so they are rendered exactly like the ModelSerializer did
+    datetimes = [
+        field for field in fields
+        if field not in RELATED_FIELDS and isinstance(model._meta.get_field(field), models.DateTimeField)
+    ]
+    to_representation = serializers.DateTimeField().to_representation
+
+    data = []
+    with timed("serialize"):
+        for row in rows:
+            for field in datetimes:
+                row[field] = to_representation(row[field])
+            data.append({field: row[RELATED_FIELDS.get(field, field)] for field in fields})
+    return data
+
@@ -1,3 +1,1109 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase, force_authenticate
+
+from api import async_views, views
+from api.caching import performance_cache
+from api.exports import iter_export_blocks
+from api.instrumentation import REGISTRY
+from api.pivot import PIVOT_KEYS
+from api.renderers import FastJSONRenderer
+from enr.models import (
+    DataVersion, DisplacementList, EnrParameter, IngestionRun, MovementList, ParameterList, PartitionVersion,
+    SeaTrialParameter, VesselList,
+)
+from enr.pivot import parameter_column
+from enr.storage import ENR_DATASET
+
+# Plan fragments that mean the rows are sorted or grouped outside of an index
+SORT_MARKERS = {
+    "sqlite": ("USE TEMP B-TREE",),
+    "mysql": ("Using filesort", "Using temporary"),
+}
+EXPLAIN_PREFIX = {"sqlite": "EXPLAIN QUERY PLAN ", "mysql": "EXPLAIN "}
+# Queries of the performance cache key: partition versions and data versions
+CACHE_KEY_QUERIES = 2
+
+
+def seed_performance_data(vessels=3, parameters=5, days=60, trial_minutes=40):
+    """Enough rows for the planner to prefer the compound indexes over a table scan."""
+    vessel_rows = [VesselList.objects.create(vesselname=f"V{i}", description="") for i in range(vessels)]
+    parameter_rows = [
+        ParameterList.objects.create(code=f"0100{i:02d}", description=f"Param {i}") for i in range(parameters)
+    ]
+    sea, port = (MovementList.objects.create(name=name) for name in ("Sea", "Port"))
+    laden, ballast = (DisplacementList.objects.create(name=name) for name in ("Laden", "Ballast"))
+    first_day = datetime.date(2024, 1, 1)
+    EnrParameter.objects.bulk_create(
+        EnrParameter(
+            vessel=vessel,
+            date=first_day + datetime.timedelta(days=day),
+            movement=sea if day % 2 else port,
+            displacement=laden if day < days // 2 else ballast,
+            parameter=parameter,
+            value=float(day + parameter.id),
+        )
+        for vessel in vessel_rows
+        for day in range(days)
+        for parameter in parameter_rows
+    )
+    first_minute = datetime.datetime(2024, 2, 1, tzinfo=datetime.timezone.utc)
+    SeaTrialParameter.objects.bulk_create(
+        SeaTrialParameter(
+            vessel=vessel,
+            session="S1" if minute < trial_minutes // 2 else "S2",
+            timestamp=first_minute + datetime.timedelta(minutes=minute),
+            displacement=laden,
+            parameter=parameter,
+            value=float(minute),
+        )
+        for vessel in vessel_rows
+        for minute in range(trial_minutes)
+        for parameter in parameter_rows[:3]
+    )
+    return vessel_rows, parameter_rows
+
+
+class QueryPlanTests(TestCase):
+    """
+    The read endpoints must be served by the compound indexes of
+    EnrParameter / SeaTrialParameter, without sorting the rows afterwards.
+    The SQL is captured from real requests, so a change to the query shape
+    of a view that no longer matches an index makes these tests fail.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("planner", password="planner")
+        cls.vessels, cls.parameters = seed_performance_data()
+        with connection.cursor() as cursor:
+            if connection.vendor == "mysql":
+                cursor.execute("ANALYZE TABLE enr_enrparameter, enr_seatrialparameter")
+            else:
+                cursor.execute("ANALYZE")
+
+    def setUp(self):
+        if connection.vendor not in EXPLAIN_PREFIX:
+            self.skipTest(f"No query plan checks for {connection.vendor}")
+        performance_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def plans_for(self, url, table):
+        """Request url and return the plan of every query it ran against table."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        plans = []
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if not sql.startswith("SELECT") or f"FROM `{table}`" not in sql and f'FROM "{table}"' not in sql:
+                continue
+            if "__count" in sql:
+                # Plain page counts need no order, any index on the filtered columns will do
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(EXPLAIN_PREFIX[connection.vendor] + sql)
+                plans.append("\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall()))
+        self.assertTrue(plans, f"{url} ran no query against {table}")
+        return plans
+
+    def assertIndexedWithoutSort(self, plan, index, allowed=()):
+        self.assertIn(index, plan)
+        for marker in SORT_MARKERS[connection.vendor]:
+            for line in plan.splitlines():
+                if marker in line and not any(allow in line for allow in allowed):
+                    self.fail(f"Plan sorts outside of {index}:\n{plan}")
+
+    def test_single_parameter_uses_vessel_parameter_date_index(self):
+        vessel, parameter = self.vessels[0], self.parameters[1]
+        url = (f"/api/performance/single/?vessel={vessel.id}&parameter={parameter.id}"
+               "&start_date=2024-01-10&end_date=2024-02-10")
+        for plan in self.plans_for(url, "enr_enrparameter"):
+            self.assertIndexedWithoutSort(plan, "enr_vsl_param_date_idx")
+
+    def test_multiple_parameters_page_groups_on_covering_index(self):
+        vessel = self.vessels[0]
+        url = (f"/api/performance/multiple/?vessel={vessel.id}&parameters={self.parameters[0].id}"
+               f"&parameters={self.parameters[1].id}&start_date=2024-01-10&end_date=2024-02-10")
+        for plan in self.plans_for(url, "enr_enrparameter"):
+            # SQLite always sorts aggregated rows again, the grouping itself must use the index
+            self.assertIndexedWithoutSort(plan, "enr_vsl_date_cover_idx", allowed=("FOR ORDER BY",))
+
+    def test_multiple_parameters_full_data_reads_covering_index_in_order(self):
+        vessel = self.vessels[0]
+        url = (f"/api/performance/multiple/?vessel={vessel.id}&parameters={self.parameters[0].id}"
+               f"&parameters={self.parameters[1].id}&start_date=2024-01-10&end_date=2024-02-10&full_data=true")
+        for plan in self.plans_for(url, "enr_enrparameter"):
+            self.assertIndexedWithoutSort(plan, "enr_vsl_date_cover_idx")
+
+    def test_seatrial_uses_vessel_timestamp_index(self):
+        url = f"/api/performance/seatrial/?vessel={self.vessels[0].id}"
+        for plan in self.plans_for(url, "enr_seatrialparameter"):
+            self.assertIndexedWithoutSort(plan, "seatrial_vsl_ts_idx")
+
+
+class QueryCountTests(TestCase):
+    """Row endpoints read the parameter descriptions in the same query as the rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("counter", password="counter")
+        cls.vessels, cls.parameters = seed_performance_data()
+
+    def setUp(self):
+        performance_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_single_parameter_page_is_one_query(self):
+        url = f"/api/performance/single/?vessel={self.vessels[0].id}&page_size=100"
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        rows = response.json()["results"]
+        self.assertEqual(len(rows), 100)
+        descriptions = {parameter.id: parameter.description for parameter in self.parameters}
+        self.assertTrue(all(row["description"] == descriptions[row["parameter"]] for row in rows))
+
+    def test_seatrial_page_with_count_is_count_plus_rows(self):
+        url = f"/api/performance/seatrial/?vessel={self.vessels[0].id}&count=true"
+        with self.assertNumQueries(2 + CACHE_KEY_QUERIES):
+            response = self.client.get(url)
+        rows = response.json()["results"]
+        self.assertEqual(len(rows), 120)
+        self.assertEqual(
+            list(rows[0]),
+            ["vessel", "session", "timestamp", "displacement", "parameter", "description", "value"],
+        )
+        self.assertTrue(rows[0]["timestamp"].endswith("Z"))
+
+
+class PivotPageTests(TestCase):
+    """A page of the multi-parameter table is pivoted by one grouped query in the database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("pivoter", password="pivoter")
+        cls.vessels, cls.parameters = seed_performance_data(days=10)
+
+    def setUp(self):
+        performance_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def url(self, page_size, parameters):
+        return (f"/api/performance/multiple/?resolution=raw&vessel={self.vessels[0].id}&page_size={page_size}"
+                + "".join(f"&parameters={parameter.id}" for parameter in parameters))
+
+    def test_rows_hold_the_selected_parameters(self):
+        first, third = self.parameters[0], self.parameters[2]
+        rows = self.client.get(self.url(4, [first, third])).json()["results"]
+        self.assertEqual([row["date"] for row in rows], ["2024-01-10", "2024-01-09", "2024-01-08", "2024-01-07"])
+        self.assertEqual(rows[0], {
+            "vessel": self.vessels[0].id, "date": "2024-01-10", "movement": "Sea", "displacement": "Ballast",
+            parameter_column(first.id): 9.0 + first.id, parameter_column(third.id): 9.0 + third.id,
+        })
+
+    def test_page_is_one_grouped_query(self):
+        for page_size in (2, 8):
+            with CaptureQueriesContext(connection) as queries:
+                rows = self.client.get(self.url(page_size, self.parameters)).json()["results"]
+            self.assertEqual(len(rows), page_size)
+            reads = [query["sql"] for query in queries.captured_queries if "enr_enrparameter" in query["sql"]]
+            self.assertEqual(len(reads), 1)
+            self.assertIn("GROUP BY", reads[0])
+            self.assertIn(f"LIMIT {page_size + 1}", reads[0])
+
+
+class KeysetPaginationTests(TestCase):
+    """Following next and previous links visits every row once, in order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("pager", password="pager")
+        cls.vessels, cls.parameters = seed_performance_data(days=20)
+        # NULL keys sort first and must not be skipped or repeated
+        EnrParameter.objects.filter(vessel=cls.vessels[0], date__day__in=[3, 4]).update(movement=None)
+        EnrParameter.objects.filter(vessel=cls.vessels[1], date__day=5).update(vessel=None)
+
+    def setUp(self):
+        performance_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()["previous"])
+        pages = [response.json()]
+        while pages[-1]["next"]:
+            pages.append(self.client.get(pages[-1]["next"]).json())
+        # And back again from the last page
+        backwards = [pages[-1]]
+        while backwards[0]["previous"]:
+            backwards.insert(0, self.client.get(backwards[0]["previous"]).json())
+        self.assertEqual([page["results"] for page in backwards], [page["results"] for page in pages])
+        return pages, [row for page in pages for row in page["results"]]
+
+    def test_single_parameter_pages_follow_date_and_id(self):
+        parameter = self.parameters[1]
+        pages, rows = self.walk(f"/api/performance/single/?parameter={parameter.id}&page_size=7&count=true")
+        expected = EnrParameter.objects.filter(parameter=parameter).order_by("date", "id")
+        self.assertEqual(pages[0]["count"], expected.count())
+        self.assertIsNone(pages[1]["count"])
+        self.assertEqual(
+            [(row["vessel"], row["date"]) for row in rows],
+            [(vessel, date.isoformat()) for vessel, date in expected.values_list("vessel", "date")],
+        )
+
+    def test_seatrial_pages_follow_timestamp_and_id(self):
+        vessel = self.vessels[0]
+        _, rows = self.walk(f"/api/performance/seatrial/?vessel={vessel.id}&page_size=11")
+        expected = SeaTrialParameter.objects.filter(vessel=vessel).order_by("timestamp", "id")
+        self.assertEqual([row["parameter"] for row in rows], list(expected.values_list("parameter", flat=True)))
+
+    def test_pivot_pages_cover_every_key_once(self):
+        pages, rows = self.walk("/api/performance/multiple/?resolution=raw&page_size=9&count=true")
+        keys = [(row["vessel"], row["date"], row["movement"], row["displacement"]) for row in rows]
+        expected = EnrParameter.objects.values_list("vessel", "date", "movement__name", "displacement__name").distinct()
+        self.assertEqual(len(keys), pages[0]["count"])
+        self.assertEqual(sorted(keys, key=str), sorted(((v, d.isoformat(), m, p) for v, d, m, p in expected), key=str))
+        self.assertEqual([key[1] for key in keys], sorted((key[1] for key in keys), reverse=True))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get("/api/performance/single/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_invalid_values_is_not_found(self):
+        def cursor(*values):
+            payload = json.dumps({"p": list(values), "r": 0}).encode()
+            return base64.urlsafe_b64encode(payload).decode()
+
+        cases = [
+            ("/api/performance/single/", cursor("2024-13-45", 1)),
+            ("/api/performance/single/", cursor("2024-01-02", "abc")),
+            ("/api/performance/single/", cursor(["2024-01-02"], 1)),
+            ("/api/performance/seatrial/", cursor("yesterday", 1)),
+            ("/api/performance/multiple/?resolution=raw", cursor("2024-01-02", {"id": 1}, None, None)),
+            ("/api/performance/multiple/?resolution=month", cursor("not a date", 1)),
+        ]
+        for url, value in cases:
+            with self.subTest(url=url, cursor=value):
+                separator = "&" if "?" in url else "?"
+                response = self.client.get(f"{url}{separator}cursor={value}")
+                self.assertEqual(response.status_code, 404)
+
+
+class AsyncViewTests(TestCase):
+    """The async read views (served under ASGI) answer exactly like the sync ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("async", password="async")
+        cls.vessels, cls.parameters = seed_performance_data(days=20)
+
+    def sync_response(self, view_class, url):
+        request = RequestFactory().get(url)
+        force_authenticate(request, self.user)
+        response = view_class.as_view()(request)
+        if response.streaming:
+            return response.status_code, b"".join(response.streaming_content)
+        return response.status_code, response.render().content
+
+    async def async_response(self, view_class, url):
+        request = AsyncRequestFactory().get(url)
+        force_authenticate(request, self.user)
+        response = await view_class.as_view()(request)
+        if response.streaming:
+            self.assertTrue(response.is_async)
+            return response.status_code, b"".join([chunk async for chunk in response.streaming_content])
+        return response.status_code, response.render().content
+
+    async def assertSameResponses(self, sync_class, async_class, urls):
+        for url in urls:
+            with self.subTest(url=url):
+                expected = await sync_to_async(self.sync_response)(sync_class, url)
+                # Both views share the performance cache, the async one has to compute its response
+                performance_cache().clear()
+                self.assertEqual(await self.async_response(async_class, url), expected)
+
+    async def test_single_parameter(self):
+        parameter = self.parameters[1].id
+        await self.assertSameResponses(views.ENRSingleParameterAPIView, async_views.AsyncENRSingleParameterAPIView, [
+            f"/api/performance/single/?parameter={parameter}&page_size=7&count=true",
+            f"/api/performance/single/?vessel={self.vessels[0].id}&movement=Sea",
+        ])
+
+    async def test_multiple_parameters(self):
+        vessel = self.vessels[0].id
+        await self.assertSameResponses(views.ENRMultipleParameterAPIView, async_views.AsyncENRMultipleParameterAPIView, [
+            "/api/performance/multiple/?resolution=raw&page_size=9&count=true",
+            f"/api/performance/multiple/?vessel={vessel}&full_data=true&max_points=5",
+            "/api/performance/multiple/?resolution=raw&movement=Sea&full_data=true",
+            "/api/performance/multiple/?resolution=month&movement=Sea",
+        ])
+
+    async def test_compare(self):
+        vessels = "".join(f"&vessels={vessel.id}" for vessel in self.vessels[:2])
+        await self.assertSameResponses(views.ENRCompareAPIView, async_views.AsyncENRCompareAPIView, [
+            f"/api/performance/compare/?resolution=raw{vessels}&parameters={self.parameters[0].id}",
+            "/api/performance/compare/?resolution=month",
+        ])
+
+    async def test_seatrial(self):
+        vessel = self.vessels[0].id
+        await self.assertSameResponses(views.SeaTrialParameterAPIView, async_views.AsyncSeaTrialParameterAPIView, [
+            f"/api/performance/seatrial/?vessel={vessel}&page_size=11",
+            f"/api/performance/seatrial/?vessel={vessel}&max_points=4",
+        ])
+
+    async def test_export_is_streamed_asynchronously(self):
+        await self.assertSameResponses(views.DownloadExcelView, async_views.AsyncDownloadExcelView, [
+            f"/api/download-excel/?vessel={self.vessels[1].id}&format=csv",
+            "/api/download-excel/?format=pdf",
+        ])
+
+    async def test_invalid_parameters_are_rejected(self):
+        views_and_urls = [
+            (views.ENRMultipleParameterAPIView, async_views.AsyncENRMultipleParameterAPIView,
+             "/api/performance/multiple/?resolution=raw&full_data=true&parameters=abc"),
+            (views.ENRMultipleParameterAPIView, async_views.AsyncENRMultipleParameterAPIView,
+             f"/api/performance/multiple/?resolution=month&parameters={self.parameters[0].id}&parameters=abc"),
+            (views.ENRCompareAPIView, async_views.AsyncENRCompareAPIView, "/api/performance/compare/?parameters=abc"),
+            (views.DownloadExcelView, async_views.AsyncDownloadExcelView, "/api/download-excel/?format=csv&parameters=1.5"),
+        ]
+        # From the database and from the columnar store
+        with tempfile.TemporaryDirectory() as store:
+            for root in (None, store):
+                with override_settings(ENR_COLUMNAR_STORE=root):
+                    for sync_class, async_class, url in views_and_urls:
+                        with self.subTest(url=url, store=root):
+                            status, content = await sync_to_async(self.sync_response)(sync_class, url)
+                            self.assertEqual((status, json.loads(content)), (400, {"error": "parameters must be parameter ids"}))
+                            self.assertEqual((await self.async_response(async_class, url))[0], 400)
+
+    async def test_requires_authentication(self):
+        response = await async_views.AsyncENRSingleParameterAPIView.as_view()(
+            AsyncRequestFactory().get("/api/performance/single/")
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class VersionCacheTests(APITestCase):
+    """The lookup endpoints are cached and revalidated by the DataVersion of their data."""
+
+    urls = ("/api/vessels/", "/api/parameters/", "/api/filters/")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("versions", password="versions")
+        seed_performance_data(vessels=2, parameters=2, days=2, trial_minutes=0)
+        for name in (DataVersion.VESSELS, DataVersion.PARAMETERS, DataVersion.ENR):
+            DataVersion.bump(name)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_unchanged_data_is_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                self.assertTrue(first["ETag"])
+                self.assertIn("no-cache", first["Cache-Control"])
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+                self.assertEqual(response.status_code, 304)
+                response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+                self.assertEqual(response.status_code, 304)
+
+    def test_write_changes_the_etag(self):
+        writes = {
+            "/api/vessels/": (lambda: VesselList.objects.create(vesselname="New vessel", description=""), "New vessel"),
+            "/api/parameters/": (lambda: ParameterList.objects.create(code="990001", description="New"), "990001"),
+            "/api/filters/": (lambda: MovementList.objects.create(name="Anchorage"), "Anchorage"),
+        }
+        for url, (write, text) in writes.items():
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                with self.captureOnCommitCallbacks(execute=True):
+                    write()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+                self.assertIn(text, response.content.decode())
+
+    def test_body_is_cached_until_the_version_changes(self):
+        first = self.client.get("/api/vessels/").json()
+        # A queryset update sends no signal and leaves the version as it is
+        VesselList.objects.filter(vesselname="V0").update(vesselname="Renamed")
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/api/vessels/").json(), first)
+        DataVersion.bump(DataVersion.VESSELS)
+        vessels = self.client.get("/api/vessels/").json()["results"]
+        self.assertIn("Renamed", {vessel["vesselname"] for vessel in vessels})
+
+
+class PerformanceCacheTests(TestCase):
+    """Performance query results are cached until a write touches their vessel months."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("cacher", password="cacher")
+        cls.vessels, cls.parameters = seed_performance_data(days=40)
+        PartitionVersion.bump(ENR_DATASET.name, [
+            (vessel.id, month) for vessel in cls.vessels for month in (datetime.date(2024, 1, 1), datetime.date(2024, 2, 1))
+        ])
+
+    def setUp(self):
+        performance_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def url(self, vessel, start_date="2024-01-05", end_date="2024-01-20", parameters=(0, 1)):
+        query = "".join(f"&parameters={self.parameters[i].id}" for i in parameters)
+        return (f"/api/performance/multiple/?resolution=raw&vessel={vessel.id}"
+                f"&start_date={start_date}&end_date={end_date}{query}")
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.client.get(self.url(self.vessels[0]))
+        self.assertEqual(first["X-Cache"], "MISS")
+        with self.assertNumQueries(CACHE_KEY_QUERIES - 1):
+            second = self.client.get(self.url(self.vessels[0]))
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.json(), first.json())
+
+    def test_parameter_order_and_duplicates_share_an_entry(self):
+        self.client.get(self.url(self.vessels[0], parameters=(0, 1)))
+        response = self.client.get(self.url(self.vessels[0], parameters=(1, 0, 1)))
+        self.assertEqual(response["X-Cache"], "HIT")
+
+    def test_write_invalidates_only_the_covered_partitions(self):
+        vessel, other = self.vessels[0], self.vessels[1]
+        for url in (self.url(vessel), self.url(other), self.url(vessel, "2024-02-05", "2024-02-08")):
+            self.client.get(url)
+
+        row = EnrParameter.objects.get(vessel=vessel, date=datetime.date(2024, 1, 18), parameter=self.parameters[0])
+        row.value = 1234.5
+        with self.captureOnCommitCallbacks(execute=True):
+            row.save()
+
+        response = self.client.get(self.url(vessel))
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn(1234.5, [result.get(parameter_column(self.parameters[0].id)) for result in response.json()["results"]])
+        self.assertEqual(self.client.get(self.url(other))["X-Cache"], "HIT")
+        self.assertEqual(self.client.get(self.url(vessel, "2024-02-05", "2024-02-08"))["X-Cache"], "HIT")
+
+    def test_partition_version_keys_only_its_vessel_and_month(self):
+        vessel, other = self.vessels[0], self.vessels[1]
+        urls = {
+            "january": self.url(vessel),
+            "february": self.url(vessel, "2024-02-05", "2024-02-08"),
+            "both": self.url(vessel, "2024-01-20", "2024-02-08"),
+            "other": self.url(other, "2024-02-05", "2024-02-08"),
+        }
+        for url in urls.values():
+            self.client.get(url)
+
+        PartitionVersion.bump(ENR_DATASET.name, [(vessel.id, datetime.date(2024, 2, 1))])
+
+        outcomes = {name: self.client.get(url)["X-Cache"] for name, url in urls.items()}
+        self.assertEqual(outcomes, {"january": "HIT", "february": "MISS", "both": "MISS", "other": "HIT"})
+
+    def test_rollup_rebuild_invalidates_the_vessel(self):
+        vessel, other = self.vessels[0], self.vessels[1]
+        call_command("build_rollups", stdout=io.StringIO())
+        urls = [f"/api/performance/multiple/?resolution=month&full_data=true&vessel={item.id}" for item in (vessel, other)]
+        for url in urls:
+            self.client.get(url)
+
+        # A bulk update sends no signals, the rollups are rebuilt by the command
+        EnrParameter.objects.filter(vessel=vessel, parameter=self.parameters[0]).update(value=1234.5)
+        call_command("build_rollups", vessel=[vessel.id], stdout=io.StringIO())
+
+        response = self.client.get(urls[0])
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual({row[parameter_column(self.parameters[0].id)] for row in response.json()["results"]}, {1234.5})
+        self.assertEqual(self.client.get(urls[1])["X-Cache"], "HIT")
+
+    def test_large_results_are_not_cached(self):
+        # 16 dates of one vessel, in either layout
+        for layout in ("rows", "columnar"):
+            url = self.url(self.vessels[0]) + f"&full_data=true&layout={layout}"
+            with self.subTest(layout=layout):
+                with mock.patch("api.caching.CACHE_MAX_ROWS", 15):
+                    self.client.get(url)
+                    self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+                with mock.patch("api.caching.CACHE_MAX_ROWS", 16):
+                    self.client.get(url)
+                    self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+
+    def test_invalid_filters_bypass_the_cache(self):
+        response = self.client.get("/api/performance/multiple/?vessel=abc")
+        self.assertEqual(response["X-Cache"], "BYPASS")
+
+    def test_metrics_count_hits_and_misses(self):
+        for _ in range(3):
+            self.client.get(self.url(self.vessels[0]))
+        metrics = self.client.get("/api/cache/metrics/").json()["endpoints"]["multiple"]
+        self.assertEqual((metrics["hit"], metrics["miss"]), (2, 1))
+        self.assertAlmostEqual(metrics["hit_ratio"], 2 / 3)
+
+
+class RollupTests(TestCase):
+    """resolution=day|week|month reads the build_rollups aggregates, resolution=auto picks one by the range."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("roller", password="roller")
+        cls.vessels, cls.parameters = seed_performance_data(vessels=2, parameters=2, days=60)
+        call_command("build_rollups", stdout=io.StringIO())
+
+    def setUp(self):
+        performance_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def raw_frame(self, vessel, parameter):
+        rows = EnrParameter.objects.filter(vessel=vessel, parameter=parameter).values_list("date", "value")
+        frame = pd.DataFrame(list(rows), columns=["date", "value"])
+        frame["date"] = pd.to_datetime(frame["date"])
+        return frame
+
+    def rollup_values(self, resolution, statistic, vessel, parameter):
+        url = (f"/api/performance/multiple/?resolution={resolution}&statistic={statistic}&full_data=true"
+               f"&vessel={vessel.id}&parameters={parameter.id}")
+        data = self.client.get(url).json()
+        self.assertEqual(data["resolution"], resolution)
+        return {row["date"]: row[parameter_column(parameter.id)] for row in data["results"]}
+
+    def test_statistics_match_the_raw_rows(self):
+        vessel, parameter = self.vessels[1], self.parameters[1]
+        raw = self.raw_frame(vessel, parameter)
+        periods = {"month": raw["date"].dt.to_period("M"), "week": raw["date"].dt.to_period("W-SUN")}
+        for resolution, period in periods.items():
+            grouped = raw.groupby(period.dt.start_time.dt.strftime("%Y-%m-%d"))["value"]
+            for statistic, expected in (("minimum", grouped.min()), ("maximum", grouped.max()),
+                                        ("mean", grouped.mean()), ("count", grouped.count())):
+                with self.subTest(resolution=resolution, statistic=statistic):
+                    values = self.rollup_values(resolution, statistic, vessel, parameter)
+                    self.assertEqual(sorted(values), sorted(expected.index))
+                    for start, value in expected.items():
+                        self.assertAlmostEqual(values[start], value)
+
+    def test_last_is_the_value_of_the_latest_day(self):
+        vessel, parameter = self.vessels[0], self.parameters[0]
+        values = self.rollup_values("month", "last", vessel, parameter)
+        raw = self.raw_frame(vessel, parameter).set_index("date")["value"]
+        self.assertEqual(values, {"2024-02-01": raw["2024-02-29"], "2024-01-01": raw["2024-01-31"]})
+
+    def test_auto_resolution_grows_with_the_range(self):
+        for start_date, end_date, resolution in (
+            ("2024-01-01", "2024-02-29", "raw"),
+            ("2022-03-01", "2024-02-29", "raw"),
+            ("2022-02-01", "2024-02-29", "week"),
+            ("2016-03-01", "2024-02-29", "week"),
+            ("2010-01-01", "2024-02-29", "month"),
+        ):
+            with self.subTest(start_date=start_date):
+                url = f"/api/performance/multiple/?start_date={start_date}&end_date={end_date}&full_data=true"
+                self.assertEqual(self.client.get(url).json()["resolution"], resolution)
+
+    def test_auto_resolution_without_dates_uses_the_stored_months(self):
+        self.assertEqual(self.client.get("/api/performance/multiple/?full_data=true").json()["resolution"], "raw")
+        # Ten years of monthly rollups of one vessel
+        EnrParameter.objects.create(
+            vessel=self.vessels[0], date=datetime.date(2014, 1, 1), parameter=self.parameters[0], value=1.0,
+        )
+        call_command("build_rollups", vessel=[self.vessels[0].id], stdout=io.StringIO())
+        self.assertEqual(self.client.get("/api/performance/multiple/?full_data=true").json()["resolution"], "month")
+        url = f"/api/performance/multiple/?full_data=true&vessel={self.vessels[1].id}"
+        self.assertEqual(self.client.get(url).json()["resolution"], "raw")
+
+    def test_auto_resolution_is_raw_when_split_by_voyage(self):
+        url = "/api/performance/multiple/?start_date=2010-01-01&end_date=2024-02-29&movement=Sea&full_data=true"
+        self.assertEqual(self.client.get(url).json()["resolution"], "raw")
+
+    def test_rebuild_bumps_the_versions(self):
+        vessel = self.vessels[0]
+        version = DataVersion.objects.get(name=DataVersion.ENR).version
+        call_command("build_rollups", vessel=[vessel.id], stdout=io.StringIO())
+        self.assertEqual(DataVersion.objects.get(name=DataVersion.ENR).version, version + 1)
+        self.assertEqual(
+            sorted(PartitionVersion.objects.values_list("dataset", "vessel", "month", "version")),
+            [(ENR_DATASET.name, vessel.id, datetime.date(2024, month, 1), 2) for month in (1, 2)]
+            + [(ENR_DATASET.name, self.vessels[1].id, datetime.date(2024, month, 1), 1) for month in (1, 2)],
+        )
+
+
+class CompareTests(TestCase):
+    """The compare endpoint returns the series of several vessels from one query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("comparer", password="comparer")
+        cls.vessels, cls.parameters = seed_performance_data(days=20)
+
+    def setUp(self):
+        performance_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_vessels_share_one_date_axis(self):
+        vessels, parameters = self.vessels[:2], self.parameters[:2]
+        url = ("/api/performance/compare/?resolution=raw&start_date=2024-01-02&end_date=2024-01-06"
+               + "".join(f"&vessels={vessel.id}" for vessel in vessels)
+               + "".join(f"&parameters={parameter.id}" for parameter in parameters))
+        # Partition versions and the rows
+        with self.assertNumQueries(2):
+            data = self.client.get(url).json()
+
+        self.assertEqual(data["dates"], [f"2024-01-0{day}" for day in range(2, 7)])
+        self.assertEqual(sorted(data["vessels"]), sorted(str(vessel.id) for vessel in vessels))
+        first = data["vessels"][str(vessels[0].id)][parameter_column(parameters[0].id)]
+        self.assertEqual(first, [float(day + parameters[0].id) for day in range(1, 6)])
+        second = data["vessels"][str(vessels[1].id)][parameter_column(parameters[1].id)]
+        self.assertEqual(second, [float(day + parameters[1].id) for day in range(1, 6)])
+
+    def test_missing_values_are_null(self):
+        vessel, parameter = self.vessels[2], self.parameters[0]
+        EnrParameter.objects.filter(vessel=vessel, parameter=parameter, date=datetime.date(2024, 1, 4)).delete()
+        url = (f"/api/performance/compare/?resolution=raw&start_date=2024-01-03&end_date=2024-01-05"
+               f"&vessels={self.vessels[0].id}&vessels={vessel.id}&parameters={parameter.id}")
+        values = self.client.get(url).json()["vessels"][str(vessel.id)][parameter_column(parameter.id)]
+        self.assertEqual(values, [2.0 + parameter.id, None, 4.0 + parameter.id])
+
+    def test_large_comparison_is_not_cached(self):
+        # 5 dates of 3 vessels
+        url = "/api/performance/compare/?resolution=raw&start_date=2024-01-02&end_date=2024-01-06"
+        with mock.patch("api.caching.CACHE_MAX_ROWS", 14):
+            self.client.get(url)
+            self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+        with mock.patch("api.caching.CACHE_MAX_ROWS", 15):
+            self.client.get(url)
+            self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+
+    def test_invalid_vessels_are_rejected(self):
+        response = self.client.get("/api/performance/compare/?vessels=abc")
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(TestCase):
+    """The export formats hold the same pivoted rows, whatever the parameter descriptions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("exporter", password="exporter")
+        cls.vessels, cls.parameters = seed_performance_data(vessels=2, days=10)
+        # Descriptions are not unique
+        ParameterList.objects.filter(pk__in=[cls.parameters[0].id, cls.parameters[1].id]).update(description="M/E Power")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, export_format, query=""):
+        response = self.client.get(f"/api/download-excel/?format={export_format}&vessel={self.vessels[0].id}{query}")
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def assertSameFrame(self, frame):
+        columns = list(PIVOT_KEYS) + [parameter_column(parameter.id) for parameter in self.parameters]
+        self.assertEqual(list(frame.columns), columns)
+        self.assertEqual(len(frame), 10)
+        self.assertEqual(frame["date"].iloc[0], datetime.date(2024, 1, 10))
+        self.assertEqual(frame[parameter_column(self.parameters[2].id)].iloc[0], 9.0 + self.parameters[2].id)
+
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(self.export("parquet")))
+        self.assertSameFrame(table.to_pandas())
+        field = table.schema.field(parameter_column(self.parameters[1].id))
+        self.assertEqual(field.metadata, {b"description": b"M/E Power"})
+
+    def test_arrow(self):
+        import pyarrow as pa
+
+        table = pa.ipc.open_stream(self.export("arrow")).read_all()
+        self.assertSameFrame(table.to_pandas())
+        self.assertEqual(table.schema.field(parameter_column(self.parameters[0].id)).metadata[b"description"], b"M/E Power")
+
+    def test_empty_parquet_has_the_columns(self):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(self.export("parquet", "&start_date=2030-01-01&end_date=2030-02-01")))
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.schema.names[:len(PIVOT_KEYS)], list(PIVOT_KEYS))
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export("csv").decode())))
+        self.assertEqual(rows[0], [*PIVOT_KEYS, "M/E Power", "M/E Power", "Param 2", "Param 3", "Param 4"])
+        self.assertEqual(len(rows), 11)
+        self.assertEqual(rows[1][:4], [str(self.vessels[0].id), "2024-01-10", "Sea", "Ballast"])
+        self.assertEqual(float(rows[1][4]), 9.0 + self.parameters[0].id)
+
+    def test_blocks_cover_every_date_once(self):
+        queryset = EnrParameter.objects.filter(vessel=self.vessels[0])
+        parameter_ids = [parameter.id for parameter in self.parameters]
+        blocks = list(iter_export_blocks(queryset, parameter_ids, block_dates=3))
+        self.assertEqual([len(block) for block in blocks], [3, 3, 3, 1])
+        whole = next(iter_export_blocks(queryset, parameter_ids))
+        pd.testing.assert_frame_equal(pd.concat(blocks, ignore_index=True), whole)
+
+    def test_unsupported_format_is_rejected(self):
+        response = self.client.get("/api/download-excel/?format=pdf")
+        self.assertEqual(response.status_code, 400)
+
+    def test_arrow_formats_need_pyarrow(self):
+        with mock.patch("api.views.pyarrow_available", return_value=False):
+            response = self.client.get("/api/download-excel/?format=parquet")
+        self.assertEqual(response.status_code, 501)
+
+    def test_xlsx_headers_are_descriptions(self):
+        from openpyxl import load_workbook
+
+        sheet = load_workbook(io.BytesIO(self.export("xlsx")), read_only=True)["Performance Data"]
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:6], (*PIVOT_KEYS, "M/E Power", "M/E Power"))
+        self.assertEqual(len(rows), 11)
+
+
+class ColumnarLayoutTests(TestCase):
+    """layout=columnar carries the same values as the row layout, one list per column."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("columns", password="columns")
+        cls.vessels, cls.parameters = seed_performance_data(days=10)
+
+    def setUp(self):
+        performance_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertSameRows(self, url):
+        rows = self.client.get(url).json()["results"]
+        columns = self.client.get(url + "&layout=columnar").json()["results"]
+        self.assertEqual(columns["columns"][:len(PIVOT_KEYS)], list(PIVOT_KEYS))
+        transposed = [dict(zip(columns["columns"], values)) for values in zip(*columns["values"])]
+        self.assertEqual(transposed, [{**dict.fromkeys(columns["columns"]), **row} for row in rows])
+
+    def test_page(self):
+        self.assertSameRows("/api/performance/multiple/?resolution=raw&page_size=7&movement=Sea")
+
+    def test_full_data(self):
+        self.assertSameRows(f"/api/performance/multiple/?resolution=raw&full_data=true&vessel={self.vessels[0].id}")
+
+    def test_unknown_layout_is_rejected(self):
+        response = self.client.get("/api/performance/multiple/?layout=xml")
+        self.assertEqual(response.status_code, 400)
+
+
+class ColumnarStoreViewTests(TestCase):
+    """Chart series are read through the columnar store while its partitions are current, else from the database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("parquet", password="parquet")
+        cls.vessels, cls.parameters = seed_performance_data(vessels=2, parameters=2, days=45)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(ENR_COLUMNAR_STORE=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command("build_columnar_store", stdout=io.StringIO())
+        self.store = directory.name
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.vessel, self.january = self.vessels[0], datetime.date(2024, 1, 1)
+        # Only the database sees this change: a queryset update sends no signal
+        EnrParameter.objects.filter(vessel=self.vessel).update(value=-1.0)
+
+    def values(self):
+        performance_cache().clear()
+        url = (f"/api/performance/multiple/?resolution=raw&full_data=true&vessel={self.vessel.id}"
+               f"&start_date=2024-01-20&end_date=2024-02-05&parameters={self.parameters[0].id}")
+        rows = self.client.get(url).json()["results"]
+        self.assertEqual(len(rows), 17)
+        return {row[parameter_column(self.parameters[0].id)] for row in rows}
+
+    def test_current_partitions_are_read_from_the_store(self):
+        self.assertNotIn(-1.0, self.values())
+        with override_settings(ENR_COLUMNAR_STORE=None):
+            self.assertEqual(self.values(), {-1.0})
+
+    def test_store_rows_match_the_database(self):
+        call_command("build_columnar_store", stdout=io.StringIO())
+        url = f"/api/performance/multiple/?resolution=raw&full_data=true&vessel={self.vessels[1].id}&layout=columnar"
+        from_store = self.client.get(url).json()
+        performance_cache().clear()
+        with override_settings(ENR_COLUMNAR_STORE=None):
+            self.assertEqual(self.client.get(url).json(), from_store)
+
+    def test_missing_partition_is_read_from_the_database(self):
+        PartitionVersion.bump(ENR_DATASET.name, [(self.vessel.id, self.january)])
+        call_command("build_columnar_store", stdout=io.StringIO())
+        EnrParameter.objects.filter(vessel=self.vessel).update(value=-2.0)
+        self.assertNotIn(-2.0, self.values())
+        os.remove(os.path.join(self.store, "enr", f"vessel={self.vessel.id}", "2024-01.parquet"))
+        self.assertEqual(self.values(), {-2.0})
+
+    def test_stale_partition_is_read_from_the_database(self):
+        # Written but not synced yet, or the sync failed
+        PartitionVersion.bump(ENR_DATASET.name, [(self.vessel.id, self.january)])
+        self.assertEqual(self.values(), {-1.0})
+        call_command("build_columnar_store", "--vessel", str(self.vessel.id), stdout=io.StringIO())
+        EnrParameter.objects.filter(vessel=self.vessel).update(value=-2.0)
+        self.assertEqual(self.values(), {-1.0})
+
+    def test_partitions_outside_the_range_do_not_matter(self):
+        PartitionVersion.bump(ENR_DATASET.name, [(self.vessel.id, datetime.date(2024, 6, 1)), (self.vessels[1].id, self.january)])
+        self.assertNotIn(-1.0, self.values())
+
+
+class DownsampleTests(TestCase):
+    """full_data chart series are reduced to at most max_points points per vessel and parameter."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("sampler", password="sampler")
+        cls.vessels, cls.parameters = seed_performance_data(vessels=2, parameters=2, days=60)
+
+    def setUp(self):
+        performance_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_series_are_downsampled(self):
+        for method in ("lttb", "minmax"):
+            with self.subTest(method=method):
+                url = f"/api/performance/multiple/?resolution=raw&full_data=true&max_points=6&downsample={method}"
+                rows = self.client.get(url).json()["results"]
+                for vessel in self.vessels:
+                    series = [row for row in rows if row["vessel"] == vessel.id]
+                    dates = [row["date"] for row in series]
+                    self.assertEqual(dates, sorted(dates, reverse=True))
+                    # Both ends of the series are kept
+                    self.assertEqual((dates[0], dates[-1]), ("2024-02-29", "2024-01-01"))
+                    for parameter in self.parameters:
+                        values = [row[parameter_column(parameter.id)] for row in series]
+                        self.assertLessEqual(len([value for value in values if value is not None]), 6)
+
+    def test_seatrial_rows_are_downsampled(self):
+        vessel = self.vessels[0]
+        url = f"/api/performance/seatrial/?vessel={vessel.id}&max_points=5"
+        data = self.client.get(url).json()
+        self.assertEqual(data["count"], 40 * 2)
+        timestamps = [row["timestamp"] for row in data["results"]]
+        self.assertEqual(timestamps, sorted(timestamps))
+        # At most 5 readings of each of the 2 parameters
+        self.assertLessEqual(len(data["results"]), 5 * 2)
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ("max_points=2", "max_points=many", "max_points=10&downsample=average"):
+            with self.subTest(query=query):
+                response = self.client.get(f"/api/performance/multiple/?full_data=true&{query}")
+                self.assertEqual(response.status_code, 400)
+
+
+class RegressionTests(TestCase):
+    """The sea-trial regression fits y against x over the readings paired by session and timestamp."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("fitter", password="fitter")
+        cls.vessel = VesselList.objects.create(vesselname="V1", description="")
+        cls.power = ParameterList.objects.create(code="010001", description="M/E Power")
+        cls.speed = ParameterList.objects.create(code="020001", description="Ship Speed")
+        first_minute = datetime.datetime(2024, 2, 1, tzinfo=datetime.timezone.utc)
+        readings = []
+        for minute in range(20):
+            timestamp = first_minute + datetime.timedelta(minutes=minute)
+            power = 1000.0 * (minute + 1)
+            readings += [
+                SeaTrialParameter(vessel=cls.vessel, session="S1", timestamp=timestamp, parameter=cls.power, value=power),
+                SeaTrialParameter(vessel=cls.vessel, session="S1", timestamp=timestamp, parameter=cls.speed,
+                                  value=2e-6 * power ** 2 + 0.003 * power + 1),
+            ]
+        # A reading without its pair is left out of the fit
+        readings.append(SeaTrialParameter(
+            vessel=cls.vessel, session="S2", timestamp=first_minute, parameter=cls.power, value=99999.0,
+        ))
+        SeaTrialParameter.objects.bulk_create(readings)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fit(self, **params):
+        query = {"vessel": self.vessel.id, "x": self.power.id, "y": self.speed.id, **params}
+        return self.client.get("/api/performance/seatrial/regression/", query)
+
+    def test_polynomial_fit(self):
+        data = self.fit(y="Ship Speed", degree=2, points=5).json()
+        self.assertEqual((data["x_parameter"], data["y_parameter"], data["n"]), ("M/E Power", "Ship Speed", 20))
+        np.testing.assert_allclose(data["coefficients"], [2e-6, 0.003, 1], rtol=1e-6)
+        self.assertAlmostEqual(data["r_squared"], 1.0)
+        self.assertEqual([point["x"] for point in data["curve"]], [1000.0, 5750.0, 10500.0, 15250.0, 20000.0])
+        self.assertAlmostEqual(data["curve"][-1]["y"], 2e-6 * 20000 ** 2 + 0.003 * 20000 + 1)
+
+    def test_scatter_is_spread_over_x(self):
+        scatter = self.fit(scatter=4).json()["scatter"]
+        self.assertEqual([point["x"] for point in scatter], [1000.0, 7000.0, 14000.0, 20000.0])
+        self.assertEqual(self.fit(scatter=0).json()["scatter"], [])
+
+    def test_too_few_pairs_are_not_fitted(self):
+        data = self.fit(degree=2, start_date="2024-03-01", end_date="2024-03-31").json()
+        self.assertEqual((data["n"], data["coefficients"], data["curve"]), (0, None, []))
+
+    def test_invalid_requests_are_rejected(self):
+        for params, error in [
+            ({"vessel": ""}, "vessel is required"),
+            ({"y": ""}, "x and y parameters are required"),
+            ({"x": "Shaft Power"}, "Unknown parameter 'Shaft Power'"),
+            ({"degree": 7}, "degree must be between 1 and 6"),
+            ({"points": "many"}, "points must be an integer"),
+        ]:
+            with self.subTest(params=params):
+                response = self.fit(**params)
+                self.assertEqual((response.status_code, response.json()), (400, {"error": error}))
+
+
+class RendererTests(TestCase):
+    def test_output_matches_drf_json(self):
+        data = {
+            "date": datetime.date(2024, 1, 2),
+            "timestamp": datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+            "values": [1.5, None, "Sea"],
+            "nested": {"parameter_1": 2},
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_responses_are_compressed(self):
+        performance_cache().clear()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("zipper", password="zipper"))
+        seed_performance_data(vessels=1, days=10)
+        response = client.get("/api/performance/multiple/?resolution=raw&full_data=true", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.content))["resolution"], "raw")
+
+
+@override_settings(API_INSTRUMENTATION=True, API_METRICS_TOKEN=None)
+class InstrumentationTests(TestCase):
+    """Server-Timing header and Prometheus metrics of the instrumentation middleware."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("timer", password="timer")
+        cls.vessels, cls.parameters = seed_performance_data(vessels=2, days=10)
+
+    def setUp(self):
+        performance_cache().clear()
+        REGISTRY.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def server_timing(self, response):
+        entries = {}
+        for entry in response["Server-Timing"].split(", "):
+            name, *params = entry.split(";")
+            entries[name] = dict(param.split("=", 1) for param in params)
+        return entries
+
+    def test_server_timing(self):
+        url = f"/api/performance/multiple/?resolution=raw&full_data=true&vessel={self.vessels[0].id}"
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        timing = self.server_timing(response)
+
+        self.assertEqual(timing["db"]["desc"], f'"{len(queries.captured_queries)} queries"')
+        self.assertEqual(timing["rows"]["desc"], f'"{10 * len(self.parameters)}"')
+        self.assertEqual(timing["bytes"]["desc"], f'"{len(response.content)}"')
+        phases = sum(float(timing[phase]["dur"]) for phase in ("db", "pivot", "serialize"))
+        self.assertLessEqual(phases, float(timing["total"]["dur"]))
+
+    def test_metrics(self):
+        self.client.get(f"/api/performance/single/?vessel={self.vessels[0].id}")
+        b"".join(self.client.get(f"/api/download-excel/?format=csv&vessel={self.vessels[0].id}").streaming_content)
+        response = self.client.get("/api/metrics/")
+
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        metrics = response.content.decode()
+        self.assertIn('fleetsys_api_requests_total{endpoint="api:single-parameter",method="GET",status="200"} 1', metrics)
+        self.assertIn(f'fleetsys_api_rows_total{{endpoint="api:download_excel"}} {10 * len(self.parameters)}', metrics)
+        self.assertIn('fleetsys_api_phase_seconds_total{endpoint="api:download_excel",phase="export"}', metrics)
+        self.assertIn('fleetsys_api_cache_requests_total{endpoint="multiple",outcome="hit"} 0', metrics)
+
+    @override_settings(API_METRICS_TOKEN="scraper")
+    def test_metrics_token(self):
+        client = APIClient()
+        self.assertEqual(client.get("/api/metrics/").status_code, 401)
+        self.assertEqual(client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer scraper").status_code, 200)
+
+    @override_settings(API_INSTRUMENTATION=False)
+    def test_disabled(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f"/api/performance/single/?vessel={self.vessels[0].id}")
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(client.get("/api/metrics/").status_code, 404)
+
+
+class IngestionRunTests(TestCase):
+    """The run records of the Parser ingestion can be filtered and sorted by their phase times."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("importer", password="importer")
+        started = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+        for i, (status, seconds) in enumerate([("ok", 2.0), ("failed", 0.5), ("ok", 9.0)]):
+            IngestionRun.objects.create(
+                file_name=f"enr_{i}.xlsx", target_table="enr_enrparameter", status=status,
+                error="" if status == "ok" else "ValueError: bad sheet",
+                started_at=started + datetime.timedelta(hours=i), finished_at=started + datetime.timedelta(hours=i),
+                rows_melted=900, inserted=600, updated=100, db_seconds=seconds, total_seconds=seconds,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_newest_first(self):
+        results = self.client.get("/api/ingestion/runs/").json()["results"]
+        self.assertEqual([run["file_name"] for run in results], ["enr_2.xlsx", "enr_1.xlsx", "enr_0.xlsx"])
+        self.assertEqual(results[0]["rows_upserted"], 700)
+        self.assertEqual(results[0]["rows_per_sec"], 100.0)
+
+    def test_slowest_failed_and_filters(self):
+        slowest = self.client.get("/api/ingestion/runs/?ordering=-total_seconds").json()["results"]
+        self.assertEqual(slowest[0]["file_name"], "enr_2.xlsx")
+        failed = self.client.get("/api/ingestion/runs/?status=failed").json()["results"]
+        self.assertEqual([run["error"] for run in failed], ["ValueError: bad sheet"])
+        self.assertEqual(self.client.get("/api/ingestion/runs/?file=enr_0").json()["count"], 1)
+
+    def test_unknown_ordering_is_rejected(self):
+        self.assertEqual(self.client.get("/api/ingestion/runs/?ordering=error").status_code, 400)
@@ -1,8 +1,20 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     ProtectedView, ParameterListAPIView, VesselListAPIView,
-    ENRSingleParameterAPIView, ENRMultipleParameterAPIView, SeaTrialParameterAPIView, FilterOptionsView, DownloadExcelView
+    ENRSingleParameterAPIView, ENRMultipleParameterAPIView, SeaTrialParameterAPIView, FilterOptionsView, DownloadExcelView,
+    SeaTrialRegressionAPIView, CacheMetricsView, ENRCompareAPIView, MetricsView, IngestionRunListAPIView,
 )
+if settings.API_ASYNC_VIEWS:
+    # Served under ASGI, the same endpoints as async views
+    from .async_views import (
+        AsyncENRSingleParameterAPIView as ENRSingleParameterAPIView,
+        AsyncENRMultipleParameterAPIView as ENRMultipleParameterAPIView,
+        AsyncENRCompareAPIView as ENRCompareAPIView,
+        AsyncSeaTrialParameterAPIView as SeaTrialParameterAPIView,
+        AsyncFilterOptionsView as FilterOptionsView,
+        AsyncDownloadExcelView as DownloadExcelView,
+    )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
@@ -24,7 +36,13 @@ urlpatterns = [
     # Vessel Performance Endpoints
     path('performance/single/', ENRSingleParameterAPIView.as_view(), name='single-parameter'),
     path('performance/multiple/', ENRMultipleParameterAPIView.as_view(), name='multiple-parameter'),
+    path('performance/compare/', ENRCompareAPIView.as_view(), name='compare-vessels'),
     path('performance/seatrial/', SeaTrialParameterAPIView.as_view(), name='seatrial-parameter'),
+    path('performance/seatrial/regression/', SeaTrialRegressionAPIView.as_view(), name='seatrial-regression'),
+    path('cache/metrics/', CacheMetricsView.as_view(), name='cache-metrics'),
+    path('ingestion/runs/', IngestionRunListAPIView.as_view(), name='ingestion-runs'),
+    # Prometheus scrape target, with API_INSTRUMENTATION
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 
     # API Schema & Documentation
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
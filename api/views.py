@@ -1,23 +1,58 @@
+import datetime
+import hmac
+
+import numpy as np
+import pandas as pd
 from rest_framework import generics, serializers
 from rest_framework.generics import GenericAPIView
 from django.contrib.auth import authenticate
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from collections import defaultdict
-from enr.models import EnrParameter, ParameterList, VesselList, SeaTrialParameter
+from rest_framework.negotiation import DefaultContentNegotiation
+from enr.models import (
+    EnrParameter, ParameterList, VesselList, SeaTrialParameter, DataVersion, EnrParameterRollup,
+    MovementList, DisplacementList, IngestionRun, PartitionVersion,
+)
 from .serializers import (
     EnrParameterSerializer,
     SeaTrialParameterSerializer,
     ParameterListSerializer,
     VesselListSerializer,
+    IngestionRunSerializer,
     LoginSerializer,
+    lean_queryset,
+    lean_data,
 )
-import pandas as pd
-from django.http import HttpResponse
-from collections import defaultdict
+from .pivot import (
+    PIVOT_KEYS,
+    ROLLUP_PIVOT_KEYS,
+    ROLLUP_PIVOT_ORDERING,
+    RESOLUTIONS,
+    LAYOUTS,
+    columnar_rows,
+    compare_rows,
+    get_pivot_parameter_ids,
+    pivot_queryset,
+    pivot_all_rows,
+    pivot_frame_rows,
+    clean_pivot_rows,
+    rollup_queryset,
+    auto_resolution,
+    downsample_selector,
+)
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from enr.pivot import parameter_column, series_cube
+from enr.rollups import STATISTICS
+from enr.downsample import METHODS as DOWNSAMPLE_METHODS, series_indices
+from enr.regression import PAIR_KEYS, pair_values, fit_polynomial, sample_curve, sample_points
+from enr.storage import ENR_DATASET, SEATRIAL_DATASET, ColumnarStore, month_start
+from .exports import EXPORT_FORMATS, iter_export_blocks, iter_frame_blocks, pyarrow_available
+from .caching import cache_metrics, cached_by_partitions, cached_by_version, performance_cache
+from .instrumentation import METRICS_CONTENT_TYPE, add_rows, render_metrics, timed
+from .pagination import KeysetPagination
 
 # 🔹 FIX: Explicitly declare the serializer for `protected_view`
 class ProtectedViewSerializer(serializers.Serializer):
@@ -57,6 +92,10 @@ class ParameterListAPIView(generics.ListAPIView):
     def get_queryset(self):
         return ParameterList.objects.all().order_by("code")
 
+    @cached_by_version(DataVersion.PARAMETERS)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 # API View for listing vessels
 class VesselListAPIView(generics.ListAPIView):
     serializer_class = VesselListSerializer
@@ -65,15 +104,22 @@ class VesselListAPIView(generics.ListAPIView):
     def get_queryset(self):
         return VesselList.objects.all().order_by("id") 
 
+    @cached_by_version(DataVersion.VESSELS)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 # Base Pagination Class
-class CustomPagination(PageNumberPagination):
+class CustomPagination(KeysetPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
 
 # Common Filtering Logic
 class FilteredEnrParameterMixin:
-    def get_filtered_queryset(self, base_queryset):
+    # Field the start_date / end_date range applies to
+    date_field = "date"
+
+    def get_filtered_queryset(self, base_queryset, date_field=None):
         selected_vessel = self.request.GET.get("vessel")
         selected_parameter = self.request.GET.get("parameter")
         selected_movement = self.request.GET.get("movement")
@@ -85,24 +131,87 @@ class FilteredEnrParameterMixin:
             base_queryset = base_queryset.filter(vessel=selected_vessel)
         if selected_parameter:
             base_queryset = base_queryset.filter(parameter=selected_parameter)
+        # Movement and displacement are filtered by label, through their lookup tables
         if selected_movement:
-            base_queryset = base_queryset.filter(movement=selected_movement)
+            base_queryset = base_queryset.filter(movement__name=selected_movement)
         if selected_displacement:
-            base_queryset = base_queryset.filter(displacement=selected_displacement)
+            base_queryset = base_queryset.filter(displacement__name=selected_displacement)
         if start_date and end_date:
-            base_queryset = base_queryset.filter(date__range=[start_date, end_date])
+            base_queryset = base_queryset.filter(**{f"{date_field or self.date_field}__range": [start_date, end_date]})
 
         return base_queryset
 
+    def get_selected_parameters(self):
+        """The ``parameters`` filter (repeatable) as sorted distinct ids, empty when not given."""
+        try:
+            return sorted({int(parameter) for parameter in self.request.GET.getlist("parameters")})
+        except ValueError:
+            raise ValueError("parameters must be parameter ids")
+
+    def read_columnar(self, dataset, parameters=None):
+        """
+        The rows of the columnar store (enr.storage) matching the same filters,
+        None when no store is configured, the filters are not valid or a
+        partition they cover is missing from the store or older than its
+        PartitionVersion (not synced yet, or a failed sync), in which case the
+        database is read instead.
+        """
+        store = ColumnarStore.from_settings()
+        if store is None:
+            return None
+        selected_vessel = self.request.GET.get("vessel")
+        start_date = self.request.GET.get("start_date")
+        end_date = self.request.GET.get("end_date")
+        try:
+            vessels = [int(selected_vessel)] if selected_vessel else None
+            start, end = (
+                (datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date))
+                if start_date and end_date else (None, None)
+            )
+            equals = {}
+            for name in ("parameter", "movement", "displacement"):
+                if self.request.GET.get(name):
+                    equals[name] = int(self.request.GET[name]) if name == "parameter" else self.request.GET[name]
+        except ValueError:
+            return None
+        versions = PartitionVersion.objects.filter(dataset=dataset.name)
+        if vessels:
+            versions = versions.filter(vessel__in=vessels)
+        if start:
+            versions = versions.filter(month__range=(month_start(start), month_start(end)))
+        versions = {(vessel, month): version for vessel, month, version in versions.values_list("vessel", "month", "version")}
+        if store.stale_partitions(dataset, versions):
+            return None
+        return store.read(dataset, vessels=vessels, start=start, end=end, parameters=parameters, equals=equals)
+
+# Lean list of parameter rows
+class LeanListMixin:
+    """
+    list() from values() rows with the parameter description joined, instead of
+    serializing model instances that each look their parameter up again.
+    The serializer class still describes the fields (and the API schema).
+    """
+    def list(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        queryset = lean_queryset(self.filter_queryset(self.get_queryset()), serializer_class)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            add_rows(len(page))
+            return self.get_paginated_response(lean_data(page, serializer_class))
+        data = lean_data(queryset, serializer_class)
+        add_rows(len(data))
+        return Response(data)
+
 # Vessel-Performance
 # Vessel Performance API View (Single Parameter)
-class ENRSingleParameterAPIView(FilteredEnrParameterMixin, generics.ListAPIView):
+class ENRSingleParameterAPIView(LeanListMixin, FilteredEnrParameterMixin, generics.ListAPIView):
     serializer_class = EnrParameterSerializer
     pagination_class = CustomPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return self.get_filtered_queryset(EnrParameter.objects.all()).order_by("date")
+        return self.get_filtered_queryset(EnrParameter.objects.all()).order_by("date", "id")
 
 # Vessel Performance API View (Multiple Parameters)
 class ENRMultipleParameterAPIView(FilteredEnrParameterMixin, generics.ListAPIView):
@@ -112,131 +221,470 @@ class ENRMultipleParameterAPIView(FilteredEnrParameterMixin, generics.ListAPIVie
 
     def get_queryset(self):
         queryset = self.get_filtered_queryset(EnrParameter.objects.all())
-        selected_parameters = self.request.GET.getlist("parameters")  
+        selected_parameters = self.get_selected_parameters()
         if selected_parameters:
             queryset = queryset.filter(parameter__in=selected_parameters)  
         return queryset.order_by("-date")
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        full_data_requested = request.GET.get("full_data") == "true"
+    def get_resolution(self):
+        """
+        raw, day, week or month. ``resolution=auto`` (the default) picks rollups
+        for long ranges, but never when movement or displacement is filtered,
+        as rollups aggregate over both.
+        """
+        resolution = self.requested_resolution()
+        if resolution != "auto":
+            return resolution
+        return auto_resolution(self.get_rollups(), self.request.GET.get("start_date"), self.request.GET.get("end_date"))
+
+    def requested_resolution(self):
+        """The resolution parameter, validated, "auto" when it is left to the stored rollups."""
+        resolution = self.request.GET.get("resolution", "auto")
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution '{resolution}', expected one of: {', '.join(RESOLUTIONS)}")
+        split_by_voyage = self.request.GET.get("movement") or self.request.GET.get("displacement")
+        if resolution == "auto" and split_by_voyage:
+            return "raw"
+        if resolution not in ("auto", "raw") and split_by_voyage:
+            raise ValueError("Rollups cannot be filtered by movement or displacement, use resolution=raw")
+        return resolution
+
+    def get_rollups(self):
+        return self.get_filtered_queryset(EnrParameterRollup.objects.all(), date_field="period_start")
+
+    def get_statistic(self):
+        statistic = self.request.GET.get("statistic", "mean")
+        if statistic not in STATISTICS:
+            raise ValueError(f"Unsupported statistic '{statistic}', expected one of: {', '.join(STATISTICS)}")
+        return statistic
+
+    def get_pivot_source(self, resolution, statistic):
+        """(queryset, pivot_queryset / pivot_all_rows options) of the resolution."""
+        if resolution == "raw":
+            return self.get_queryset(), {}
+        # Pre-aggregated (vessel, parameter, period) values, one column per parameter
+        queryset = self.get_filtered_queryset(rollup_queryset(resolution), date_field="period_start")
+        selected_parameters = self.get_selected_parameters()
+        if selected_parameters:
+            queryset = queryset.filter(parameter__in=selected_parameters)
+        return queryset, {"keys": ROLLUP_PIVOT_KEYS, "ordering": ROLLUP_PIVOT_ORDERING, "value": statistic}
 
-        raw_data = list(queryset.values("vessel", "date", "movement", "displacement", "parameter", "value"))
-
-        # Unpivoting data
-        grouped_data = defaultdict(lambda: {"parameters": {}})
-        for entry in raw_data:
-            key = (entry["vessel"], entry["date"], entry["movement"], entry["displacement"])
-            if key not in grouped_data:
-                grouped_data[key] = {
-                    "vessel": entry["vessel"],
-                    "date": entry["date"],
-                    "movement": entry["movement"],
-                    "displacement": entry["displacement"],
-                    "parameters": {}
-                }
-            grouped_data[key]["parameters"][f"parameter_{entry['parameter']}"] = entry["value"]
+    def get_columnar(self):
+        """
+        ``layout=columnar`` returns the results as one list per column
+        (enr.pivot.pivot_columns) instead of one object per row, which does not
+        repeat every key name in every row.
+        """
+        layout = self.request.GET.get("layout", "rows")
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unsupported layout '{layout}', expected one of: {', '.join(LAYOUTS)}")
+        return layout == "columnar"
 
-        formatted_data = []
-        for key, value in grouped_data.items():
-            formatted_entry = value.copy()
-            formatted_entry.update(value["parameters"])
-            del formatted_entry["parameters"]
-            formatted_data.append(formatted_entry)
+    @cached_by_partitions("multiple", ENR_DATASET)
+    def list(self, request, *args, **kwargs):
+        full_data_requested = request.GET.get("full_data") == "true"
+        try:
+            selected_parameters = self.get_selected_parameters()
+            resolution = self.get_resolution()
+            statistic = self.get_statistic()
+            select = _downsample_select(request)
+            columnar = self.get_columnar()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        queryset, pivot = self.get_pivot_source(resolution, statistic)
+
+        if full_data_requested and resolution == "raw":
+            # Raw chart series from the columnar store when there is one
+            frame = self.read_columnar(ENR_DATASET, selected_parameters or None)
+            if frame is not None:
+                parameter_ids = selected_parameters or sorted(set(frame["parameter"]))
+                return Response({
+                    "resolution": resolution,
+                    "results": pivot_frame_rows(frame, parameter_ids, select, columnar=columnar),
+                })
+
+        parameter_ids = get_pivot_parameter_ids(queryset, selected_parameters)
 
         if full_data_requested:
             # Return all data (for chart) without pagination
-            return Response({"results": formatted_data})
+            return Response({
+                "resolution": resolution,
+                "results": pivot_all_rows(queryset, parameter_ids, select=select, columnar=columnar, **pivot),
+            })
 
-        # Apply pagination for table
-        page = self.paginate_queryset(formatted_data)
+        # Pivot (vessel, date, movement, displacement) keys in the database
+        pivoted = pivot_queryset(queryset, parameter_ids, **pivot)
+
+        # Apply pagination for table, only the keys of this page are aggregated
+        page = self.paginate_queryset(pivoted)
         if page is not None:  # Ensure pagination is applied correctly
-            return self.get_paginated_response(page)
+            response = self.get_paginated_response(self.page_results(clean_pivot_rows(page), pivot, columnar))
+            response.data["resolution"] = resolution
+            return response
 
         # Fallback if pagination fails (shouldn't happen)
-        return Response({"results": formatted_data})   
-    
+        return Response({
+            "resolution": resolution,
+            "results": self.page_results(clean_pivot_rows(pivoted), pivot, columnar),
+        })
+
+    @staticmethod
+    def page_results(rows, pivot, columnar):
+        return columnar_rows(rows, pivot.get("keys", PIVOT_KEYS)) if columnar else rows
+
+
+class ENRCompareAPIView(ENRMultipleParameterAPIView):
+    """
+    Several vessels side by side: ``vessels`` (repeatable, default every vessel
+    with data) and ``parameters`` are read in one query and returned as
+    columns, one shared date axis and per vessel a value array per parameter
+    aligned to it. Resolutions and filters are those of
+    ENRMultipleParameterAPIView.
+    """
+    pagination_class = None
+
+    def get_vessels(self):
+        try:
+            return sorted({int(vessel) for vessel in self.request.GET.getlist("vessels")})
+        except ValueError:
+            raise ValueError("vessels must be vessel ids")
+
+    def get_vessel_filtered(self, queryset):
+        vessels = self.get_vessels()
+        return queryset.filter(vessel__in=vessels) if vessels else queryset
+
+    def get_rollups(self):
+        return self.get_vessel_filtered(super().get_rollups())
+
+    def get_compare_source(self, resolution, statistic):
+        """(queryset, value column) of the resolution, for compare_rows."""
+        queryset, pivot = self.get_pivot_source(resolution, statistic)
+        return self.get_vessel_filtered(queryset), pivot.get("value", "value")
+
+    @cached_by_partitions("compare", ENR_DATASET)
+    def list(self, request, *args, **kwargs):
+        try:
+            vessels = self.get_vessels()
+            selected_parameters = self.get_selected_parameters()
+            resolution = self.get_resolution()
+            statistic = self.get_statistic()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        queryset, value = self.get_compare_source(resolution, statistic)
+        parameter_ids = get_pivot_parameter_ids(queryset, selected_parameters)
+        with timed("db"):
+            rows = list(compare_rows(queryset, parameter_ids, value))
+        return Response(compare_payload(resolution, rows, vessels or None, parameter_ids))
+
+
+def compare_payload(resolution, rows, vessels, parameter_ids):
+    """Columnar compare response of a list of (vessel, date, parameter, value) rows."""
+    add_rows(len(rows))
+    with timed("pivot"):
+        dates, vessels, parameter_ids, cube = series_cube(rows, vessels, parameter_ids)
+        columns = [parameter_column(parameter_id) for parameter_id in parameter_ids]
+        return {
+            "resolution": resolution,
+            "dates": dates,
+            "vessels": {
+                vessel: {
+                    # NaN is the only value that is not equal to itself
+                    column: [value if value == value else None for value in values]
+                    for column, values in zip(columns, series)
+                }
+                for vessel, series in zip(vessels, cube.tolist())
+            },
+        }
+
+
 class FilterOptionsView(APIView):
+    @cached_by_version(DataVersion.ENR)
     def get(self, request):
-        movements = EnrParameter.objects.values_list('movement', flat=True).distinct()
-        displacements = EnrParameter.objects.values_list('displacement', flat=True).distinct()
+        # The lookup tables hold every label once, no DISTINCT over the performance rows
+        movements = MovementList.objects.order_by("name").values_list("name", flat=True)
+        displacements = DisplacementList.objects.order_by("name").values_list("name", flat=True)
 
         return Response({
             "movements": list(movements),
             "displacements": list(displacements)
         })
     
+class CacheMetricsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Hits, misses and hit ratio of the performance query cache, per endpoint."""
+        return Response({
+            "backend": type(performance_cache()).__name__,
+            "endpoints": cache_metrics(),
+        })
+
+
+class MetricsView(APIView):
+    """
+    Request metrics of this process (api/instrumentation.py) and the
+    performance cache outcomes in the Prometheus text format. Prometheus sends
+    settings.API_METRICS_TOKEN as a bearer token when it is set, not a JWT.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    schema = None
+
+    def get(self, request):
+        if not settings.API_INSTRUMENTATION:
+            return Response({"error": "Instrumentation is disabled, set API_INSTRUMENTATION"}, status=404)
+        token = settings.API_METRICS_TOKEN
+        if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return Response({"error": "Invalid metrics token"}, status=401)
+        return HttpResponse(render_metrics(cache_metrics()), content_type=METRICS_CONTENT_TYPE)
+
+
+class IngestionRunListAPIView(generics.ListAPIView):
+    """
+    Run records of the Parser ingestion, newest first. ``status`` (ok /
+    failed), ``table`` and ``file`` (part of the file name) filter them,
+    ``ordering`` sorts them by a phase time to find the slow imports.
+    """
+    serializer_class = IngestionRunSerializer
+    permission_classes = [IsAuthenticated]
+    orderings = ("-started_at", "started_at", "-total_seconds", "-read_seconds", "-melt_seconds", "-db_seconds")
+
+    def get_queryset(self):
+        queryset = IngestionRun.objects.all()
+        if self.request.GET.get("status"):
+            queryset = queryset.filter(status=self.request.GET["status"])
+        if self.request.GET.get("table"):
+            queryset = queryset.filter(target_table=self.request.GET["table"])
+        if self.request.GET.get("file"):
+            queryset = queryset.filter(file_name__icontains=self.request.GET["file"])
+        return queryset.order_by(self.request.GET.get("ordering", "-started_at"), "-id")
+
+    def list(self, request, *args, **kwargs):
+        ordering = request.GET.get("ordering", "-started_at")
+        if ordering not in self.orderings:
+            return Response(
+                {"error": f"Unsupported ordering '{ordering}', expected one of: {', '.join(self.orderings)}"},
+                status=400,
+            )
+        return super().list(request, *args, **kwargs)
+
+
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    """
+    Content negotiation that leaves the ``format`` query parameter to the view,
+    used by the export view where it selects the file format instead of a renderer.
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
 class DownloadExcelView(FilteredEnrParameterMixin, APIView):
     permission_classes = [IsAuthenticated]
+    content_negotiation_class = IgnoreFormatContentNegotiation
 
     def get(self, request):
         """
-        Generate an Excel file from vessel performance data with applied filters.
-        Column headers for parameters will be replaced with parameter descriptions.
+        Stream a file from vessel performance data with applied filters.
+        ``format`` selects xlsx (default), csv, parquet or arrow (Arrow IPC stream).
+        Column headers for parameters will be replaced with parameter descriptions
+        (in the field metadata for parquet and arrow, whose fields keep the
+        unique parameter_<id> names).
+        Rows are pivoted and written block by block, so memory stays flat
+        regardless of how many rows are exported.
         """
-        # Get filtered queryset
+        error = self.export_format_error()
+        if error is not None:
+            return error
+        content_type, extension, writer, _ = EXPORT_FORMATS[request.GET.get("format", "xlsx")]
+        try:
+            selected_parameters = self.get_selected_parameters()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        # Get filtered queryset, or the same rows from the columnar store
         queryset = self.get_filtered_queryset(EnrParameter.objects.all())
-        selected_parameters = request.GET.getlist("parameters")
-        if selected_parameters:
-            queryset = queryset.filter(parameter__in=selected_parameters)
-
-        # Sort by descending date
-        queryset = queryset.order_by("-date")
-        raw_data = list(queryset.values("vessel", "date", "movement", "displacement", "parameter", "value"))
+        frame = self.read_columnar(ENR_DATASET, selected_parameters or None)
+        if frame is not None:
+            parameter_ids = selected_parameters or sorted(set(frame["parameter"]))
+            blocks = iter_frame_blocks(frame, parameter_ids)
+        else:
+            parameter_ids = get_pivot_parameter_ids(queryset, selected_parameters)
+            blocks = iter_export_blocks(queryset, parameter_ids)
 
         # Build a mapping of parameter id to its description
         # Assumes that ParameterList has 'id' and 'description' fields.
         parameter_mapping = dict(ParameterList.objects.values_list("id", "description"))
-
-        # Unpivoting data (similar to your API view)
-        grouped_data = defaultdict(lambda: {"parameters": {}})
-        for entry in raw_data:
-            key = (entry["vessel"], entry["date"], entry["movement"], entry["displacement"])
-            if key not in grouped_data:
-                grouped_data[key] = {
-                    "vessel": entry["vessel"],
-                    "date": entry["date"],
-                    "movement": entry["movement"],
-                    "displacement": entry["displacement"],
-                    "parameters": {}
-                }
-            # Use raw parameter id as key for now
-            grouped_data[key]["parameters"][f"parameter_{entry['parameter']}"] = entry["value"]
-
-        formatted_data = []
-        for key, value in grouped_data.items():
-            formatted_entry = value.copy()
-            # Rename parameter keys using the description mapping
-            new_params = {}
-            for k, v in value["parameters"].items():
-                param_id = k.replace("parameter_", "")
-                # Replace with description if available
-                param_desc = parameter_mapping.get(int(param_id), k)
-                new_params[param_desc] = v
-            formatted_entry.update(new_params)
-            del formatted_entry["parameters"]
-            formatted_data.append(formatted_entry)
-
-        # Convert formatted data to DataFrame
-        df = pd.DataFrame(formatted_data)
-
-        # Prepare Excel response
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        response["Content-Disposition"] = 'attachment; filename="vessel_performance.xlsx"'
-
-        # Write DataFrame to Excel using openpyxl engine
-        with pd.ExcelWriter(response, engine="openpyxl") as writer:
-            df.to_excel(writer, sheet_name="Performance Data", index=False)
-
+        return self.export_response(writer(self.get_columns(parameter_ids, parameter_mapping), blocks), content_type, extension)
+
+    def export_format_error(self):
+        """Error response when the format parameter cannot be exported, else None."""
+        export_format = self.request.GET.get("format", "xlsx")
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Unsupported format '{export_format}', expected one of: {', '.join(EXPORT_FORMATS)}"},
+                status=400,
+            )
+        if EXPORT_FORMATS[export_format][3] and not pyarrow_available():
+            return Response({"error": f"The {export_format} format requires pyarrow to be installed"}, status=501)
+        return None
+
+    @staticmethod
+    def get_columns(parameter_ids, parameter_mapping):
+        """(column name, header) of the exported columns."""
+        return [(key, key) for key in PIVOT_KEYS] + [
+            (parameter_column(param_id), parameter_mapping.get(param_id, parameter_column(param_id)))
+            for param_id in parameter_ids
+        ]
+
+    @staticmethod
+    def export_response(content, content_type, extension):
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="vessel_performance.{extension}"'
         return response
     
 
 # Vessel-Seatrial
-class SeaTrialParameterAPIView(FilteredEnrParameterMixin, generics.ListAPIView):
+class SeaTrialParameterAPIView(LeanListMixin, FilteredEnrParameterMixin, generics.ListAPIView):
     serializer_class = SeaTrialParameterSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated]
+    date_field = "timestamp__date"
 
     def get_queryset(self):
-        return self.get_filtered_queryset(SeaTrialParameter.objects.all()).order_by("timestamp")
+        return self.get_filtered_queryset(SeaTrialParameter.objects.all()).order_by("timestamp", "id")
+
+    @cached_by_partitions("seatrial", SEATRIAL_DATASET, DataVersion.PARAMETERS)
+    def list(self, request, *args, **kwargs):
+        """
+        ``max_points`` returns every (vessel, parameter) series downsampled to at
+        most that many readings along the timestamp axis, without pagination.
+        """
+        try:
+            max_points, method = _downsample_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if not max_points:
+            return super().list(request, *args, **kwargs)
+
+        serializer_class = self.get_serializer_class()
+        rows = list(lean_queryset(self.filter_queryset(self.get_queryset()), serializer_class))
+        return Response(downsample_trial_rows(rows, serializer_class, max_points, method))
+
+
+def downsample_trial_rows(rows, serializer_class, max_points, method):
+    """count and results of the sea-trial rows, every (vessel, parameter) series downsampled."""
+    add_rows(len(rows))
+    with timed("pivot"):
+        series, _ = pd.factorize(pd.Series([(row["vessel"], row["parameter"]) for row in rows], dtype=object))
+        timestamps = pd.to_datetime([row["timestamp"] for row in rows], utc=True).asi8
+        values = np.array([row["value"] for row in rows], dtype=float)
+        kept = series_indices(series, timestamps, values, max_points, method)
+    return {"count": len(rows), "results": lean_data([rows[i] for i in kept], serializer_class)}
+
+
+def _int_param(request, name, default, minimum, maximum):
+    value = request.GET.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if not minimum <= value <= maximum:
+        raise ValueError(f"{name} must be between {minimum} and {maximum}")
+    return value
+
+
+def _parameter_ids(value):
+    """Ids and label of the parameter given by id or by description."""
+    parameters = ParameterList.objects.all()
+    parameters = parameters.filter(pk=value) if value.isdigit() else parameters.filter(description=value)
+    rows = list(parameters.values_list("id", "description"))
+    return [row[0] for row in rows], (rows[0][1] if rows else value)
+
+
+class SeaTrialRegressionAPIView(FilteredEnrParameterMixin, APIView):
+    """
+    Polynomial fit of y against x over the sea-trial readings of one vessel,
+    paired by session and timestamp, e.g. FOC or ship speed against M/E power.
+    """
+    permission_classes = [IsAuthenticated]
+    date_field = "timestamp__date"
+
+    def get(self, request):
+        """
+        ``x`` and ``y`` take a parameter id or description, ``degree`` the
+        polynomial degree (default 2), ``points`` the number of curve samples
+        (default 100) and ``scatter`` the maximum number of raw pairs returned
+        (default 500, 0 leaves them out). vessel is required, displacement,
+        start_date and end_date filter the readings.
+        """
+        if not request.GET.get("vessel"):
+            return Response({"error": "vessel is required"}, status=400)
+        if not request.GET.get("x") or not request.GET.get("y"):
+            return Response({"error": "x and y parameters are required"}, status=400)
+        try:
+            degree = _int_param(request, "degree", 2, 1, 6)
+            points = _int_param(request, "points", 100, 2, 1000)
+            max_scatter = _int_param(request, "scatter", 500, 0, 10000)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        x_ids, x_label = _parameter_ids(request.GET["x"])
+        y_ids, y_label = _parameter_ids(request.GET["y"])
+        if not x_ids or not y_ids:
+            missing = request.GET["x"] if not x_ids else request.GET["y"]
+            return Response({"error": f"Unknown parameter '{missing}'"}, status=400)
+
+        frame = self.read_columnar(SEATRIAL_DATASET, x_ids + y_ids)
+        if frame is not None:
+            frame = frame.sort_values(PAIR_KEYS, kind="stable")
+            rows = frame[[*PAIR_KEYS, "parameter", "value"]].itertuples(index=False, name=None)
+        else:
+            rows = (
+                self.get_filtered_queryset(SeaTrialParameter.objects.all())
+                .filter(parameter__in=x_ids + y_ids)
+                .order_by("session", "timestamp", "id")
+                .values_list("session", "timestamp", "parameter", "value")
+            )
+        with timed("pivot"):
+            x, y = pair_values(rows, x_ids, y_ids)
+
+        result = {
+            "x_parameter": x_label,
+            "y_parameter": y_label,
+            "degree": degree,
+            "n": len(x),
+            "coefficients": None,
+            "r_squared": None,
+            "curve": [],
+            "scatter": [],
+        }
+        if max_scatter:
+            scatter_x, scatter_y = sample_points(x, y, max_scatter)
+            result["scatter"] = [{"x": a, "y": b} for a, b in zip(scatter_x.tolist(), scatter_y.tolist())]
+
+        # A degree n fit needs at least n + 1 distinct x values
+        if len(np.unique(x)) > degree:
+            coefficients, r_squared = fit_polynomial(x, y, degree)
+            curve_x, curve_y = sample_curve(coefficients, x.min(), x.max(), points)
+            result["coefficients"] = coefficients.tolist()
+            result["r_squared"] = r_squared
+            result["curve"] = [{"x": a, "y": b} for a, b in zip(curve_x.tolist(), curve_y.tolist())]
+        return Response(result)
+
+
+def _downsample_params(request):
+    """(max_points, method) of a chart request, max_points None when not downsampling."""
+    method = request.GET.get("downsample", "lttb")
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unsupported downsample '{method}', expected one of: {', '.join(DOWNSAMPLE_METHODS)}")
+    return _int_param(request, "max_points", None, 3, 100000), method
+
+
+def _downsample_select(request):
+    max_points, method = _downsample_params(request)
+    return downsample_selector(max_points, method) if max_points else None
+
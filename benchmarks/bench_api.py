@@ -0,0 +1,218 @@
+"""
+API endpoint benchmark on synthetic fleet data.
+
+The run creates a test database (the test copy of the configured database,
+e.g. a local MySQL, or in-memory SQLite with --sqlite). For every scale it is
+emptied and filled by benchmarks.fleet_data, then every endpoint of api/urls.py is
+requested through the Django test client, the exports included. Reports per
+endpoint the median / p95 latency of --repeat requests, the number of queries
+and the peak Python memory of one request (tracemalloc, measured on a run of
+its own as tracing slows everything down).
+
+The caches are cleared before every request so the numbers are those of a
+cold request, --warm keeps them between the repeats.
+
+    python -m benchmarks.bench_api --sqlite --scale small medium --json api.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fleet_data import FIRST_DAY, Scale, generate_fleet
+
+USERNAME = "bench"
+PASSWORD = "bench-password"
+
+
+def setup_django(sqlite=False):
+    """Configure Django for the benchmarks, on an in-memory SQLite database with sqlite."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fleetsys.settings")
+    import django
+    from django.conf import settings
+    from django.test.utils import setup_test_environment
+
+    if sqlite:
+        settings.DATABASES["default"] = {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+    # Schema generation warnings are not what is measured
+    settings.SPECTACULAR_SETTINGS = {**getattr(settings, "SPECTACULAR_SETTINGS", {}), "DISABLE_ERRORS_AND_WARNINGS": True}
+    django.setup()
+    # As in production: DEBUG keeps every query in memory
+    setup_test_environment(debug=False)
+
+
+@contextlib.contextmanager
+def test_database():
+    """A freshly migrated test database, dropped afterwards."""
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def clear_caches():
+    from django.conf import settings
+    from django.core.cache import caches
+
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def endpoint_requests(fleet, user):
+    """(label, url name, method, query or body) of every benchmarked request."""
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    vessel, vessels, parameters = fleet["vessels"][0], fleet["vessels"][:5], fleet["parameters"]
+    year = {"start_date": FIRST_DAY.isoformat(), "end_date": (FIRST_DAY + datetime.timedelta(days=364)).isoformat()}
+    chart = {"vessel": vessel, "parameters": parameters[:5], "full_data": "true", "max_points": 800}
+    return [
+        ("token", "token_obtain_pair", "post", {"username": USERNAME, "password": PASSWORD}),
+        # A refresh token can only be used once, every request gets a new one
+        ("token_refresh", "token_refresh", "post", lambda: {"refresh": str(RefreshToken.for_user(user))}),
+        ("protected", "protected", "get", {}),
+        ("parameters", "parameter-list", "get", {}),
+        ("vessels", "vessel-list", "get", {}),
+        ("filters", "filters", "get", {}),
+        ("single", "single-parameter", "get", {"vessel": vessel, "parameter": parameters[0], **year}),
+        ("multiple_page", "multiple-parameter", "get", {"resolution": "raw", "count": "true", "page_size": 100}),
+        ("multiple_chart_raw", "multiple-parameter", "get", {**chart, "resolution": "raw"}),
+        ("multiple_chart_columnar", "multiple-parameter", "get", {**chart, "resolution": "raw", "layout": "columnar"}),
+        ("multiple_chart_auto", "multiple-parameter", "get", {**chart, "resolution": "auto"}),
+        ("compare", "compare-vessels", "get", {"vessels": vessels, "parameters": parameters[:5], **year}),
+        ("seatrial", "seatrial-parameter", "get", {"vessel": vessel, "page_size": 100}),
+        ("seatrial_chart", "seatrial-parameter", "get", {"vessel": vessel, "max_points": 500}),
+        ("seatrial_regression", "seatrial-regression", "get", {"vessel": vessel, "x": parameters[0], "y": parameters[1]}),
+        ("cache_metrics", "cache-metrics", "get", {}),
+        ("metrics", "metrics", "get", {}),
+        ("ingestion_runs", "ingestion-runs", "get", {}),
+        ("schema", "schema", "get", {}),
+        ("docs", "swagger-ui", "get", {}),
+        ("redoc", "redoc", "get", {}),
+        ("export_xlsx", "download_excel", "get", {"vessel": vessel, "format": "xlsx"}),
+        ("export_csv", "download_excel", "get", {"vessel": vessel, "format": "csv"}),
+    ]
+
+
+def unbenchmarked_urls(requests):
+    """Names of the api/urls.py endpoints endpoint_requests leaves out."""
+    from api.urls import urlpatterns
+
+    return sorted({pattern.name for pattern in urlpatterns} - {url_name for _, url_name, _, _ in requests})
+
+
+def send(client, method, path, data):
+    """(response, body bytes) of one request, streamed bodies are read to the end."""
+    data = data() if callable(data) else data
+    response = client.post(path, data, format="json") if method == "post" else client.get(path, data)
+    content = b"".join(response.streaming_content) if response.streaming else response.content
+    return response, content
+
+
+def measure(client, method, path, data, repeat, warm=False):
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+
+    # Imports, URL resolution and first-use setup are not part of the numbers
+    send(client, method, path, data)
+    latencies = []
+    for _ in range(repeat):
+        if not warm:
+            clear_caches()
+        # Every request empties the query log (request_started), the capture has to start from an empty one
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response, content = send(client, method, path, data)
+            latencies.append(time.perf_counter() - start)
+        query_count = len(queries.captured_queries)
+
+    if not warm:
+        clear_caches()
+    tracemalloc.start()
+    try:
+        send(client, method, path, data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "status": response.status_code,
+        "bytes": len(content),
+        "queries": query_count,
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, round(0.95 * (len(latencies) - 1)))] * 1000,
+        "min_ms": latencies[0] * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def run(scales, repeat=5, warm=False, seed=0, endpoints=None, report=print):
+    """Benchmark result dicts of every endpoint at every scale."""
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    results = []
+    with test_database():
+        for scale in scales:
+            call_command("flush", interactive=False, verbosity=0)
+            start = time.perf_counter()
+            fleet = generate_fleet(scale, seed)
+            report(f"Scale {scale.label}: {scale.enr_rows:,} ENR and {scale.trial_rows:,} sea-trial rows "
+                   f"generated in {time.perf_counter() - start:.1f}s on {connection.vendor}")
+            user = User.objects.create_user(USERNAME, password=PASSWORD)
+            client = APIClient()
+            client.force_authenticate(user)
+
+            requests = endpoint_requests(fleet, user)
+            for url_name in unbenchmarked_urls(requests):
+                report(f"  Not benchmarked: {url_name}")
+            for label, url_name, method, data in requests:
+                if endpoints and label not in endpoints:
+                    continue
+                result = measure(client, method, reverse(f"api:{url_name}"), data, repeat, warm)
+                results.append({
+                    "benchmark": "api", "scale": scale.as_dict(), "database": connection.vendor,
+                    "endpoint": label, "warm": warm, **result,
+                })
+                report(f"  {label:<24} {result['median_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['queries']:>8} "
+                       f"{result['peak_kib']:>10.0f} {result['bytes']:>11,} {result['status']:>6}")
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument("--scale", nargs="+", default=["small", "medium"], help="small, medium, large or VxPxD")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed requests per endpoint")
+    parser.add_argument("--warm", action="store_true", help="Keep the caches between the timed requests")
+    parser.add_argument("--endpoint", action="append", help="Only this endpoint label (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--sqlite", action="store_true", help="In-memory SQLite instead of the configured database")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    setup_django(sqlite=args.sqlite)
+    print(f"  {'endpoint':<24} {'median ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KiB':>10} {'bytes':>11} {'status':>6}")
+    results = run([Scale.parse(scale) for scale in args.scale], args.repeat, args.warm, args.seed, args.endpoint)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Ingestion throughput benchmark against a MySQL database.
+
+Times the per-cell SELECT/INSERT loop the parser scripts used to run against
+Parser/ingestion.py on the same synthetic melted workbook. Point it at a
+scratch database migrated with ``manage.py migrate``; the benchmark creates
+its own vessel and parameter codes and deletes them afterwards.
+
+    python -m benchmarks.bench_ingestion --database fleetsys_bench --rows 10000 50000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Parser"))
+import ingestion  # noqa: E402
+
+BENCH_VESSEL = "BENCH"
+BENCH_PREFIX = "BENCH_"
+
+
+def synthetic_melted(n_rows, vessel_id, n_parameters=50, seed=0):
+    """Melted frame shaped like the output of unpivot_frame for an ENR workbook."""
+    rng = np.random.default_rng(seed)
+    n_days = max(1, -(-n_rows // n_parameters))
+    dates = pd.date_range("2020-01-01", periods=n_days, freq="D")
+    frame = pd.DataFrame({
+        "Vessel": str(vessel_id),
+        "Date": np.repeat(dates, n_parameters),
+        "Movement": np.where(np.arange(n_days * n_parameters) % 3, "Sea", "Port"),
+        "Displacement": "Laden",
+        "Parameter": np.tile([f"{BENCH_PREFIX}{i:03d}" for i in range(n_parameters)], n_days),
+        "Value": rng.random(n_days * n_parameters) * 100,
+    })
+    return frame.head(n_rows)
+
+
+def legacy_ingest(connection, melted_df):
+    """The per-cell loop previously run by the parser scripts."""
+    with connection.cursor() as cursor:
+        for lookup, column in (("enr_movementlist", "Movement"), ("enr_displacementlist", "Displacement")):
+            labels = melted_df[column].dropna().astype(str).unique()
+            cursor.executemany(f"INSERT IGNORE INTO {lookup} (name) VALUES (%s)", [(label,) for label in labels])
+        for row in melted_df.itertuples(index=False):
+            cursor.execute("SELECT id FROM enr_vessellist WHERE id = %s", (row.Vessel,))
+            if not cursor.fetchone():
+                continue
+            cursor.execute("SELECT id FROM enr_parameterlist WHERE code = %s", (row.Parameter,))
+            if not cursor.fetchone():
+                cursor.execute("INSERT INTO enr_parameterlist (code, description, is_calculated) VALUES (%s, %s, %s)",
+                               (row.Parameter, f"Description for {row.Parameter}", 0))
+                connection.commit()
+            cursor.execute("SELECT id FROM enr_parameterlist WHERE code = %s", (row.Parameter,))
+            parameter_id = cursor.fetchone()[0]
+            cursor.execute("""
+            INSERT INTO enr_enrparameter (vessel_id, date, movement_id, displacement_id, parameter_id, value)
+            VALUES (%s, %s, (SELECT id FROM enr_movementlist WHERE name = %s),
+                    (SELECT id FROM enr_displacementlist WHERE name = %s), %s, %s)
+            ON DUPLICATE KEY UPDATE
+                movement_id = VALUES(movement_id),
+                displacement_id = VALUES(displacement_id),
+                value = VALUES(value);
+            """, (row.Vessel, row.Date, row.Movement, row.Displacement, parameter_id, row.Value))
+        connection.commit()
+
+
+def setup(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO enr_vessellist (vesselname, description) VALUES (%s, %s)",
+                       (BENCH_VESSEL, "Ingestion benchmark"))
+        vessel_id = cursor.lastrowid
+    connection.commit()
+    return vessel_id
+
+
+def cleanup(connection, vessel_id):
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM enr_enrparameter WHERE vessel_id = %s", (vessel_id,))
+        cursor.execute("DELETE FROM enr_parameterlist WHERE code LIKE %s", (BENCH_PREFIX + "%",))
+        cursor.execute("DELETE FROM enr_vessellist WHERE id = %s", (vessel_id,))
+    connection.commit()
+
+
+def cleanup_rows(connection, vessel_id):
+    """Start every run from an empty table so both paths insert the same rows."""
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM enr_enrparameter WHERE vessel_id = %s", (vessel_id,))
+        cursor.execute("DELETE FROM enr_parameterlist WHERE code LIKE %s", (BENCH_PREFIX + "%",))
+    connection.commit()
+
+
+def run(sizes):
+    results = []
+    connection = ingestion.connect()
+    vessel_id = setup(connection)
+    try:
+        for size in sizes:
+            melted = synthetic_melted(size, vessel_id)
+
+            cleanup_rows(connection, vessel_id)
+            start = time.perf_counter()
+            legacy_ingest(connection, melted)
+            legacy_seconds = time.perf_counter() - start
+
+            cleanup_rows(connection, vessel_id)
+            result = ingestion.ingest(melted, ingestion.ENR_TABLE, connection=connection)
+
+            results.append({
+                "rows": size,
+                "legacy_rows_per_sec": size / legacy_seconds,
+                "bulk_rows_per_sec": result.rows_per_sec,
+            })
+    finally:
+        cleanup(connection, vessel_id)
+        connection.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--database", default=ingestion.DB_SETTINGS["database"])
+    args = parser.parse_args()
+    ingestion.DB_SETTINGS["database"] = args.database
+
+    print(f"{'rows':>10} {'per-row loop':>14} {'bulk upsert':>14}  (rows/sec)")
+    for result in run(args.rows):
+        print(f"{result['rows']:>10} {result['legacy_rows_per_sec']:>14,.0f} {result['bulk_rows_per_sec']:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Parser benchmark on synthetic workbooks.
+
+Writes an ENR workbook (Sheet3) and a sea-trial workbook (Sheet2) of every
+scale with benchmarks.fleet_data, and times parse_file of
+Parser/enrv3_parser.py and Parser/seatrial_parser.py on them: reading the
+sheet and melting it into one row per (key, parameter) value, with the read
+and melt phases of their ParseStats reported apart. The read phase (see
+Parser/workbook.py, calamine or streamed openpyxl, chosen with --engine) is
+compared with the plain ``pd.read_excel(path, sheet_name=...)`` call the
+parsers used before, timed on the same workbook. Peak memory is measured with
+tracemalloc on a run of its own. Use the large scale or VxPxD for workbooks
+the size of the real ones.
+
+With --ingest the parsed rows are also written through Parser/ingestion.py
+into a scratch MySQL database migrated with ``manage.py migrate``, as in
+bench_ingestion; the benchmark creates its own vessels and parameter codes and
+deletes them afterwards.
+
+    python -m benchmarks.bench_parsers --scale small medium --json parsers.json
+    python -m benchmarks.bench_parsers --scale 20x150x730 --engine openpyxl
+    python -m benchmarks.bench_parsers --scale small --ingest --database fleetsys_bench
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.fleet_data import PARAMETER_PREFIX, Scale, enr_workbook, seatrial_workbook
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Parser"))
+import enrv3_parser  # noqa: E402
+import ingestion  # noqa: E402
+import seatrial_parser  # noqa: E402
+import workbook as workbook_reader  # noqa: E402
+
+# parser label: (module, workbook builder, sheet, ingestion table)
+PARSERS = {
+    "enr": (enrv3_parser, enr_workbook, "Sheet3", ingestion.ENR_TABLE),
+    "seatrial": (seatrial_parser, seatrial_workbook, "Sheet2", ingestion.SEATRIAL_TABLE),
+}
+
+
+def create_vessels(connection, count):
+    with connection.cursor() as cursor:
+        ids = []
+        for i in range(count):
+            cursor.execute("INSERT INTO enr_vessellist (vesselname, description) VALUES (%s, %s)",
+                           (f"BENCH parser {i}", "Parser benchmark"))
+            ids.append(cursor.lastrowid)
+    connection.commit()
+    return ids
+
+
+def delete_vessels(connection, vessel_ids):
+    """Remove everything the ingestion wrote for the benchmark vessels."""
+    vessels = ingestion._in_clause(vessel_ids)
+    with connection.cursor() as cursor:
+        for table in ("enr_enrparameter", "enr_seatrialparameter", "enr_enrparameterrollup"):
+            cursor.execute(f"DELETE FROM {table} WHERE vessel_id IN ({vessels})", vessel_ids)
+        cursor.execute(f"DELETE FROM enr_partitionversion WHERE vessel IN ({vessels})", vessel_ids)
+        cursor.execute("DELETE FROM enr_parameterlist WHERE code LIKE %s", (PARAMETER_PREFIX + "%",))
+        cursor.execute(f"DELETE FROM enr_vessellist WHERE id IN ({vessels})", vessel_ids)
+    connection.commit()
+
+
+def peak_memory(func, *args):
+    """Peak traced memory (bytes) of one func(*args) call."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def read_excel_seconds(path, sheet, repeat):
+    """Median seconds of the pd.read_excel call the parsers made before Parser/workbook.py."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pd.read_excel(path, sheet_name=sheet, dtype={"Vessel": str})
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+def run(scales, repeat=3, ingest=False, seed=0, report=print):
+    """Benchmark result dicts of both parsers at every scale."""
+    results = []
+    connection = ingestion.connect() if ingest else None
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales:
+            vessel_ids = create_vessels(connection, scale.vessels) if ingest else list(range(1, scale.vessels + 1))
+            try:
+                for label, (parser, workbook, sheet, table) in PARSERS.items():
+                    path = Path(directory) / f"{label}_{scale.label}.xlsx"
+                    frame = workbook(scale, vessel_ids, seed)
+                    frame.to_excel(path, sheet_name=sheet, index=False)
+
+                    seconds, phases = [], []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        melted, invalid, stats = parser.parse_file(path)
+                        seconds.append(time.perf_counter() - start)
+                        phases.append(stats)
+                    result = {
+                        "benchmark": "parser", "parser": label, "scale": scale.as_dict(),
+                        "workbook_rows": len(frame), "workbook_bytes": path.stat().st_size, "melted_rows": len(melted),
+                        "parse_median_s": statistics.median(seconds), "parse_min_s": min(seconds),
+                        "read_median_s": statistics.median(stats.read_seconds for stats in phases),
+                        "melt_median_s": statistics.median(stats.melt_seconds for stats in phases),
+                        "engine": workbook_reader.DEFAULT_ENGINE,
+                        "read_excel_median_s": read_excel_seconds(path, sheet, repeat),
+                        "parse_rows_per_sec": len(melted) / statistics.median(seconds),
+                        "peak_mib": peak_memory(parser.parse_file, path) / 2**20,
+                    }
+                    if ingest:
+                        written = ingestion.ingest(melted, table, blank_df=invalid, connection=connection)
+                        result["ingest_s"] = written.seconds
+                        result["ingest_rows_per_sec"] = written.rows_per_sec
+                    results.append(result)
+                    report(f"{label:>9} {scale.label:>12} {len(melted):>10,} {result['parse_median_s']:>9.2f} "
+                           f"{result['read_median_s']:>8.2f} {result['read_excel_median_s']:>12.2f} "
+                           f"{result['melt_median_s']:>8.2f} "
+                           f"{result['parse_rows_per_sec']:>12,.0f} {result['peak_mib']:>9.1f} "
+                           + (f"{result['ingest_rows_per_sec']:>12,.0f}" if ingest else f"{'-':>12}"))
+            finally:
+                if ingest:
+                    delete_vessels(connection, vessel_ids)
+    if connection is not None:
+        connection.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", nargs="+", default=["small", "medium"], help="small, medium, large or VxPxD")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed parses per workbook")
+    parser.add_argument("--ingest", action="store_true", help="Also write the rows into MySQL")
+    parser.add_argument("--database", default=ingestion.DB_SETTINGS["database"], help="MySQL database for --ingest")
+    parser.add_argument("--engine", choices=workbook_reader.ENGINES, default=workbook_reader.DEFAULT_ENGINE,
+                        help="Workbook reader of the parsers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+    ingestion.DB_SETTINGS["database"] = args.database
+    workbook_reader.DEFAULT_ENGINE = args.engine
+
+    print(f"{'parser':>9} {'scale':>12} {'rows':>10} {'parse s':>9} {'read s':>8} {'read_excel s':>12} {'melt s':>8} {'rows/sec':>12} {'peak MiB':>9} {'ingest r/s':>12}")
+    results = run([Scale.parse(scale) for scale in args.scale], args.repeat, args.ingest, args.seed)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Pivot / unpivot throughput benchmark.
+
+Compares the per-row dict loop the API and Excel export used to run with the
+vectorized helpers in enr.pivot, and DataFrame.melt with enr.pivot.unpivot_frame.
+
+    python -m benchmarks.bench_pivot
+    python -m benchmarks.bench_pivot --sizes 10000 100000
+"""
+import argparse
+import datetime
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from enr.pivot import ENR_KEYS, pivot_records, unpivot_frame
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+N_PARAMETERS = 50
+
+
+def synthetic_rows(n_rows, n_parameters=N_PARAMETERS, n_vessels=5, seed=0):
+    """Long (vessel, date, movement, displacement, parameter, value) tuples."""
+    rng = np.random.default_rng(seed)
+    n_keys = max(1, n_rows // n_parameters)
+    start = datetime.date(2020, 1, 1)
+    rows = []
+    for key in range(n_keys):
+        vessel = key % n_vessels + 1
+        date = start + datetime.timedelta(days=key // n_vessels)
+        movement = "Sea" if key % 3 else "Port"
+        displacement = "Laden" if key % 2 else "Ballast"
+        values = rng.random(n_parameters) * 100
+        for parameter in range(n_parameters):
+            rows.append((vessel, date, movement, displacement, parameter + 1, float(values[parameter])))
+    return rows[:n_rows]
+
+
+def legacy_pivot(rows):
+    """The defaultdict loop previously copied in the API view and Excel export."""
+    raw_data = [dict(zip(ENR_KEYS + ["parameter", "value"], row)) for row in rows]
+    grouped_data = defaultdict(lambda: {"parameters": {}})
+    for entry in raw_data:
+        key = (entry["vessel"], entry["date"], entry["movement"], entry["displacement"])
+        if key not in grouped_data:
+            grouped_data[key] = {
+                "vessel": entry["vessel"],
+                "date": entry["date"],
+                "movement": entry["movement"],
+                "displacement": entry["displacement"],
+                "parameters": {}
+            }
+        grouped_data[key]["parameters"][f"parameter_{entry['parameter']}"] = entry["value"]
+
+    formatted_data = []
+    for key, value in grouped_data.items():
+        formatted_entry = value.copy()
+        formatted_entry.update(value["parameters"])
+        del formatted_entry["parameters"]
+        formatted_data.append(formatted_entry)
+    return formatted_data
+
+
+def legacy_unpivot(df, keys):
+    """DataFrame.melt + to_numeric as previously done in the parsers."""
+    melted_df = df.melt(id_vars=keys, var_name="Parameter", value_name="Value")
+    melted_df["Value"] = pd.to_numeric(melted_df["Value"], errors="coerce")
+    return melted_df.dropna(subset=["Value"])
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(sizes):
+    results = []
+    for size in sizes:
+        rows = synthetic_rows(size)
+
+        legacy_seconds, legacy = timed(legacy_pivot, rows)
+        vector_seconds, vector = timed(pivot_records, rows, ENR_KEYS)
+        assert len(legacy) == len(vector)
+
+        wide = pd.DataFrame(vector)
+        keys = list(ENR_KEYS)
+        melt_seconds, _ = timed(legacy_unpivot, wide, keys)
+        unpivot_seconds, _ = timed(unpivot_frame, wide, keys)
+
+        results.append({
+            "rows": size,
+            "pivot_legacy_rows_per_sec": size / legacy_seconds,
+            "pivot_vectorized_rows_per_sec": size / vector_seconds,
+            "unpivot_melt_rows_per_sec": size / melt_seconds,
+            "unpivot_vectorized_rows_per_sec": size / unpivot_seconds,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'pivot loop':>14} {'pivot vec':>14} {'melt':>14} {'unpivot vec':>14}  (rows/sec)")
+    for result in run(args.sizes):
+        print(
+            f"{result['rows']:>10} "
+            f"{result['pivot_legacy_rows_per_sec']:>14,.0f} "
+            f"{result['pivot_vectorized_rows_per_sec']:>14,.0f} "
+            f"{result['unpivot_melt_rows_per_sec']:>14,.0f} "
+            f"{result['unpivot_vectorized_rows_per_sec']:>14,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
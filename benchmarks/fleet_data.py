@@ -0,0 +1,191 @@
+"""
+Synthetic fleet data for the benchmarks.
+
+A scale is vessels x parameters x days: every vessel reports every parameter
+once a day (EnrParameter), and runs sea-trial sessions with one reading a
+minute of the first TRIAL_PARAMETERS parameters (SeaTrialParameter). The data
+is seeded, so two runs of the same scale hold the same values.
+
+generate_fleet writes through the Django ORM (whatever database is
+configured), enr_workbook / seatrial_workbook build the same data as the
+workbooks the parsers in Parser/ read.
+"""
+import datetime
+import io
+import re
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import pandas as pd
+
+FIRST_DAY = datetime.date(2023, 1, 1)
+TRIAL_PARAMETERS = 8
+BATCH_SIZE = 5000
+PARAMETER_PREFIX = "BENCH_"
+
+
+@dataclass(frozen=True)
+class Scale:
+    vessels: int
+    parameters: int
+    days: int
+    trial_sessions: int = 2
+    trial_minutes: int = 120
+
+    @classmethod
+    def parse(cls, value):
+        """Scale of a named scale or of "<vessels>x<parameters>x<days>"."""
+        if value in SCALES:
+            return SCALES[value]
+        match = re.fullmatch(r"(\d+)x(\d+)x(\d+)", value)
+        if not match:
+            raise ValueError(f"Unknown scale '{value}', expected one of {', '.join(SCALES)} or VxPxD")
+        return cls(*(int(group) for group in match.groups()))
+
+    @property
+    def label(self):
+        return f"{self.vessels}x{self.parameters}x{self.days}"
+
+    @property
+    def enr_rows(self):
+        return self.vessels * self.parameters * self.days
+
+    @property
+    def trial_rows(self):
+        return self.vessels * self.trial_sessions * self.trial_minutes * min(self.parameters, TRIAL_PARAMETERS)
+
+    def as_dict(self):
+        return {"label": self.label, **asdict(self), "enr_rows": self.enr_rows, "trial_rows": self.trial_rows}
+
+
+SCALES = {
+    "small": Scale(3, 10, 60),
+    "medium": Scale(10, 30, 365),
+    "large": Scale(25, 50, 730, trial_sessions=4),
+}
+
+
+def parameter_code(index):
+    return f"{PARAMETER_PREFIX}{index:03d}"
+
+
+def enr_values(scale, seed=0):
+    """(vessels x days x parameters) array of the daily values."""
+    rng = np.random.default_rng(seed)
+    trend = np.linspace(0, 10, scale.days)[None, :, None]
+    return rng.normal(50, 10, (scale.vessels, scale.days, scale.parameters)) + trend
+
+
+def trial_values(scale, seed=0):
+    """(vessels x sessions x minutes x trial parameters) array of the sea-trial readings."""
+    rng = np.random.default_rng(seed + 1)
+    shape = (scale.vessels, scale.trial_sessions, scale.trial_minutes, min(scale.parameters, TRIAL_PARAMETERS))
+    return rng.normal(100, 20, shape)
+
+
+def movement_of(day):
+    return "Port" if day % 7 == 0 else "Sea"
+
+
+def displacement_of(day, days):
+    return "Laden" if day < days // 2 else "Ballast"
+
+
+def generate_fleet(scale, seed=0, batch_size=BATCH_SIZE):
+    """
+    Create the vessels, parameters, labels, EnrParameter, SeaTrialParameter
+    and rollup rows of scale in the configured, empty database, and bump
+    the partition versions the API caches are keyed by.
+    Returns {"vessels": [ids], "parameters": [ids]}.
+    """
+    from django.core.management import call_command
+
+    from enr.models import (
+        DisplacementList, EnrParameter, MovementList, ParameterList, PartitionVersion, SeaTrialParameter, VesselList,
+    )
+    from enr.storage import ENR_DATASET, SEATRIAL_DATASET, month_start
+
+    VesselList.objects.bulk_create(
+        VesselList(vesselname=f"Bench vessel {i}", description="") for i in range(scale.vessels)
+    )
+    ParameterList.objects.bulk_create(
+        ParameterList(code=parameter_code(i), description=f"Bench parameter {i}") for i in range(scale.parameters)
+    )
+    # Not every backend returns the primary keys of bulk_create
+    vessels = list(VesselList.objects.order_by("id"))
+    parameters = list(ParameterList.objects.filter(code__startswith=PARAMETER_PREFIX).order_by("code"))
+    movements = {name: MovementList.objects.get_or_create(name=name)[0] for name in ("Sea", "Port")}
+    displacements = {name: DisplacementList.objects.get_or_create(name=name)[0] for name in ("Laden", "Ballast")}
+
+    values = enr_values(scale, seed)
+    dates = [FIRST_DAY + datetime.timedelta(days=day) for day in range(scale.days)]
+    EnrParameter.objects.bulk_create(
+        (
+            EnrParameter(
+                vessel=vessel, date=dates[day], movement=movements[movement_of(day)],
+                displacement=displacements[displacement_of(day, scale.days)], parameter=parameter,
+                value=float(values[v, day, p]),
+            )
+            for v, vessel in enumerate(vessels)
+            for day in range(scale.days)
+            for p, parameter in enumerate(parameters)
+        ),
+        batch_size=batch_size,
+    )
+
+    readings = trial_values(scale, seed)
+    first_minute = datetime.datetime.combine(FIRST_DAY, datetime.time(8), tzinfo=datetime.timezone.utc)
+    SeaTrialParameter.objects.bulk_create(
+        (
+            SeaTrialParameter(
+                vessel=vessel, session=f"S{session + 1}",
+                timestamp=first_minute + datetime.timedelta(days=30 * session, minutes=minute),
+                displacement=displacements["Laden"], parameter=parameters[p],
+                value=float(readings[v, session, minute, p]),
+            )
+            for v, vessel in enumerate(vessels)
+            for session in range(scale.trial_sessions)
+            for minute in range(scale.trial_minutes)
+            for p in range(readings.shape[3])
+        ),
+        batch_size=batch_size,
+    )
+
+    call_command("build_rollups", stdout=io.StringIO())
+    months = sorted({month_start(date) for date in dates})
+    trial_months = sorted({month_start(FIRST_DAY + datetime.timedelta(days=30 * s)) for s in range(scale.trial_sessions)})
+    PartitionVersion.bump(ENR_DATASET.name, [(vessel.id, month) for vessel in vessels for month in months])
+    PartitionVersion.bump(SEATRIAL_DATASET.name, [(vessel.id, month) for vessel in vessels for month in trial_months])
+    return {"vessels": [vessel.id for vessel in vessels], "parameters": [parameter.id for parameter in parameters]}
+
+
+def enr_workbook(scale, vessel_ids, seed=0):
+    """Sheet3 of an ENR workbook: Vessel, Date, Movement, Displacement and one column per parameter code."""
+    values = enr_values(scale, seed)
+    days = np.arange(scale.days)
+    frames = []
+    for v, vessel in enumerate(vessel_ids):
+        frame = pd.DataFrame(values[v], columns=[parameter_code(p) for p in range(scale.parameters)])
+        frame.insert(0, "Vessel", str(vessel))
+        frame.insert(1, "Date", pd.to_datetime(FIRST_DAY) + pd.to_timedelta(days, unit="D"))
+        frame.insert(2, "Movement", [movement_of(day) for day in days])
+        frame.insert(3, "Displacement", [displacement_of(day, scale.days) for day in days])
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def seatrial_workbook(scale, vessel_ids, seed=0):
+    """Sheet2 of a sea-trial workbook: Vessel, Session, Timestamp, Displacement and one column per parameter code."""
+    readings = trial_values(scale, seed)
+    minutes = pd.to_timedelta(np.arange(scale.trial_minutes), unit="min")
+    frames = []
+    for v, vessel in enumerate(vessel_ids):
+        for session in range(scale.trial_sessions):
+            start = pd.Timestamp(FIRST_DAY) + pd.Timedelta(days=30 * session, hours=8)
+            frame = pd.DataFrame(readings[v, session], columns=[parameter_code(p) for p in range(readings.shape[3])])
+            frame.insert(0, "Vessel", str(vessel))
+            frame.insert(1, "Session", f"S{session + 1}")
+            frame.insert(2, "Timestamp", start + minutes)
+            frame.insert(3, "Displacement", "Laden")
+            frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,140 @@
+"""
+Dashboard load test of the WSGI and ASGI deployments.
+
+Every simulated user opens the vessel-performance page over and over: the
+chart (full_data), table page, vessels, parameters and filter requests are
+fired at the same time, as the page does, and the next page load starts when
+all five answered. Reports requests per second and latency percentiles per
+endpoint for each target, so the same run compares both servers:
+
+    gunicorn fleetsys.wsgi -w 1 --threads 8 -b 127.0.0.1:8001
+    uvicorn fleetsys.asgi:application --workers 1 --port 8002
+
+    python -m benchmarks.load_test --target wsgi=http://127.0.0.1:8001 \\
+        --target asgi=http://127.0.0.1:8002 --users 10 50 --username u --password p
+
+Only the standard library is used. Point it at a copy of the data, not at
+production.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+PAGE_REQUESTS = {
+    "chart": "/api/performance/multiple/?full_data=true&resolution=raw&vessel={vessel}&max_points=800",
+    "table": "/api/performance/multiple/?resolution=raw&vessel={vessel}&page_size=10&count=true",
+    "vessels": "/api/vessels/",
+    "parameters": "/api/parameters/",
+    "filters": "/api/filters/",
+}
+
+
+def login(base_url, username, password):
+    """JWT access token of username."""
+    request = urllib.request.Request(
+        f"{base_url}/api/token/",
+        data=json.dumps({"username": username, "password": password}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)["access"]
+
+
+def fetch(url, token):
+    """(seconds, status) of one GET, the body is read to the end."""
+    request = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None
+    return time.perf_counter() - start, status
+
+
+def run_target(base_url, token, users, duration, vessel):
+    """{endpoint: [(seconds, status)]} of users loading the page for duration seconds."""
+    urls = {name: base_url + path.format(vessel=vessel) for name, path in PAGE_REQUESTS.items()}
+    samples = {name: [] for name in urls}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    # Each user needs one connection per request of the page
+    with ThreadPoolExecutor(max_workers=users * len(urls)) as pool:
+        def user():
+            while time.monotonic() < deadline:
+                futures = {name: pool.submit(fetch, url, token) for name, url in urls.items()}
+                for name, future in futures.items():
+                    result = future.result()
+                    with lock:
+                        samples[name].append(result)
+
+        threads = [threading.Thread(target=user) for _ in range(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return samples
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+def summarize(samples, duration):
+    rows = []
+    for name, results in samples.items():
+        seconds = [elapsed for elapsed, status in results if status == 200]
+        rows.append({
+            "endpoint": name,
+            "requests": len(results),
+            "errors": sum(1 for _, status in results if status != 200),
+            "rps": len(seconds) / duration,
+            "p50_ms": percentile(seconds, 50) * 1000 if seconds else None,
+            "p95_ms": percentile(seconds, 95) * 1000 if seconds else None,
+            "p99_ms": percentile(seconds, 99) * 1000 if seconds else None,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="label=base URL, repeatable")
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per target and user count")
+    parser.add_argument("--vessel", type=int, default=1)
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    targets = [target.split("=", 1) for target in args.target]
+    results = []
+    print(f"{'target':>8} {'users':>6} {'endpoint':>11} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for users in args.users:
+        for label, base_url in targets:
+            base_url = base_url.rstrip("/")
+            token = login(base_url, args.username, args.password)
+            for row in summarize(run_target(base_url, token, users, args.duration, args.vessel), args.duration):
+                results.append({"target": label, "users": users, **row})
+                latencies = [
+                    f"{row[key]:>9.1f}" if row[key] is not None else f"{'-':>9}" for key in ("p50_ms", "p95_ms", "p99_ms")
+                ]
+                print(f"{label:>8} {users:>6} {row['endpoint']:>11} {row['rps']:>8.1f} {' '.join(latencies)} {row['errors']:>7}")
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
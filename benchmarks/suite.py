@@ -0,0 +1,135 @@
+"""
+Benchmark suite: the API endpoints (bench_api) and the workbook parsers
+(bench_parsers) on the same synthetic fleet scales, saved as one JSON file per
+run so runs of different commits can be compared.
+
+    python -m benchmarks.suite run --sqlite --scale small medium --output bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.suite compare bench-abc123.json bench-def456.json --threshold 0.2
+
+compare lists every metric that got worse by more than the threshold (latency,
+queries, memory, payload size; lower is better for all of them) and exits
+with status 1 when there is one, so it can gate a CI job. Latencies are only
+comparable between runs on the same machine and database.
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+
+from benchmarks import bench_api, bench_parsers
+from benchmarks.fleet_data import Scale
+
+# Compared metrics of each benchmark, lower is better
+METRICS = {
+    "api": ("median_ms", "p95_ms", "queries", "peak_kib", "bytes"),
+    "parser": ("parse_median_s", "read_median_s", "melt_median_s", "peak_mib", "ingest_s"),
+}
+# Differences below these are noise whatever the ratio
+ABSOLUTE_TOLERANCE = {"median_ms": 1.0, "p95_ms": 2.0, "peak_kib": 64, "parse_median_s": 0.01,
+                      "read_median_s": 0.01, "melt_median_s": 0.01, "ingest_s": 0.05}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import django
+    import numpy
+    import pandas
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "django": django.get_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+    }
+
+
+def result_key(result):
+    return result["benchmark"], result["scale"]["label"], result.get("endpoint") or result.get("parser")
+
+
+def regressions(baseline, current, threshold):
+    """(key, metric, before, after) of the metrics of current worse than baseline by more than threshold."""
+    before = {result_key(result): result for result in baseline["results"]}
+    worse = []
+    for result in current["results"]:
+        key = result_key(result)
+        if key not in before:
+            continue
+        for metric in METRICS[result["benchmark"]]:
+            old, new = before[key].get(metric), result.get(metric)
+            if old is None or new is None or new - old <= ABSOLUTE_TOLERANCE.get(metric, 0):
+                continue
+            if old == 0 or (new - old) / old > threshold:
+                worse.append((key, metric, old, new))
+    return worse
+
+
+def run(args):
+    scales = [Scale.parse(scale) for scale in args.scale]
+    bench_api.setup_django(sqlite=args.sqlite)
+    from django.db import connection
+
+    results = bench_api.run(scales, args.repeat, args.warm, args.seed, args.endpoint)
+    if not args.skip_parsers:
+        results += bench_parsers.run(scales, ingest=args.ingest, seed=args.seed)
+    report = {
+        "environment": {**environment(), "database": connection.vendor},
+        "scales": [scale.as_dict() for scale in scales],
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+def compare(args):
+    with open(args.baseline) as baseline, open(args.current) as current:
+        baseline, current = json.load(baseline), json.load(current)
+    print(f"Baseline {baseline['environment'].get('commit')}, current {current['environment'].get('commit')}")
+    worse = regressions(baseline, current, args.threshold)
+    for (benchmark, scale, name), metric, old, new in worse:
+        change = f"{(new - old) / old:+.0%}" if old else "new"
+        print(f"  {benchmark:<7} {scale:>12} {name:<24} {metric:<15} {old:>12,.2f} -> {new:>12,.2f} ({change})")
+    if not worse:
+        print(f"  No metric worse by more than {args.threshold:.0%}")
+    return 1 if worse else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and save the results")
+    bench_api.add_arguments(run_parser)
+    run_parser.add_argument("--sqlite", action="store_true", help="In-memory SQLite instead of the configured database")
+    run_parser.add_argument("--skip-parsers", action="store_true")
+    run_parser.add_argument("--ingest", action="store_true", help="Also time the parser writes into MySQL")
+    run_parser.add_argument("--output", default="benchmark-results.json")
+
+    compare_parser = commands.add_parser("compare", help="List the regressions of a run against a baseline run")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="Relative change reported, 0.2 is 20%%")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,10 @@
 from django.contrib import admin
-from .models import EnrParameter, VesselList, ParameterList
+from .models import DisplacementList, EnrParameter, IngestionRun, MovementList, VesselList, ParameterList
 
 @admin.register(EnrParameter)
 class EnrParameterAdmin(admin.ModelAdmin):
     list_display = ('vessel', 'date', 'movement', 'displacement', 'parameter', 'value')
+    list_select_related = ('vessel', 'movement', 'displacement', 'parameter')
     search_fields = ('vessel', 'parameter')
     list_filter = ('date', 'parameter')
 
@@ -15,6 +16,31 @@ class VesselListAdmin(admin.ModelAdmin):
 
 @admin.register(ParameterList)
 class ParameterListAdmin(admin.ModelAdmin):
-    list_display = ("code", "description")
+    list_display = ("code", "description", "is_calculated", "formula")
+    list_filter = ("is_calculated",)
     search_fields = ("code", "description")
-    ordering = ("code",)
\ No newline at end of file
+    ordering = ("code",)
+
+@admin.register(MovementList, DisplacementList)
+class LabelListAdmin(admin.ModelAdmin):
+    list_display = ("id", "name")
+    search_fields = ("name",)
+    ordering = ("name",)
+
+@admin.register(IngestionRun)
+class IngestionRunAdmin(admin.ModelAdmin):
+    """Run records written by the Parser ingestion, read-only."""
+    list_display = (
+        "started_at", "file_name", "target_table", "status", "rows_read", "rows_melted", "rows_non_numeric",
+        "rows_unknown_vessel", "rows_upserted", "read_seconds", "melt_seconds", "db_seconds", "total_seconds",
+    )
+    list_filter = ("status", "target_table", "started_at")
+    search_fields = ("file_name", "path", "error")
+    ordering = ("-started_at",)
+    date_hierarchy = "started_at"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
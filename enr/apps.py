@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EnrConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'enr'
+
+    def ready(self):
+        from . import signals  # noqa: F401
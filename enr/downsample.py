@@ -0,0 +1,98 @@
+"""
+Downsampling of chart series to a bounded number of points.
+
+* ``lttb``: Largest-Triangle-Three-Buckets, keeps the points that preserve the
+  visual shape of a line (first and last point always kept).
+* ``minmax``: the minimum and maximum of each bucket, keeps every peak.
+
+Both take x sorted ascending and return the sorted indices of the points to
+keep, so callers can select whole rows. Buckets are processed with NumPy; LTTB
+only loops over buckets, not points.
+"""
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def _all_indices(n):
+    return np.arange(n, dtype=np.int64)
+
+
+def lttb(x, y, n_out):
+    """Indices of n_out points of (x, y) chosen with Largest-Triangle-Three-Buckets."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n:
+        return _all_indices(n)
+    if n_out < 3:
+        return np.array([0, n - 1], dtype=np.int64)[:max(n_out, 0)]
+
+    # n - 2 inner points split into n_out - 2 buckets, first and last point fixed
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Average point of every bucket, used as the third vertex of the previous bucket's triangles
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        bx, by = x[start:end], y[start:end]
+        area = np.abs(
+            (x[previous] - avg_x[bucket]) * (by - y[previous])
+            - (x[previous] - bx) * (avg_y[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax(x, y, n_out):
+    """Indices of the minimum and maximum y of (n_out - 2) // 2 equal-count buckets, plus both ends."""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n:
+        return _all_indices(n)
+    n_buckets = (n_out - 2) // 2
+    if n_buckets < 1:
+        # Room for the ends and the largest value only
+        return np.unique([0, n - 1, int(np.argmax(y))])[:max(n_out, 0)]
+    bucket = (np.arange(n) * n_buckets) // n
+    # Within each bucket the rows are sorted by y, so the first is the minimum and the last the maximum
+    order = np.lexsort((y, bucket))
+    starts = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends]]))
+
+
+def downsample_indices(x, y, n_out, method="lttb"):
+    """Indices of at most n_out points of one series, NaN values are never selected."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}'")
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    pick = lttb if method == "lttb" else minmax
+    return valid[pick(np.asarray(x)[valid], y[valid], n_out)]
+
+
+def series_indices(groups, x, values, n_out, method="lttb"):
+    """
+    Union of the points kept for every series, a series being one group and one
+    column of values (2D, NaN where a row has no value). Rows must be sorted by
+    x within each group. Returns sorted row indices.
+    """
+    groups = np.asarray(groups)
+    if len(groups) == 0:
+        return _all_indices(0)
+    values = np.asarray(values, dtype=float).reshape(len(groups), -1)
+    keep = []
+    for group in np.unique(groups):
+        rows = np.flatnonzero(groups == group)
+        for column in range(values.shape[1]):
+            keep.append(rows[downsample_indices(x[rows], values[rows, column], n_out, method)])
+    return np.unique(np.concatenate(keep))
@@ -0,0 +1,191 @@
+"""Calculated parameters: safe parsing and vectorized evaluation of the ParameterList formulas."""
+import ast
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .pivot import pivot_frame
+
+CALCULATION_KEYS = ["vessel", "date"]
+# Columns of the stored EnrParameter rows recalculate_frames works on
+STORED_COLUMNS = ["id", "vessel", "date", "movement", "displacement", "parameter", "code", "value"]
+
+FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "log": np.log,
+    "exp": np.exp,
+    "min": np.minimum,
+    "max": np.maximum,
+}
+OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+REFERENCE = re.compile(r"\{\s*([^{}\s]+)\s*\}")
+
+
+class FormulaError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Formula:
+    parameter: int      # ParameterList id the results are stored under
+    code: str
+    expression: str
+    inputs: tuple       # referenced parameter codes, in order of appearance
+    compiled: object
+
+    def evaluate(self, columns, length):
+        """Evaluate over columns {code: float array}, returning a float array of length."""
+        names = {f"_{i}": columns[code] for i, code in enumerate(self.inputs)}
+        with np.errstate(all="ignore"):
+            result = eval(self.compiled, {"__builtins__": {}}, {**FUNCTIONS, **names})
+        result = np.broadcast_to(np.asarray(result, dtype=float), (length,)).copy()
+        result[~np.isfinite(result)] = np.nan
+        return result
+
+
+def _check_node(node, n_inputs):
+    if isinstance(node, ast.Expression):
+        return _check_node(node.body, n_inputs)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, OPERATORS):
+        return _check_node(node.left, n_inputs) and _check_node(node.right, n_inputs)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, OPERATORS):
+        return _check_node(node.operand, n_inputs)
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, (int, float)) and not isinstance(node.value, bool)
+    if isinstance(node, ast.Name):
+        return re.fullmatch(r"_\d+", node.id) is not None and int(node.id[1:]) < n_inputs
+    if isinstance(node, ast.Call):
+        return (
+            isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS and not node.keywords
+            and all(_check_node(arg, n_inputs) for arg in node.args)
+        )
+    return False
+
+
+def parse_formula(parameter, code, expression):
+    """Parse and validate one formula, raising FormulaError when it is not allowed."""
+    inputs = []
+
+    def reference(match):
+        if match.group(1) not in inputs:
+            inputs.append(match.group(1))
+        return f"_{inputs.index(match.group(1))}"
+
+    source = REFERENCE.sub(reference, expression)
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError:
+        raise FormulaError(f"Invalid formula for {code}: {expression}")
+    if not _check_node(tree, len(inputs)):
+        raise FormulaError(
+            f"Invalid formula for {code}: only numbers, {{code}} references, + - * / ** "
+            f"and {', '.join(FUNCTIONS)} are allowed"
+        )
+    if code in inputs:
+        raise FormulaError(f"Formula for {code} refers to itself")
+    return Formula(parameter, code, expression, tuple(inputs), compile(tree, f"<formula {code}>", "eval"))
+
+
+def load_formulas(rows):
+    """
+    Parse (parameter id, code, formula) rows and order them so every formula
+    comes after the calculated parameters it uses. Raises FormulaError on a
+    cycle.
+    """
+    formulas = {code: parse_formula(parameter, code, expression) for parameter, code, expression in rows if expression}
+    ordered, visiting, done = [], set(), set()
+
+    def visit(code, path):
+        if code in done:
+            return
+        if code in visiting:
+            raise FormulaError(f"Calculated parameters depend on each other: {' -> '.join(path + [code])}")
+        visiting.add(code)
+        for dependency in formulas[code].inputs:
+            if dependency in formulas:
+                visit(dependency, path + [code])
+        visiting.discard(code)
+        done.add(code)
+        ordered.append(formulas[code])
+
+    for code in formulas:
+        visit(code, [])
+    return ordered
+
+
+def affected_formulas(formulas, codes):
+    """The formulas (in evaluation order) whose result depends, directly or not, on codes."""
+    changed = set(codes)
+    affected = []
+    for formula in formulas:
+        if changed.intersection(formula.inputs):
+            affected.append(formula)
+            changed.add(formula.code)
+    return affected
+
+
+def formula_codes(formulas):
+    """Every code read or written by formulas."""
+    codes = {formula.code for formula in formulas}
+    for formula in formulas:
+        codes.update(formula.inputs)
+    return sorted(codes)
+
+
+def calculate(values, formulas):
+    """
+    Evaluate formulas over a long frame of (vessel, date, movement,
+    displacement, code, value) rows. A formula may use the result of an
+    earlier one. Returns (vessel, date, movement, displacement, parameter,
+    value) rows of the defined results, movement and displacement copied from
+    the inputs of the same vessel and date.
+    """
+    columns = ["vessel", "date", "movement", "displacement", "parameter", "value"]
+    if values.empty or not formulas:
+        return pd.DataFrame(columns=columns)
+
+    codes = formula_codes(formulas)
+    key_frame, _, matrix = pivot_frame(values, CALCULATION_KEYS, parameter="code", parameters=codes)
+    series = {code: matrix[:, i] for i, code in enumerate(codes)}
+    voyages = values.drop_duplicates(subset=CALCULATION_KEYS)[["vessel", "date", "movement", "displacement"]]
+    key_frame = key_frame.merge(voyages, on=CALCULATION_KEYS, how="left")
+
+    results = []
+    for formula in formulas:
+        series[formula.code] = formula.evaluate(series, len(key_frame))
+        defined = ~np.isnan(series[formula.code])
+        results.append(key_frame[defined].assign(parameter=formula.parameter, value=series[formula.code][defined]))
+    return pd.concat(results, ignore_index=True)[columns]
+
+
+def recalculate_frames(changed, stored, formulas):
+    """
+    Recompute formulas for the (vessel, date) of changed.
+
+    stored holds the STORED_COLUMNS rows of those vessels over at least the
+    changed dates, for every code in formula_codes(formulas).
+
+    Returns (upserts, stale): the result rows to insert or update (their value,
+    movement or displacement differ from the stored row) and the stored result
+    rows, with their id, that have no defined value anymore.
+    """
+    keys = changed[CALCULATION_KEYS].dropna().drop_duplicates()
+    stored = stored.merge(keys, on=CALCULATION_KEYS, how="inner")
+    results = calculate(stored, formulas)
+
+    previous = stored[stored["parameter"].isin([formula.parameter for formula in formulas])]
+    previous = previous[["id", "vessel", "date", "parameter", "movement", "displacement", "value"]]
+    merged = results.merge(
+        previous, on=["vessel", "date", "parameter"], how="outer", suffixes=("", "_stored"), indicator=True,
+    )
+    differs = merged["_merge"] == "left_only"
+    for column in ("value", "movement", "displacement"):
+        left, right = merged[column], merged[f"{column}_stored"]
+        differs |= ~(left.isna() & right.isna()) & ((left != right) | left.isna() | right.isna())
+    upserts = merged[(merged["_merge"] != "right_only") & differs][results.columns]
+    stale = merged[merged["_merge"] == "right_only"]
+    stale = stale.assign(id=stale["id"].astype("int64"))[["id", "vessel", "date", "parameter"]]
+    return upserts.reset_index(drop=True), stale.reset_index(drop=True)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from enr.models import EnrParameter, SeaTrialParameter, VesselList, sync_columnar_store
+from enr.storage import DATASETS, ENR_DATASET, ColumnarStore, partitions_of
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the columnar (Parquet) copy of the performance and sea-trial values at "
+        "settings.ENR_COLUMNAR_STORE, one vessel at a time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vessel", type=int, action="append", help="Vessel id to rebuild (repeatable), default all")
+        parser.add_argument("--dataset", choices=sorted(DATASETS), action="append", help="Data set to rebuild, default both")
+
+    def handle(self, *args, **options):
+        store = ColumnarStore.from_settings()
+        if store is None:
+            raise CommandError("Set ENR_COLUMNAR_STORE and install pyarrow to use the columnar store")
+        vessels = options["vessel"] or list(VesselList.objects.order_by("id").values_list("id", flat=True))
+        for name in options["dataset"] or sorted(DATASETS):
+            dataset = DATASETS[name]
+            model = EnrParameter if dataset is ENR_DATASET else SeaTrialParameter
+            for vessel in vessels:
+                rows = model.objects.filter(vessel=vessel)
+                if dataset is ENR_DATASET:
+                    months = rows.dates("date", "month")
+                else:
+                    months = rows.datetimes("timestamp", "month")
+                # Every month of the vessel, plus the stale files of months that no longer have rows
+                partitions = set(partitions_of([vessel] * len(months), months))
+                partitions.update((vessel, month) for month in store.months(dataset, vessel))
+                sync_columnar_store(dataset, sorted(partitions), store)
+                self.stdout.write(f"{name} vessel {vessel}: {len(partitions)} monthly partitions")
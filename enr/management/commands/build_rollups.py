@@ -0,0 +1,44 @@
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from enr.models import DataVersion, EnrParameter, EnrParameterRollup, PartitionVersion, VesselList
+from enr.rollups import GRANULARITIES, STATISTICS, rollup_frame
+from enr.storage import ENR_DATASET, partitions_of
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = "Rebuild the day/week/month EnrParameterRollup aggregates from EnrParameter, one vessel at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vessel", type=int, action="append", help="Vessel id to rebuild (repeatable), default all")
+
+    def handle(self, *args, **options):
+        vessels = options["vessel"] or list(VesselList.objects.order_by("id").values_list("id", flat=True))
+        for vessel in vessels:
+            values = (
+                EnrParameter.objects.filter(vessel=vessel, parameter__isnull=False)
+                .values_list("vessel", "parameter", "date", "value")
+                .iterator(chunk_size=BATCH_SIZE)
+            )
+            df = pd.DataFrame(list(values), columns=["vessel", "parameter", "date", "value"])
+            rollups = pd.concat([rollup_frame(df, granularity) for granularity in GRANULARITIES], ignore_index=True)
+            rows = [
+                EnrParameterRollup(
+                    vessel_id=row["vessel"], parameter_id=row["parameter"], granularity=row["granularity"],
+                    period_start=row["period_start"], **{name: row[name] for name in STATISTICS},
+                )
+                for row in rollups.to_dict("records")
+            ]
+            with transaction.atomic():
+                # The months of the replaced rollups too, some may have no values any more
+                previous = EnrParameterRollup.objects.filter(vessel=vessel).values_list("period_start", flat=True)
+                months = list(df["date"]) + list(previous.distinct())
+                EnrParameterRollup.objects.filter(vessel=vessel).delete()
+                EnrParameterRollup.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+                # Cached rollup responses are keyed by these versions (api.caching)
+                DataVersion.bump(DataVersion.ENR)
+                PartitionVersion.bump(ENR_DATASET.name, partitions_of([vessel] * len(months), months))
+            self.stdout.write(f"Vessel {vessel}: {len(rows)} rollups from {len(df)} values")
@@ -0,0 +1,54 @@
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from enr.formulas import FormulaError, affected_formulas
+from enr.models import (
+    DataVersion, EnrParameter, EnrParameterRollup, ParameterList, PartitionVersion, VesselList, sync_columnar_store,
+)
+from enr.storage import ENR_DATASET, partitions_of
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute calculated parameters (ParameterList.formula) over all dates, one vessel at a time, "
+        "e.g. after a formula was added or changed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vessel", type=int, action="append", help="Vessel id to recompute (repeatable), default all")
+        parser.add_argument(
+            "--parameter", action="append",
+            help="Code of a calculated parameter to recompute (repeatable), with the parameters using it; default all",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            formulas = ParameterList.formulas()
+        except FormulaError as e:
+            raise CommandError(str(e))
+        if options["parameter"]:
+            unknown = set(options["parameter"]) - {formula.code for formula in formulas}
+            if unknown:
+                raise CommandError(f"Not calculated parameters: {', '.join(sorted(unknown))}")
+            # The selected formulas and the ones built on them
+            selected = set(options["parameter"])
+            formulas = [
+                formula for formula in formulas
+                if formula.code in selected or formula in affected_formulas(formulas, selected)
+            ]
+        if not formulas:
+            self.stdout.write("No calculated parameters")
+            return
+
+        vessels = options["vessel"] or list(VesselList.objects.order_by("id").values_list("id", flat=True))
+        for vessel in vessels:
+            dates = EnrParameter.objects.filter(vessel=vessel).order_by("date").values_list("date", flat=True).distinct()
+            changed = pd.DataFrame({"vessel": vessel, "parameter": None, "date": list(dates)})
+            written = EnrParameter.recalculate(changed, formulas)
+            if not written.empty:
+                EnrParameterRollup.refresh(written)
+                DataVersion.bump(DataVersion.ENR)
+                partitions = partitions_of(written["vessel"], written["date"])
+                PartitionVersion.bump(ENR_DATASET.name, partitions)
+                sync_columnar_store(ENR_DATASET, partitions)
+            self.stdout.write(f"Vessel {vessel}: {len(written)} calculated values written or deleted over {len(changed)} dates")
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enr', '0005_parameterlist_is_calculated'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enrparameter',
+            index=models.Index(fields=['vessel', '-date', 'movement', 'displacement', 'parameter', 'value'], name='enr_vsl_date_cover_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrparameter',
+            index=models.Index(fields=['vessel', 'parameter', 'date', 'value'], name='enr_vsl_param_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seatrialparameter',
+            index=models.Index(fields=['vessel', 'timestamp'], name='seatrial_vsl_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seatrialparameter',
+            index=models.Index(fields=['parameter', 'vessel', 'timestamp', 'value'], name='seatrial_param_vsl_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enr', '0007_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrParameterRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('count', models.PositiveIntegerField()),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('total', models.FloatField()),
+                ('mean', models.FloatField()),
+                ('last', models.FloatField()),
+                ('parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='enr.parameterlist')),
+                ('vessel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='enr.vessellist')),
+            ],
+            options={
+                'unique_together': {('granularity', 'vessel', 'parameter', 'period_start')},
+            },
+        ),
+    ]
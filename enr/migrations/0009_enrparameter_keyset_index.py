@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enr', '0008_enrparameterrollup'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='enrparameter',
+            name='enr_vsl_param_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='enrparameter',
+            index=models.Index(fields=['vessel', 'parameter', 'date', 'id', 'value'], name='enr_vsl_param_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enr', '0009_enrparameter_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parameterlist',
+            name='formula',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
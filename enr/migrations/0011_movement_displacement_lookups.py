@@ -0,0 +1,106 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+# (model, label field, lookup model) of the columns moved to lookup tables
+LABEL_FIELDS = (
+    ("EnrParameter", "movement", "MovementList"),
+    ("EnrParameter", "displacement", "DisplacementList"),
+    ("SeaTrialParameter", "displacement", "DisplacementList"),
+)
+
+
+def encode_labels(apps, schema_editor):
+    """One lookup row per distinct label, then one UPDATE per label. Blank labels stay null."""
+    for model_name, field, lookup_name in LABEL_FIELDS:
+        model = apps.get_model("enr", model_name)
+        lookup = apps.get_model("enr", lookup_name)
+        labels = (
+            model.objects.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+            .order_by().values_list(field, flat=True).distinct()
+        )
+        for label in list(labels):
+            entry, _ = lookup.objects.get_or_create(name=label)
+            model.objects.filter(**{field: label}).update(**{f"{field}_ref": entry})
+
+
+def decode_labels(apps, schema_editor):
+    for model_name, field, lookup_name in LABEL_FIELDS:
+        model = apps.get_model("enr", model_name)
+        lookup = apps.get_model("enr", lookup_name)
+        for entry in lookup.objects.all():
+            model.objects.filter(**{f"{field}_ref": entry}).update(**{field: entry.name})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enr', '0010_parameterlist_formula'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisplacementList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MovementList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='enrparameter',
+            name='enr_vsl_date_cover_idx',
+        ),
+        migrations.AddField(
+            model_name='enrparameter',
+            name='movement_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='enr.movementlist'),
+        ),
+        migrations.AddField(
+            model_name='enrparameter',
+            name='displacement_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='enr.displacementlist'),
+        ),
+        migrations.AddField(
+            model_name='seatrialparameter',
+            name='displacement_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='enr.displacementlist'),
+        ),
+        migrations.RunPython(encode_labels, decode_labels),
+        migrations.RemoveField(
+            model_name='enrparameter',
+            name='movement',
+        ),
+        migrations.RemoveField(
+            model_name='enrparameter',
+            name='displacement',
+        ),
+        migrations.RemoveField(
+            model_name='seatrialparameter',
+            name='displacement',
+        ),
+        migrations.RenameField(
+            model_name='enrparameter',
+            old_name='movement_ref',
+            new_name='movement',
+        ),
+        migrations.RenameField(
+            model_name='enrparameter',
+            old_name='displacement_ref',
+            new_name='displacement',
+        ),
+        migrations.RenameField(
+            model_name='seatrialparameter',
+            old_name='displacement_ref',
+            new_name='displacement',
+        ),
+        migrations.AddIndex(
+            model_name='enrparameter',
+            index=models.Index(fields=['vessel', '-date', 'movement', 'displacement', 'parameter', 'value'], name='enr_vsl_date_cover_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enr', '0011_movement_displacement_lookups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartitionVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset', models.CharField(max_length=20)),
+                ('vessel', models.IntegerField()),
+                ('month', models.DateField()),
+                ('version', models.PositiveBigIntegerField(default=1)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dataset', 'vessel', 'month'), name='partition_version_unique')],
+            },
+        ),
+    ]
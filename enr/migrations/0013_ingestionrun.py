@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enr', '0012_partitionversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('path', models.CharField(blank=True, default='', max_length=1024)),
+                ('target_table', models.CharField(max_length=64)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('failed', 'Failed')], max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField()),
+                ('rows_read', models.PositiveIntegerField(default=0)),
+                ('rows_melted', models.PositiveIntegerField(default=0)),
+                ('rows_non_numeric', models.PositiveIntegerField(default=0)),
+                ('rows_unknown_vessel', models.PositiveIntegerField(default=0)),
+                ('unknown_vessels', models.TextField(blank=True, default='')),
+                ('inserted', models.PositiveIntegerField(default=0)),
+                ('updated', models.PositiveIntegerField(default=0)),
+                ('deleted', models.PositiveIntegerField(default=0)),
+                ('unchanged', models.PositiveIntegerField(default=0)),
+                ('new_parameters', models.PositiveIntegerField(default=0)),
+                ('calculated', models.PositiveIntegerField(default=0)),
+                ('read_seconds', models.FloatField(default=0)),
+                ('melt_seconds', models.FloatField(default=0)),
+                ('db_seconds', models.FloatField(default=0)),
+                ('total_seconds', models.FloatField(default=0)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['started_at'], name='ingestion_run_started'), models.Index(fields=['status', 'started_at'], name='ingestion_run_status')],
+            },
+        ),
+    ]
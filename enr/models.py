@@ -1,4 +1,15 @@
-from django.db import models
+import datetime
+
+import pandas as pd
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .formulas import (
+    STORED_COLUMNS, FormulaError, affected_formulas, formula_codes, load_formulas, recalculate_frames,
+)
+from .rollups import ROLLUP_KEYS, STATISTICS, refresh_frames, rollup_range
+from .storage import ENR_DATASET, ColumnarStore, next_month
 
 # Create your models here.
 class VesselList(models.Model):
@@ -12,31 +23,351 @@ class ParameterList(models.Model):
     code = models.CharField(max_length=20, unique=True)  # Parameter code (e.g., 010001)
     description = models.CharField(max_length=255)  # Description of the parameter (e.g., "Main Engine RPM")
     is_calculated = models.BooleanField(default=False)
+    # Expression over other parameter codes in braces, e.g. {040001} * 1000000 / ({010002} * 24),
+    # see enr.formulas. Evaluated when is_calculated.
+    formula = models.TextField(blank=True, default="")
 
     def __str__(self):
         return f"{self.code} - {self.description}"
+
+    def clean(self):
+        if not self.is_calculated or not self.formula:
+            return
+        others = (
+            ParameterList.objects.filter(is_calculated=True).exclude(formula="").exclude(pk=self.pk)
+            .values_list("id", "code", "formula")
+        )
+        try:
+            load_formulas(list(others) + [(self.pk, self.code, self.formula)])
+        except FormulaError as e:
+            raise ValidationError({"formula": str(e)})
+
+    @classmethod
+    def formulas(cls):
+        """The parsed formulas of all calculated parameters, in evaluation order."""
+        return load_formulas(cls.objects.filter(is_calculated=True).exclude(formula="").values_list("id", "code", "formula"))
     
+# Columns of the performance rows stored as lookup table ids, the API shows their names
+LABEL_FIELDS = ("movement", "displacement")
+
+class MovementList(models.Model):
+    name = models.CharField(max_length=50, unique=True)  # Movement label (e.g., "Sea", "Port")
+
+    def __str__(self):
+        return self.name
+
+class DisplacementList(models.Model):
+    name = models.CharField(max_length=50, unique=True)  # Displacement label (e.g., "Laden", "Ballast")
+
+    def __str__(self):
+        return self.name
+
 class EnrParameter(models.Model):
     vessel = models.ForeignKey(VesselList, on_delete=models.SET_NULL, null=True, blank=True)
     date = models.DateField()
-    movement = models.CharField(max_length=50, null=True, blank=True)
-    displacement = models.CharField(max_length=50, null=True, blank=True)
+    movement = models.ForeignKey(MovementList, on_delete=models.SET_NULL, null=True, blank=True)
+    displacement = models.ForeignKey(DisplacementList, on_delete=models.SET_NULL, null=True, blank=True)
     parameter = models.ForeignKey(ParameterList, on_delete=models.SET_NULL, null=True, blank=True)
     value = models.FloatField()
 
     class Meta:
         unique_together = ('vessel', 'date', 'parameter')
+        indexes = [
+            # Pivot/export/chart reads: vessel + date range, newest first, grouped by
+            # (date, movement, displacement); covers parameter and value so no row lookups
+            models.Index(
+                fields=['vessel', '-date', 'movement', 'displacement', 'parameter', 'value'],
+                name='enr_vsl_date_cover_idx',
+            ),
+            # Single parameter reads: vessel + parameter + date range ordered by (date, id),
+            # the keyset order of its pages
+            models.Index(fields=['vessel', 'parameter', 'date', 'id', 'value'], name='enr_vsl_param_date_idx'),
+        ]
+
+    @classmethod
+    def recalculate(cls, changed, formulas=None):
+        """
+        Recompute the calculated parameters of the (vessel, date) of the changed
+        (vessel, parameter, date) rows. formulas defaults to those depending on
+        the changed parameters. Results are written with bulk queries, which
+        send no signals.
+
+        Returns the (vessel, parameter, date) of the calculated rows written or
+        deleted, for the rollups.
+        """
+        written = pd.DataFrame(columns=["vessel", "parameter", "date"])
+        changed = changed.dropna(subset=["vessel", "date"])
+        if changed.empty:
+            return written
+        if formulas is None:
+            parameters = changed["parameter"].dropna().unique().tolist()
+            codes = ParameterList.objects.filter(pk__in=parameters).values_list("code", flat=True)
+            formulas = affected_formulas(ParameterList.formulas(), codes)
+        if not formulas:
+            return written
+
+        stored = cls.objects.filter(
+            vessel__in=changed["vessel"].unique().tolist(),
+            date__range=(changed["date"].min(), changed["date"].max()),
+            parameter__code__in=formula_codes(formulas),
+        ).values_list("id", "vessel", "date", "movement", "displacement", "parameter", "parameter__code", "value")
+        stored = pd.DataFrame(list(stored), columns=STORED_COLUMNS)
+        upserts, stale = recalculate_frames(changed, stored, formulas)
+
+        rows = [
+            cls(vessel_id=row["vessel"], date=row["date"], movement_id=row["movement"],
+                displacement_id=row["displacement"], parameter_id=row["parameter"], value=row["value"])
+            for row in upserts.to_dict("records")
+        ]
+        supports_target = connection.features.supports_update_conflicts_with_target
+        with transaction.atomic():
+            # A plain DELETE: QuerySet.delete() would send post_delete for every row and so
+            # start another recalculation from the enr.signals receivers
+            cls.objects.filter(pk__in=stale["id"].tolist())._raw_delete(connection.alias)
+            cls.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["vessel", "date", "parameter"] if supports_target else None,
+                update_fields=["movement", "displacement", "value"],
+            )
+        return pd.concat([upserts[["vessel", "parameter", "date"]], stale[["vessel", "parameter", "date"]]])
 
 class SeaTrialParameter(models.Model):
     vessel = models.ForeignKey(VesselList, on_delete=models.SET_NULL, null=True, blank=True)
     session = models.CharField(max_length=100)
     timestamp = models.DateTimeField()
-    displacement = models.CharField(max_length=50, null=True, blank=True)
+    displacement = models.ForeignKey(DisplacementList, on_delete=models.SET_NULL, null=True, blank=True)
     parameter = models.ForeignKey(ParameterList, on_delete=models.SET_NULL, null=True, blank=True)
     value = models.FloatField()
 
     class Meta:
         unique_together = ('vessel', 'session', 'timestamp', 'parameter')
+        indexes = [
+            # Sea-trial page: one vessel ordered by timestamp
+            models.Index(fields=['vessel', 'timestamp'], name='seatrial_vsl_ts_idx'),
+            # Power-curve pairs: one parameter of a vessel over time, covering value
+            models.Index(fields=['parameter', 'vessel', 'timestamp', 'value'], name='seatrial_param_vsl_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.vessel} - {self.session} - {self.parameter.description} at {self.timestamp}: {self.value}"
+
+class EnrParameterRollup(models.Model):
+    """
+    Aggregate of one parameter of one vessel over a day, week (from Monday) or
+    month, maintained from EnrParameter by enr.rollups (see build_rollups).
+    """
+    GRANULARITY_CHOICES = [("day", "Day"), ("week", "Week"), ("month", "Month")]
+
+    vessel = models.ForeignKey(VesselList, on_delete=models.CASCADE)
+    parameter = models.ForeignKey(ParameterList, on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES)
+    period_start = models.DateField()
+    count = models.PositiveIntegerField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+    total = models.FloatField()
+    mean = models.FloatField()
+    last = models.FloatField()  # value of the latest date of the period
+
+    class Meta:
+        unique_together = ('granularity', 'vessel', 'parameter', 'period_start')
+
+    def __str__(self):
+        return f"{self.vessel_id} - {self.parameter_id} - {self.granularity} {self.period_start}: {self.mean}"
+
+    @classmethod
+    def refresh(cls, changed):
+        """
+        Recompute the periods of the changed (vessel, parameter, date) rows
+        from the current EnrParameter values.
+        """
+        changed = changed.dropna(subset=["vessel", "parameter"])
+        if changed.empty:
+            return
+        first, last = rollup_range(changed["date"])
+        raw = EnrParameter.objects.filter(
+            vessel__in=changed["vessel"].unique().tolist(),
+            parameter__in=changed["parameter"].unique().tolist(),
+            date__range=(first, last),
+        ).values_list("vessel", "parameter", "date", "value")
+        raw = pd.DataFrame(list(raw), columns=["vessel", "parameter", "date", "value"])
+        rollups, stale = refresh_frames(changed, raw)
+
+        stale_filter = models.Q(pk__in=[])
+        for vessel, parameter, granularity, start in stale[ROLLUP_KEYS].itertuples(index=False, name=None):
+            stale_filter |= models.Q(vessel=vessel, parameter=parameter, granularity=granularity, period_start=start)
+        rows = [
+            cls(vessel_id=row["vessel"], parameter_id=row["parameter"], granularity=row["granularity"],
+                period_start=row["period_start"], **{name: row[name] for name in STATISTICS})
+            for row in rollups.to_dict("records")
+        ]
+        supports_target = connection.features.supports_update_conflicts_with_target
+        with transaction.atomic():
+            cls.objects.filter(stale_filter).delete()
+            cls.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["granularity", "vessel", "parameter", "period_start"] if supports_target else None,
+                update_fields=list(STATISTICS),
+            )
+
+class DataVersion(models.Model):
+    """
+    Change counter of one data set, bumped whenever its rows are saved or deleted
+    (model signals for the admin, raw SQL for the Parser ingestion). Cached API
+    responses are keyed by these versions and revalidated through ETag/Last-Modified.
+    """
+    ENR = "enr"
+    SEATRIAL = "seatrial"
+    VESSELS = "vessels"
+    PARAMETERS = "parameters"
+
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+    @classmethod
+    def bump(cls, name):
+        """Increment the version of name, creating it on first use."""
+        updated = cls.objects.filter(name=name).update(version=models.F("version") + 1, updated_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(name=name, defaults={"version": 1})
+
+class PartitionVersion(models.Model):
+    """
+    Change counter of one vessel and month of the enr or seatrial rows (the
+    partitions of enr.storage). Cached performance queries are keyed by the
+    versions of the partitions they cover, so a write only invalidates the
+    responses of its vessels and months. The files of the columnar store
+    record the version they were written at and are only read while current.
+    """
+    dataset = models.CharField(max_length=20)  # enr.storage Dataset name
+    vessel = models.IntegerField()
+    month = models.DateField()  # First day of the month
+    version = models.PositiveBigIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dataset", "vessel", "month"], name="partition_version_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.dataset} vessel {self.vessel} {self.month:%Y-%m} v{self.version}"
+
+    @classmethod
+    def bump(cls, dataset, partitions):
+        """Increment the versions of the (vessel, first day of month) partitions of dataset."""
+        partitions = sorted(set(partitions))
+        if not partitions:
+            return
+        condition = models.Q(pk__in=[])
+        for vessel, month in partitions:
+            condition |= models.Q(vessel=vessel, month=month)
+        with transaction.atomic():
+            cls.objects.filter(condition, dataset=dataset).update(version=models.F("version") + 1)
+            cls.objects.bulk_create(
+                [cls(dataset=dataset, vessel=vessel, month=month) for vessel, month in partitions],
+                ignore_conflicts=True,
+            )
+
+    @classmethod
+    def bump_all(cls):
+        """
+        Invalidate every cached performance query, e.g. when a vessel or label
+        is renamed or removed. The columnar store is read again once rebuilt
+        (build_columnar_store).
+        """
+        cls.objects.update(version=models.F("version") + 1)
+
+    @classmethod
+    def versions(cls, dataset, partitions):
+        """{(vessel, month): version} of the (vessel, first day of month) partitions of dataset that have one."""
+        partitions = set(partitions)
+        rows = cls.objects.filter(dataset=dataset, vessel__in={vessel for vessel, _ in partitions},
+                                  month__in={month for _, month in partitions})
+        return {
+            (vessel, month): version for vessel, month, version in rows.values_list("vessel", "month", "version")
+            if (vessel, month) in partitions
+        }
+
+class IngestionRun(models.Model):
+    """
+    One workbook handled by the Parser ingestion, imported or failed, written
+    by Parser/runlog.py: what was read, melted, skipped and written, and the
+    seconds spent in each phase, so slow or failing imports can be found.
+    """
+    OK = "ok"
+    FAILED = "failed"
+    STATUSES = [(OK, "OK"), (FAILED, "Failed")]
+
+    file_name = models.CharField(max_length=255)
+    path = models.CharField(max_length=1024, blank=True, default="")
+    target_table = models.CharField(max_length=64)  # e.g. enr_enrparameter
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    status = models.CharField(max_length=10, choices=STATUSES)
+    error = models.TextField(blank=True, default="")  # Exception of a failed run
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+
+    rows_read = models.PositiveIntegerField(default=0)  # Sheet rows read from the workbook
+    rows_melted = models.PositiveIntegerField(default=0)  # Numeric (key, parameter) cells
+    rows_non_numeric = models.PositiveIntegerField(default=0)  # Empty / non-numeric cells, not written
+    rows_unknown_vessel = models.PositiveIntegerField(default=0)  # Cells of vessels missing from VesselList
+    unknown_vessels = models.TextField(blank=True, default="")  # Comma separated vessel ids
+    inserted = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    new_parameters = models.PositiveIntegerField(default=0)
+    calculated = models.PositiveIntegerField(default=0)
+
+    read_seconds = models.FloatField(default=0)  # Reading the sheet
+    melt_seconds = models.FloatField(default=0)  # Cleaning and melting the sheet
+    db_seconds = models.FloatField(default=0)  # ingestion.ingest, one transaction
+    total_seconds = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ["-started_at"]
+        indexes = [
+            models.Index(fields=["started_at"], name="ingestion_run_started"),
+            models.Index(fields=["status", "started_at"], name="ingestion_run_status"),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} {self.status} {self.started_at:%Y-%m-%d %H:%M}"
+
+    @property
+    def rows_upserted(self):
+        """Cells actually written (inserted or updated)."""
+        return self.inserted + self.updated
+
+    @property
+    def rows_per_sec(self):
+        """Melted cells per second over the whole run."""
+        return self.rows_melted / self.total_seconds if self.total_seconds else None
+
+
+def sync_columnar_store(dataset, partitions, store=None):
+    """
+    Rewrite the (vessel, month) partitions of dataset (enr.storage) from the
+    database rows, when a columnar store is configured.
+    """
+    store = store or ColumnarStore.from_settings()
+    if store is None or not partitions:
+        return
+    model = EnrParameter if dataset is ENR_DATASET else SeaTrialParameter
+    condition = models.Q(pk__in=[])
+    for vessel, month in partitions:
+        start, end = month, next_month(month)
+        if dataset.range_column == "timestamp":
+            start, end = (datetime.datetime.combine(day, datetime.time(), datetime.timezone.utc) for day in (start, end))
+        condition |= models.Q(vessel=vessel, **{f"{dataset.range_column}__gte": start, f"{dataset.range_column}__lt": end})
+    # The store keeps the movement / displacement labels
+    fields = [f"{column}__name" if column in LABEL_FIELDS else column for column in dataset.columns]
+    rows = model.objects.filter(condition, parameter__isnull=False).values_list("vessel", *fields)
+    frame = pd.DataFrame(list(rows), columns=["vessel", *dataset.columns])
+    store.write_partitions(dataset, frame, partitions, PartitionVersion.versions(dataset.name, partitions))
@@ -0,0 +1,180 @@
+"""
+Vectorized long <-> wide reshaping for EnrParameter and SeaTrialParameter data.
+
+Long format is one row per (keys..., parameter, value), the shape stored in the
+database. Wide format is one row per key with a column per parameter, the shape
+of the ENR / sea-trial workbooks and of the pivoted API responses.
+
+This module only depends on NumPy/pandas so it can be shared by the Django
+views and by the standalone ingestion scripts in Parser/.
+"""
+import numpy as np
+import pandas as pd
+
+ENR_KEYS = ["vessel", "date", "movement", "displacement"]
+SEATRIAL_KEYS = ["vessel", "session", "timestamp", "displacement"]
+
+
+def parameter_column(parameter_id):
+    """Name of the wide column holding the values of one parameter."""
+    return f"parameter_{parameter_id}"
+
+
+def long_frame(rows, keys, parameter="parameter", value="value"):
+    """
+    Build a long DataFrame from an iterable of (keys..., parameter, value) tuples,
+    e.g. ``queryset.values_list(*keys, "parameter", "value")``.
+    Key columns are kept as object dtype so ids stay ints and None stays None.
+    """
+    columns = list(keys) + [parameter, value]
+    data = np.array(list(rows), dtype=object).reshape(-1, len(columns))
+    frame = {column: pd.Series(data[:, i], dtype=object) for i, column in enumerate(columns[:-1])}
+    frame[value] = data[:, -1].astype(float)
+    return pd.DataFrame(frame, columns=columns)
+
+
+def group_codes(df, keys):
+    """
+    Number the distinct key combinations of df in order of first appearance.
+    Each key column is factorized on its own (missing values get a code too)
+    and the per-column codes are combined arithmetically, re-factorizing after
+    each column so the combined codes never exceed the number of rows.
+    """
+    combined, n_groups = np.zeros(len(df), dtype=np.int64), 1
+    for key in keys:
+        codes, uniques = pd.factorize(df[key], use_na_sentinel=False)
+        combined, groups = pd.factorize(combined * len(uniques) + codes)
+        n_groups = len(groups)
+    return combined, n_groups
+
+
+def pivot_frame(df, keys, parameter="parameter", value="value", parameters=None):
+    """
+    Pivot a long DataFrame to wide.
+    Groups are numbered with categorical codes and values are scattered into a
+    2D float array in one step, so missing keys (None/NaN) are kept and the
+    groups appear in the order of the input rows.
+
+    Returns (key_frame, parameter_values, matrix) where matrix[i, j] is the
+    value of parameter_values[j] for key_frame row i (NaN when missing).
+    """
+    if parameters is None:
+        parameter_codes, parameter_values = pd.factorize(df[parameter], sort=True)
+    else:
+        parameter_values = pd.Index(parameters)
+        parameter_codes = parameter_values.get_indexer(df[parameter])
+
+    codes, n_groups = group_codes(df, keys)
+
+    matrix = np.full((n_groups, len(parameter_values)), np.nan)
+    known = parameter_codes >= 0
+    matrix[codes[known], parameter_codes[known]] = df[value].to_numpy(dtype=float)[known]
+
+    _, first_rows = np.unique(codes, return_index=True)
+    key_frame = df.iloc[first_rows][list(keys)].reset_index(drop=True)
+    return key_frame, list(parameter_values), matrix
+
+
+def wide_frame(df, keys, parameter="parameter", value="value", parameters=None, column_name=parameter_column):
+    """Pivot a long DataFrame into a wide DataFrame with one column per parameter."""
+    key_frame, parameter_values, matrix = pivot_frame(df, keys, parameter, value, parameters)
+    values = pd.DataFrame(matrix, columns=[column_name(p) for p in parameter_values])
+    return pd.concat([key_frame, values], axis=1)
+
+
+def pivot_records(rows, keys, parameters=None, select=None):
+    """
+    Pivot (keys..., parameter, value) tuples into a list of dicts shaped like
+    the multi-parameter API rows: key fields plus ``parameter_<id>`` for every
+    value the key has.
+
+    select(key_frame, matrix), when given, returns the indices of the pivoted
+    rows to keep, e.g. to downsample chart series.
+    """
+    key_frame, parameter_values, matrix = _pivot_selected(rows, keys, parameters, select)
+    columns = [parameter_column(p) for p in parameter_values]
+
+    records = []
+    key_rows = zip(*(key_frame[key].tolist() for key in keys))
+    for key_values, values in zip(key_rows, matrix.tolist()):
+        record = dict(zip(keys, key_values))
+        # NaN is the only value that is not equal to itself
+        record.update({column: v for column, v in zip(columns, values) if v == v})
+        records.append(record)
+    return records
+
+
+def pivot_columns(rows, keys, parameters=None, select=None):
+    """
+    pivot_records in a columnar layout: ``columns`` names the key fields and
+    the ``parameter_<id>`` columns holding any value, ``values`` holds one
+    list per column, None where a key has no value.
+    """
+    key_frame, parameter_values, matrix = _pivot_selected(rows, keys, parameters, select)
+    columns, values = list(keys), [key_frame[key].tolist() for key in keys]
+    for parameter_id, column in zip(parameter_values, matrix.T):
+        missing = np.isnan(column)
+        if missing.all():
+            continue
+        column = column.astype(object)
+        column[missing] = None
+        columns.append(parameter_column(parameter_id))
+        values.append(column.tolist())
+    return {"columns": columns, "values": values}
+
+
+def _pivot_selected(rows, keys, parameters, select):
+    key_frame, parameter_values, matrix = pivot_frame(long_frame(rows, keys), keys, parameters=parameters)
+    if select is not None:
+        kept = select(key_frame, matrix)
+        key_frame, matrix = key_frame.iloc[kept], matrix[kept]
+    return key_frame, parameter_values, matrix
+
+
+def series_cube(rows, vessels=None, parameters=None):
+    """
+    Reshape (vessel, date, parameter, value) tuples into series sharing one
+    date axis, for comparing vessels side by side.
+
+    Returns (dates, vessels, parameters, cube) where dates are the sorted
+    distinct dates and cube[i, j, k] is the value of parameters[j] for
+    vessels[i] on dates[k] (NaN when missing). Vessels and parameters default
+    to the ones present in rows.
+    """
+    df = long_frame(rows, ["vessel", "date"])
+    date_codes, dates = pd.factorize(df["date"], sort=True)
+    vessel_values = pd.Index(sorted(set(df["vessel"].dropna())) if vessels is None else vessels)
+    parameter_values = pd.Index(sorted(set(df["parameter"])) if parameters is None else parameters)
+    vessel_codes = vessel_values.get_indexer(df["vessel"])
+    parameter_codes = parameter_values.get_indexer(df["parameter"])
+
+    cube = np.full((len(vessel_values), len(parameter_values), len(dates)), np.nan)
+    known = (vessel_codes >= 0) & (parameter_codes >= 0)
+    cube[vessel_codes[known], parameter_codes[known], date_codes[known]] = df["value"].to_numpy(dtype=float)[known]
+    return list(dates), list(vessel_values), list(parameter_values), cube
+
+
+def unpivot_frame(df, keys, var_name="Parameter", value_name="Value"):
+    """
+    Melt a wide workbook frame into long format.
+    Every non-key column is coerced to numeric column-wise before melting.
+
+    Returns (melted, invalid): melted holds the rows with a numeric value,
+    invalid the rows dropped because the value was empty or non-numeric.
+    """
+    keys = list(keys)
+    value_columns = [column for column in df.columns if column not in keys]
+    values = df[value_columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    n_rows, n_columns = values.shape
+
+    row_index = np.repeat(np.arange(n_rows), n_columns)
+    melted = df[keys].iloc[row_index].reset_index(drop=True)
+    melted[var_name] = np.tile(np.array(value_columns, dtype=object), n_rows)
+    melted[value_name] = values.ravel()
+
+    valid = ~np.isnan(melted[value_name].to_numpy())
+    invalid = melted[~valid].copy()
+    if len(invalid):
+        raw = df[value_columns].to_numpy(dtype=object).ravel()
+        invalid[value_name] = raw[~valid]
+    return melted[valid].reset_index(drop=True), invalid
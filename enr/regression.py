@@ -0,0 +1,69 @@
+"""
+Least-squares curve fitting of paired sea-trial parameters (power curves).
+
+Readings of two parameters are paired by (session, timestamp), the same key the
+sea-trial charts use, and fitted with a polynomial. Like enr.pivot this module
+only depends on NumPy/pandas.
+"""
+import numpy as np
+
+from .pivot import long_frame, pivot_frame
+
+PAIR_KEYS = ["session", "timestamp"]
+X, Y = 0, 1
+
+
+def pair_values(rows, x_parameters, y_parameters):
+    """
+    Pair (session, timestamp, parameter, value) rows into x and y arrays.
+    A reading of any parameter in x_parameters is an x value, of y_parameters
+    a y value; keys missing either side are dropped. When a key has several
+    readings of one side the last one wins.
+    """
+    roles = {parameter: X for parameter in x_parameters}
+    roles.update({parameter: Y for parameter in y_parameters})
+    df = long_frame(rows, PAIR_KEYS)
+    if df.empty:
+        return np.empty(0), np.empty(0)
+    df["parameter"] = df["parameter"].map(roles)
+    df = df[df["parameter"].notna()]
+
+    _, _, matrix = pivot_frame(df, PAIR_KEYS, parameters=[X, Y])
+    matrix = matrix[~np.isnan(matrix).any(axis=1)]
+    return matrix[:, X], matrix[:, Y]
+
+
+def fit_polynomial(x, y, degree):
+    """
+    Least-squares polynomial fit of y on x.
+    Returns (coefficients, r_squared) with the coefficients highest power first,
+    as np.polyfit / np.polyval use them. The fit runs on x scaled to [-1, 1],
+    which keeps it well conditioned for large engine power values.
+    """
+    polynomial = np.polynomial.Polynomial.fit(x, y, degree).convert()
+    coefficients = polynomial.coef[::-1]
+    # convert() trims trailing zero coefficients, pad back to degree + 1 terms
+    coefficients = np.concatenate([np.zeros(degree + 1 - len(coefficients)), coefficients])
+    return coefficients, r_squared(y, np.polyval(coefficients, x))
+
+
+def r_squared(actual, predicted):
+    """Coefficient of determination, None when y is constant."""
+    ss_tot = np.sum((actual - actual.mean()) ** 2)
+    if ss_tot == 0:
+        return None
+    return float(1 - np.sum((actual - predicted) ** 2) / ss_tot)
+
+
+def sample_curve(coefficients, x_min, x_max, points):
+    """The fitted polynomial evaluated at points evenly spaced x values."""
+    x = np.linspace(x_min, x_max, points)
+    return x, np.polyval(coefficients, x)
+
+
+def sample_points(x, y, max_points):
+    """At most max_points of the pairs, evenly spread over the x-sorted data."""
+    order = np.argsort(x, kind="stable")
+    if len(order) > max_points:
+        order = order[np.linspace(0, len(order) - 1, max_points).round().astype(int)]
+    return x[order], y[order]
@@ -0,0 +1,105 @@
+"""Day, week and month aggregates of EnrParameter values per vessel and parameter, refreshed by changed period."""
+import pandas as pd
+
+GRANULARITIES = ("day", "week", "month")
+ROLLUP_KEYS = ["vessel", "parameter", "granularity", "period_start"]
+STATISTICS = ("count", "minimum", "maximum", "total", "mean", "last")
+
+
+def period_start(dates, granularity):
+    """First day of the period of every date, as a Series of datetime.date."""
+    dates = pd.to_datetime(pd.Series(dates)).dt.normalize()
+    if granularity == "day":
+        starts = dates
+    elif granularity == "week":
+        starts = dates - pd.to_timedelta(dates.dt.weekday, unit="D")
+    elif granularity == "month":
+        starts = dates - pd.to_timedelta(dates.dt.day - 1, unit="D")
+    else:
+        raise ValueError(f"Unknown granularity '{granularity}'")
+    return starts.dt.date
+
+
+def period_end(starts, granularity):
+    """Last day of the periods beginning at starts."""
+    starts = pd.to_datetime(pd.Series(starts))
+    if granularity == "day":
+        ends = starts
+    elif granularity == "week":
+        ends = starts + pd.Timedelta(days=6)
+    elif granularity == "month":
+        ends = starts + pd.offsets.MonthEnd(0)
+    else:
+        raise ValueError(f"Unknown granularity '{granularity}'")
+    return ends.dt.date
+
+
+def rollup_frame(df, granularity):
+    """
+    Aggregate a frame of vessel, parameter, date and value columns into one row
+    per (vessel, parameter, period_start) with the STATISTICS columns, ``last``
+    being the value of the latest date of the period. Rows without a vessel or
+    parameter are left out.
+    """
+    columns = ROLLUP_KEYS + list(STATISTICS)
+    df = df.dropna(subset=["vessel", "parameter"])
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    df = df.assign(
+        vessel=df["vessel"].astype("int64"),
+        parameter=df["parameter"].astype("int64"),
+        period_start=period_start(df["date"], granularity).to_numpy(),
+    )
+    df = df.sort_values("date", kind="stable")
+    rollups = (
+        df.groupby(["vessel", "parameter", "period_start"], sort=True)["value"]
+        .agg(count="count", minimum="min", maximum="max", total="sum", mean="mean", last="last")
+        .reset_index()
+    )
+    rollups["granularity"] = granularity
+    return rollups[columns]
+
+
+def affected_periods(changed, granularity):
+    """Distinct (vessel, parameter, granularity, period_start) of the changed rows (vessel, parameter, date)."""
+    changed = changed.dropna(subset=["vessel", "parameter"])
+    periods = pd.DataFrame({
+        "vessel": changed["vessel"].astype("int64").to_numpy(),
+        "parameter": changed["parameter"].astype("int64").to_numpy(),
+        "granularity": granularity,
+        "period_start": period_start(changed["date"], granularity).to_numpy(),
+    })
+    return periods.drop_duplicates(ignore_index=True)
+
+
+def rollup_range(dates):
+    """First and last day of all periods, of any granularity, that contain one of dates."""
+    firsts, lasts = [], []
+    for granularity in GRANULARITIES:
+        starts = period_start(dates, granularity)
+        firsts.append(starts.min())
+        lasts.append(period_end(starts, granularity).max())
+    return min(firsts), max(lasts)
+
+
+def refresh_frames(changed, raw):
+    """
+    Recompute the periods touched by changed.
+
+    changed holds the (vessel, parameter, date) of inserted, updated or
+    deleted values, raw the current (vessel, parameter, date, value) rows of
+    those vessels and parameters over rollup_range(changed dates).
+
+    Returns (rollups, stale): the rollup rows to upsert for every affected
+    period, and the affected ROLLUP_KEYS that have no values left and must be
+    deleted.
+    """
+    rollups, stale = [], []
+    for granularity in GRANULARITIES:
+        affected = affected_periods(changed, granularity)
+        current = rollup_frame(raw, granularity).merge(affected, on=ROLLUP_KEYS, how="inner")
+        missing = affected.merge(current[ROLLUP_KEYS], on=ROLLUP_KEYS, how="left", indicator=True)
+        rollups.append(current)
+        stale.append(missing.loc[missing["_merge"] == "left_only", ROLLUP_KEYS])
+    return pd.concat(rollups, ignore_index=True), pd.concat(stale, ignore_index=True)
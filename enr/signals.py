@@ -0,0 +1,162 @@
+from dataclasses import dataclass, field
+
+import pandas as pd
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    DataVersion, DisplacementList, EnrParameter, EnrParameterRollup, MovementList, ParameterList, PartitionVersion,
+    SeaTrialParameter, VesselList, sync_columnar_store,
+)
+from .storage import ENR_DATASET, SEATRIAL_DATASET, partitions_of
+
+# Model -> DataVersion name bumped when one of its rows changes
+VERSIONED_MODELS = {
+    EnrParameter: DataVersion.ENR,
+    SeaTrialParameter: DataVersion.SEATRIAL,
+    VesselList: DataVersion.VESSELS,
+    ParameterList: DataVersion.PARAMETERS,
+    MovementList: DataVersion.ENR,
+    DisplacementList: DataVersion.ENR,
+}
+
+
+@dataclass
+class PendingChanges:
+    """
+    What the saves and deletes of one transaction invalidate. It is its own
+    on_commit callback, so it is applied once when the transaction commits and
+    dropped with it when it rolls back.
+    """
+    using: str
+    versions: set = field(default_factory=set)  # DataVersion names to bump
+    all_partitions: bool = False  # PartitionVersion.bump_all
+    enr: set = field(default_factory=set)  # (vessel, parameter, date) of the changed EnrParameter rows
+    seatrial: set = field(default_factory=set)  # (vessel, month) partitions of the changed SeaTrialParameter rows
+    applied: bool = False
+
+    def __call__(self):
+        self.applied = True
+        apply_changes(self)
+
+
+def _pending_changes(using):
+    """
+    The PendingChanges registered in the current transaction or savepoint, so
+    rolling back to a savepoint drops its changes too. None outside of one.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        return None
+    savepoints = set(connection.savepoint_ids)
+    for savepoint_ids, callback, *_ in reversed(connection.run_on_commit):
+        if isinstance(callback, PendingChanges) and savepoint_ids == savepoints and not callback.applied:
+            return callback
+    return None
+
+
+def _remember(using, versions=(), all_partitions=False, enr=(), seatrial=()):
+    changes = _pending_changes(using)
+    scheduled = changes is not None
+    if not scheduled:
+        changes = PendingChanges(using)
+    changes.versions.update(versions)
+    changes.all_partitions |= all_partitions
+    changes.enr.update(enr)
+    changes.seatrial.update(seatrial)
+    if not scheduled:
+        # Called straight away in autocommit mode
+        transaction.on_commit(changes, using=using)
+
+
+def bump_on_save(sender, using, raw=False, **kwargs):
+    # raw saves come from loaddata fixtures
+    if not raw:
+        _remember(using, versions=[VERSIONED_MODELS[sender]])
+
+
+def bump_on_delete(sender, using, **kwargs):
+    if sender in (VesselList, ParameterList, MovementList, DisplacementList):
+        # The performance rows keep their values but lose the vessel / parameter / label (SET_NULL)
+        _remember(using, versions=[VERSIONED_MODELS[sender], DataVersion.ENR, DataVersion.SEATRIAL], all_partitions=True)
+    else:
+        _remember(using, versions=[VERSIONED_MODELS[sender]])
+
+
+# Connected per model, so saving or deleting other models (rollups, sessions, ...) has no receiver to call
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_on_save, sender=model)
+    post_delete.connect(bump_on_delete, sender=model)
+
+
+@receiver(post_save, sender=MovementList)
+@receiver(post_save, sender=DisplacementList)
+def bump_on_label_change(sender, using, raw=False, **kwargs):
+    # Cached performance rows show the labels
+    if not raw:
+        _remember(using, all_partitions=True)
+
+
+def _rollup_keys(instance):
+    return (instance.vessel_id, instance.parameter_id, instance.date)
+
+
+@receiver(pre_save, sender=EnrParameter)
+def remember_rollup_keys(sender, instance, raw=False, **kwargs):
+    # An edit that moves a value to another vessel, parameter or date also changes its old period
+    if instance.pk and not raw:
+        instance._previous_rollup_keys = (
+            EnrParameter.objects.filter(pk=instance.pk).values_list("vessel", "parameter", "date").first()
+        )
+
+
+def _changed_keys(instance):
+    keys = {_rollup_keys(instance)}
+    previous = getattr(instance, "_previous_rollup_keys", None)
+    if previous:
+        keys.add(previous)
+    return keys
+
+
+@receiver(post_save, sender=EnrParameter)
+@receiver(post_delete, sender=EnrParameter)
+def remember_enr_changes(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        _remember(using, enr=_changed_keys(instance))
+
+
+@receiver(post_save, sender=SeaTrialParameter)
+@receiver(post_delete, sender=SeaTrialParameter)
+def remember_seatrial_changes(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        _remember(using, seatrial=partitions_of([instance.vessel_id], [instance.timestamp]))
+
+
+def apply_changes(changes):
+    """
+    Refresh the rollups, calculated parameters and columnar store partitions of
+    the rows changed in a committed transaction, and bump the versions the
+    cached responses are keyed by.
+    """
+    partitions = {ENR_DATASET: [], SEATRIAL_DATASET: sorted(changes.seatrial)}
+
+    if changes.enr:
+        changed = pd.DataFrame(list(changes.enr), columns=["vessel", "parameter", "date"])
+        EnrParameterRollup.refresh(changed)
+        # Calculated values of the same vessels and dates that use the changed parameters
+        written = EnrParameter.recalculate(changed)
+        if not written.empty:
+            EnrParameterRollup.refresh(written)
+            changes.versions.add(DataVersion.ENR)
+        partitions[ENR_DATASET] = partitions_of(changed["vessel"], changed["date"])
+
+    for name in sorted(changes.versions):
+        DataVersion.bump(name)
+    if changes.all_partitions:
+        PartitionVersion.bump_all()
+    for dataset, changed_partitions in partitions.items():
+        # Also after bump_all, which does not create the versions of new partitions
+        if changed_partitions:
+            PartitionVersion.bump(dataset.name, changed_partitions)
+            sync_columnar_store(dataset, changed_partitions)
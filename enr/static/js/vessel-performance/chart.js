@@ -20,23 +20,31 @@ async function fetchChartData(url) {
 
 // static/js/chart.js
 
-function plotScatterChart(data) {
+// Values of one column of a layout=columnar response, empty when the column is absent
+function columnValues(results, name) {
+    const index = results.columns.indexOf(name);
+    return index === -1 ? [] : results.values[index];
+}
+
+function plotScatterChart(results) {
     const ctx = document.getElementById("scatterChart").getContext("2d");
     const selectedParameters = getSelectedParameters();
     let parameterMap = {};
     document.querySelectorAll("#parameter-checkboxes input[type='checkbox']").forEach(checkbox => {
          parameterMap[checkbox.value] = checkbox.nextElementSibling.textContent;
     });
-    const datasets = selectedParameters.map(paramId => ({
-         label: parameterMap[paramId] || `Parameter ${paramId}`,
-         data: data.map(item => ({
-              x: new Date(item.date),
-              y: item[`parameter_${paramId}`] || 0
-         })),
-         borderColor: getRandomColor(),
-         backgroundColor: "transparent",
-         pointBackgroundColor: getRandomColor()
-    }));
+    // Dates are parsed once and shared by every parameter series
+    const dates = columnValues(results, "date").map(date => new Date(date));
+    const datasets = selectedParameters.map(paramId => {
+         const values = columnValues(results, `parameter_${paramId}`);
+         return {
+              label: parameterMap[paramId] || `Parameter ${paramId}`,
+              data: dates.map((x, i) => ({ x, y: values[i] || 0 })),
+              borderColor: getRandomColor(),
+              backgroundColor: "transparent",
+              pointBackgroundColor: getRandomColor()
+         };
+    });
     // Safely destroy existing chart instance if it exists and has a destroy method
     if (window.scatterChart && typeof window.scatterChart.destroy === 'function') {
          window.scatterChart.destroy();
@@ -61,4 +69,5 @@ function getRandomColor() {
 
 window.fetchChartData = fetchChartData;
 window.plotScatterChart = plotScatterChart;
+window.columnValues = columnValues;
 window.getRandomColor = getRandomColor;
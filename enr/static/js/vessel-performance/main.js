@@ -28,10 +28,13 @@ document.addEventListener("DOMContentLoaded", () => {
 // The applyFilters function remains unchanged.
 function applyFilters() {
     currentPage = 1; // Reset pagination to first page
-    const tableUrl = buildUrl("/api/performance/multiple/");
+    // The table lists daily voyage rows, the chart lets the API pick rollups for long ranges
+    const tableUrl = buildUrl("/api/performance/multiple/", { resolution: "raw", count: "true" });
     console.log("Constructed Table URL:", tableUrl.toString());
-    // For chart data, add full_data flag
-    const chartUrl = buildUrl("/api/performance/multiple/", { full_data: "true" });
+    // For chart data, add full_data flag, downsampled to about one point per pixel of the chart
+    const chartWidth = document.getElementById("scatterChart")?.clientWidth || 800;
+    // Columnar layout: one array per column, no key names repeated in every row
+    const chartUrl = buildUrl("/api/performance/multiple/", { full_data: "true", max_points: chartWidth, layout: "columnar" });
     console.log("Constructed Chart URL:", chartUrl.toString());
     fetchChartData(chartUrl);
     fetchTableData(tableUrl);
@@ -2,6 +2,9 @@
 let currentPage = 1;
 let pageSize = 10;
 let totalRows = 0;
+// Cursor links of the neighbouring pages, returned by the API
+let nextPageUrl = null;
+let previousPageUrl = null;
 
 async function fetchTableData(url) {
     try {
@@ -18,8 +21,13 @@ async function fetchTableData(url) {
         const tabledata = await response.json();
         console.log("API Response (Table Data):", tabledata);
         displayTable(tabledata.results);
-        totalRows = tabledata.count || 0;
+        // The total is only counted for the first page of a filter (count=true)
+        if (tabledata.count !== null && tabledata.count !== undefined) {
+            totalRows = tabledata.count;
+        }
         const maxPages = Math.max(1, Math.ceil(totalRows / pageSize));
+        nextPageUrl = tabledata.next;
+        previousPageUrl = tabledata.previous;
         updatePaginationControls(tabledata.next, tabledata.previous);
         document.getElementById("pagination-info").textContent = `Page ${currentPage} of ${maxPages}`;
     } catch (error) {
@@ -73,12 +81,10 @@ function updatePaginationControls(next, previous) {
 }
 
 function changePage(increment) {
-    const totalPages = Math.ceil(totalRows / pageSize);
-    const newPage = currentPage + increment;
-    if (newPage >= 1 && newPage <= totalPages) {
-         currentPage = newPage;
-         const url = buildUrl("/api/performance/multiple/", { page: currentPage });
-         console.log(`Paginated URL with Filters (Page ${currentPage}):`, url.toString());
+    const url = increment > 0 ? nextPageUrl : previousPageUrl;
+    if (url) {
+         currentPage += increment;
+         console.log(`Paginated URL with Filters (Page ${currentPage}):`, url);
          fetchTableData(url);
     }
 }
@@ -1,105 +1,67 @@
-async function fetchChartData(url) {
+// Power curves: x/y parameter descriptions of each chart, fitted server-side
+const REGRESSION_CHARTS = [
+    { canvasId: "scatterChart1", x: "M/E Power", y: "FOC (kl/day)", regressionInfoId: "regressionInfo1" },
+    { canvasId: "scatterChart2", x: "M/E Power", y: "Ship Speed (GPS)", regressionInfoId: "regressionInfo2" },
+];
+const REGRESSION_DEGREE = 2;
+
+async function fetchChartData() {
+    await Promise.all(REGRESSION_CHARTS.map(chart => fetchRegression(chart)));
+}
+
+async function fetchRegression(chart) {
     try {
-        console.log("Constructed URL for Chart Data:", url.toString());
+        const url = buildUrl("/api/performance/seatrial/regression/", {
+            x: chart.x,
+            y: chart.y,
+            degree: REGRESSION_DEGREE,
+        });
+        console.log("Constructed URL for Regression:", url.toString());
         const response = await fetchWithAuth(url);
         if (!response.ok) {
             if (response.status === 401) {
                 alert("Session expired. Please log in again.");
                 logout();
-            } else {
-                throw new Error("Failed to fetch chart data");
+                return;
             }
+            throw new Error("Failed to fetch regression");
         }
-        const chartData = await response.json();
-        console.log("API Response (Chart Data):", chartData.results);
-        plotScatterChartGeneric(chartData.results,"scatterChart1", "M/E Power", "FOC (kl/day)", "regressionInfo1");
-        plotScatterChartGeneric(chartData.results,"scatterChart2", "M/E Power", "Ship Speed (GPS)", "regressionInfo2");
+        const regression = await response.json();
+        console.log("API Response (Regression):", regression);
+        plotRegressionChart(regression, chart.canvasId, chart.regressionInfoId);
     } catch (error) {
         console.error("Error fetching chart data:", error);
     }
 }
 
-// Generic function to plot a scatter chart with quadratic regression line
-// Generic function to plot a scatter chart with a quadratic regression line,
-// filtering out any pairs where either x or y is missing or not a valid number.
-function plotScatterChartGeneric(data, canvasId, xAxisParam, yAxisParam, regressionInfoId) {
-    const ctx = document.getElementById(canvasId).getContext("2d");
-
-    // Group data by a unique key using 'session' and 'timestamp'
-    let groups = data.reduce((acc, item) => {
-        // Only consider items for the specified parameters
-        if (item.description === xAxisParam || item.description === yAxisParam) {
-            // Use a unique key from session and timestamp (adjust as needed)
-            let key = item.session + "_" + item.timestamp;
-            if (!acc[key]) {
-                acc[key] = {};
-            }
-            // For the x-axis parameter, store the value if it's valid
-            if (item.description === xAxisParam) {
-                let val = Number(item.value);
-                if (!isNaN(val)) {
-                    acc[key].x = val;
-                }
-            }
-            // For the y-axis parameter, store the value if it's valid
-            if (item.description === yAxisParam) {
-                let val = Number(item.value);
-                if (!isNaN(val)) {
-                    acc[key].y = val;
-                }
-            }
-        }
-        return acc;
-    }, {});
-
-    // Build arrays from groups for valid pairs
-    let xValues = [];
-    let yValues = [];
-    let dataPoints = [];
-    Object.keys(groups).forEach(key => {
-        const pair = groups[key];
-        // Only include pairs if both x and y exist
-        if (pair.x !== undefined && pair.y !== undefined) {
-            xValues.push(pair.x);
-            yValues.push(pair.y);
-            dataPoints.push({ x: pair.x, y: pair.y });
-        }
+// Format the fitted polynomial, coefficients are highest power first (8 decimal places)
+function formatPolynomial(coefficients) {
+    const degree = coefficients.length - 1;
+    const superscripts = { 2: "²", 3: "³", 4: "⁴", 5: "⁵", 6: "⁶" };
+    const terms = coefficients.map((coefficient, i) => {
+        const power = degree - i;
+        const variable = power === 0 ? "" : power === 1 ? "x" : `x${superscripts[power]}`;
+        return `${coefficient.toFixed(8)}${variable}`;
     });
+    return `y = ${terms.join(" + ")}`;
+}
 
-    if (dataPoints.length === 0) {
-        console.error(`❌ No valid data points found for ${canvasId}`);
-        return;
-    }
-
-    // Compute quadratic regression coefficients and function
-    const { regressionFunc, coefficients } = polynomialRegression(xValues, yValues);
+// Plot the scatter sample and the fitted curve returned by the regression endpoint
+function plotRegressionChart(regression, canvasId, regressionInfoId) {
+    const ctx = document.getElementById(canvasId).getContext("2d");
+    const infoEl = regressionInfoId ? document.getElementById(regressionInfoId) : null;
 
-    // Generate regression line data using sorted x values
-    const sortedX = [...xValues].sort((a, b) => a - b);
-    const minX = sortedX[0];
-    const maxX = sortedX[sortedX.length - 1];
-    const numPoints = 100;
-    const step = (maxX - minX) / (numPoints - 1);
-    let regressionData = [];
-    for (let i = 0; i < numPoints; i++) {
-        const x = minX + i * step;
-        regressionData.push({ x: x, y: regressionFunc(x) });
+    if (regression.n === 0) {
+        console.error(`❌ No valid data points found for ${canvasId}`);
     }
 
-    // Compute R² value for additional info
-    const predictedY = dataPoints.map(pt => regressionFunc(pt.x));
-    const actualY = dataPoints.map(pt => pt.y);
-    const rSquared = computeRSquared(actualY, predictedY);
-
-    // Format the regression equation and R² (using 8 decimal places)
-    const formula = `y = ${coefficients.a.toFixed(8)}x² + ${coefficients.b.toFixed(8)}x + ${coefficients.c.toFixed(8)}`;
-    const rSquaredText = `R² = ${rSquared.toFixed(8)}`;
-
     // Display regression info if a container is provided
-    if (regressionInfoId) {
-        const infoEl = document.getElementById(regressionInfoId);
-        if (infoEl) {
-            infoEl.innerHTML = `<strong>${formula}</strong><br>${rSquaredText}`;
+    if (infoEl) {
+        if (regression.coefficients) {
+            const rSquaredText = regression.r_squared === null ? "R² = n/a" : `R² = ${regression.r_squared.toFixed(8)}`;
+            infoEl.innerHTML = `<strong>${formatPolynomial(regression.coefficients)}</strong><br>${rSquaredText}`;
+        } else {
+            infoEl.textContent = `Not enough points for a degree ${regression.degree} fit (${regression.n} pairs)`;
         }
     }
 
@@ -114,8 +76,8 @@ function plotScatterChartGeneric(data, canvasId, xAxisParam, yAxisParam, regress
         data: {
             datasets: [
                 {
-                    label: `${xAxisParam} vs ${yAxisParam}`,
-                    data: dataPoints,
+                    label: `${regression.x_parameter} vs ${regression.y_parameter}`,
+                    data: regression.scatter,
                     borderColor: "blue",
                     backgroundColor: "rgba(0, 0, 255, 0.1)",
                     pointBackgroundColor: "blue",
@@ -123,7 +85,7 @@ function plotScatterChartGeneric(data, canvasId, xAxisParam, yAxisParam, regress
                 },
                 {
                     label: "Regression Line",
-                    data: regressionData,
+                    data: regression.curve,
                     type: "line", // Force line type for regression
                     borderColor: "lightblue",
                     backgroundColor: "transparent",
@@ -137,88 +99,10 @@ function plotScatterChartGeneric(data, canvasId, xAxisParam, yAxisParam, regress
             responsive: true,
             maintainAspectRatio: false,
             scales: {
-                x: { title: { display: true, text: xAxisParam } },
-                y: { title: { display: true, text: yAxisParam } }
+                x: { title: { display: true, text: regression.x_parameter } },
+                y: { title: { display: true, text: regression.y_parameter } }
             },
             plugins: { legend: { display: true } }
         }
     });
 }
-
-  
-// Helper: Compute determinant of a 3x3 matrix
-function determinant3(m) {
-    return m[0][0] * (m[1][1] * m[2][2] - m[1][2] * m[2][1])
-         - m[0][1] * (m[1][0] * m[2][2] - m[1][2] * m[2][0])
-         + m[0][2] * (m[1][0] * m[2][1] - m[1][1] * m[2][0]);
-}
-  
-// Compute quadratic regression (y = a*x^2 + b*x + c)
-// using normal equations and Cramer's rule.
-function polynomialRegression(xValues, yValues) {
-    const n = xValues.length;
-    let sumX = 0, sumY = 0, sumX2 = 0, sumX3 = 0, sumX4 = 0;
-    let sumXY = 0, sumX2Y = 0;
-    for (let i = 0; i < n; i++) {
-        const x = xValues[i];
-        const y = yValues[i];
-        const x2 = x * x;
-        const x3 = x2 * x;
-        const x4 = x3 * x;
-        sumX  += x;
-        sumY  += y;
-        sumX2 += x2;
-        sumX3 += x3;
-        sumX4 += x4;
-        sumXY += x * y;
-        sumX2Y += x2 * y;
-    }
-    // Build coefficient matrix A and vector B
-    let A = [
-        [n, sumX, sumX2],
-        [sumX, sumX2, sumX3],
-        [sumX2, sumX3, sumX4]
-    ];
-    let B = [sumY, sumXY, sumX2Y];
-      
-    const detA = determinant3(A);
-    if (detA === 0) {
-        console.error("Determinant is zero. Regression cannot be computed.");
-        return { regressionFunc: (x) => 0, coefficients: { a: 0, b: 0, c: 0 } };
-    }
-      
-    // Solve for c, b, a using Cramer's rule
-    let A_c = [
-        [B[0], A[0][1], A[0][2]],
-        [B[1], A[1][1], A[1][2]],
-        [B[2], A[2][1], A[2][2]]
-    ];
-    let A_b = [
-        [A[0][0], B[0], A[0][2]],
-        [A[1][0], B[1], A[1][2]],
-        [A[2][0], B[2], A[2][2]]
-    ];
-    let A_a = [
-        [A[0][0], A[0][1], B[0]],
-        [A[1][0], A[1][1], B[1]],
-        [A[2][0], A[2][1], B[2]]
-    ];
-      
-    const c = determinant3(A_c) / detA;
-    const b = determinant3(A_b) / detA;
-    const a = determinant3(A_a) / detA;
-      
-    return { regressionFunc: (x) => a * x * x + b * x + c, coefficients: { a, b, c } };
-}
-  
-// Function to compute R-squared given actual and predicted values
-function computeRSquared(actualY, predictedY) {
-    const n = actualY.length;
-    const meanY = actualY.reduce((acc, val) => acc + val, 0) / n;
-    let ssTot = 0, ssRes = 0;
-    for (let i = 0; i < n; i++) {
-        ssTot += Math.pow(actualY[i] - meanY, 2);
-        ssRes += Math.pow(actualY[i] - predictedY[i], 2);
-    }
-    return 1 - ssRes / ssTot;
-}
\ No newline at end of file
@@ -4,11 +4,14 @@ function getFilterParams() {
     };
 }
 
-function buildUrl(endpoint) {
+function buildUrl(endpoint, extraParams = {}) {
     const url = new URL(`${window.location.origin}${endpoint}`);
     const filters = getFilterParams();
     const params = new URLSearchParams();
     if (filters.vessel) params.append("vessel", filters.vessel);
+    Object.keys(extraParams).forEach(key => {
+         params.append(key, extraParams[key]);
+    });
     url.search = params.toString();
     return url;
 }
\ No newline at end of file
@@ -33,7 +33,7 @@ function applyFilters() {
     // console.log("Constructed Chart URL:", chartUrl.toString());
     // fetchChartData(chartUrl);
     fetchTableData(Url);
-    fetchChartData(Url);
+    fetchChartData();
 }
 
 document.addEventListener("DOMContentLoaded", () => {
@@ -0,0 +1,211 @@
+"""
+Optional Parquet copy of the performance data, one file per vessel and month,
+rewritten from the database and tagged with the PartitionVersion it was read at.
+"""
+import datetime
+import os
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Dataset:
+    name: str
+    range_column: str    # date / timestamp column partitions are split by month on
+    columns: tuple       # stored columns besides the vessel, in file order
+    text_columns: tuple  # dictionary-encoded string columns
+
+
+ENR_DATASET = Dataset(
+    name="enr",
+    range_column="date",
+    columns=("date", "movement", "displacement", "parameter", "value"),
+    text_columns=("movement", "displacement"),
+)
+SEATRIAL_DATASET = Dataset(
+    name="seatrial",
+    range_column="timestamp",
+    columns=("session", "timestamp", "displacement", "parameter", "value"),
+    text_columns=("session", "displacement"),
+)
+DATASETS = {dataset.name: dataset for dataset in (ENR_DATASET, SEATRIAL_DATASET)}
+
+# Parquet metadata key of the PartitionVersion a file was written at
+VERSION_KEY = b"partition_version"
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def next_month(month):
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partitions_of(vessels, values):
+    """Distinct (vessel, first day of month) of aligned vessel ids and dates / timestamps."""
+    frame = pd.DataFrame({"vessel": list(vessels), "value": list(values)}).dropna()
+    return sorted({(int(vessel), month_start(value)) for vessel, value in frame.itertuples(index=False)})
+
+
+class ColumnarStore:
+    def __init__(self, root):
+        self.root = root
+
+    @classmethod
+    def from_settings(cls):
+        """The store at settings.ENR_COLUMNAR_STORE, None when it is not configured or pyarrow is missing."""
+        from django.conf import settings
+
+        root = getattr(settings, "ENR_COLUMNAR_STORE", None)
+        if not root:
+            return None
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return None
+        return cls(root)
+
+    def _path(self, dataset, vessel, month):
+        return os.path.join(self.root, dataset.name, f"vessel={vessel}", f"{month:%Y-%m}.parquet")
+
+    def _schema(self, dataset):
+        import pyarrow as pa
+
+        types = {
+            "date": pa.date32(),
+            "timestamp": pa.timestamp("us", tz="UTC"),
+            "parameter": pa.int64(),
+            "value": pa.float64(),
+        }
+        return pa.schema([
+            (column, pa.dictionary(pa.int32(), pa.string()) if column in dataset.text_columns else types[column])
+            for column in dataset.columns
+        ])
+
+    def write_partition(self, dataset, vessel, month, frame, version=0):
+        """
+        Replace the partition of vessel and month with frame (dataset.columns),
+        recording the PartitionVersion it was read at; an empty partition is
+        kept as a file without rows. The file is swapped in atomically.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = self._path(dataset, vessel, month)
+        frame = frame.sort_values([dataset.range_column, "parameter"], kind="stable")
+        columns = {}
+        for column in dataset.columns:
+            values = frame[column]
+            if column in dataset.text_columns:
+                values = values.astype(object).where(values.notna(), None)
+            elif column == "timestamp":
+                values = pd.to_datetime(values, utc=True)
+            columns[column] = values.to_numpy() if column != "date" else list(values)
+        schema = self._schema(dataset).with_metadata({VERSION_KEY: str(version)})
+        table = pa.Table.from_pydict(columns, schema=schema)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(table, temporary, compression="zstd")
+        os.replace(temporary, path)
+
+    def write_partitions(self, dataset, frame, partitions, versions=None):
+        """
+        Rewrite partitions [(vessel, month)] from frame, the current rows
+        (vessel + dataset.columns) of those vessels and months, and versions
+        {(vessel, month): PartitionVersion} they were read at, 0 when missing.
+        """
+        versions = versions or {}
+        if frame.empty:
+            vessels, months = pd.Series([], dtype="int64"), pd.Series([], dtype=object)
+        else:
+            vessels = frame["vessel"].astype("int64")
+            months = frame[dataset.range_column].map(month_start)
+        for vessel, month in partitions:
+            rows = frame[((vessels == vessel) & (months == month)).to_numpy()]
+            self.write_partition(dataset, vessel, month, rows[list(dataset.columns)], versions.get((vessel, month), 0))
+
+    def version(self, dataset, vessel, month):
+        """The PartitionVersion the partition was written at, None when it is not stored."""
+        import pyarrow.parquet as pq
+
+        path = self._path(dataset, vessel, month)
+        if not os.path.exists(path):
+            return None
+        metadata = pq.read_schema(path).metadata or {}
+        return int(metadata.get(VERSION_KEY, 0))
+
+    def stale_partitions(self, dataset, versions):
+        """The partitions of versions {(vessel, month): PartitionVersion} missing from the store or written earlier."""
+        return sorted(
+            (vessel, month) for (vessel, month), version in versions.items()
+            if self.version(dataset, vessel, month) != version
+        )
+
+    def months(self, dataset, vessel):
+        """First days of the months stored for vessel."""
+        directory = os.path.join(self.root, dataset.name, f"vessel={vessel}")
+        names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+        return [
+            datetime.datetime.strptime(name[:-len(".parquet")], "%Y-%m").date()
+            for name in names if name.endswith(".parquet")
+        ]
+
+    def _files(self, dataset, vessels, start, end):
+        base = os.path.join(self.root, dataset.name)
+        if vessels is None:
+            vessels = [
+                int(name.split("=", 1)[1]) for name in (os.listdir(base) if os.path.isdir(base) else [])
+                if name.startswith("vessel=")
+            ]
+        first = f"{month_start(start):%Y-%m}" if start else None
+        last = f"{month_start(end):%Y-%m}" if end else None
+        for vessel in sorted(vessels):
+            directory = os.path.join(base, f"vessel={vessel}")
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if not name.endswith(".parquet"):
+                    continue
+                month = name[:-len(".parquet")]
+                if (first and month < first) or (last and month > last):
+                    continue
+                yield vessel, os.path.join(directory, name)
+
+    def read(self, dataset, vessels=None, start=None, end=None, parameters=None, equals=None):
+        """
+        Rows (vessel + dataset.columns) of the partitions of vessels (default
+        all) between the dates start and end (inclusive), restricted to
+        parameters and to the column values in equals. Files are memory-mapped.
+        """
+        import pyarrow.parquet as pq
+
+        filters = []
+        if start:
+            filters.append((dataset.range_column, ">=", self._bound(dataset, start)))
+        if end:
+            filters.append((dataset.range_column, "<", self._bound(dataset, end + datetime.timedelta(days=1))))
+        if parameters is not None:
+            filters.append(("parameter", "in", [int(parameter) for parameter in parameters]))
+        for column, value in (equals or {}).items():
+            filters.append((column, "==", value))
+
+        frames = []
+        for vessel, path in self._files(dataset, vessels, start, end):
+            table = pq.read_table(path, memory_map=True, filters=filters or None)
+            if table.num_rows:
+                frame = table.to_pandas()
+                for column in dataset.text_columns:
+                    frame[column] = frame[column].astype(object).where(frame[column].notna(), None)
+                frames.append(frame.assign(vessel=vessel))
+        if not frames:
+            return pd.DataFrame(columns=["vessel", *dataset.columns])
+        return pd.concat(frames, ignore_index=True)[["vessel", *dataset.columns]]
+
+    @staticmethod
+    def _bound(dataset, day):
+        if dataset.range_column == "timestamp":
+            return pd.Timestamp(day, tz="UTC")
+        return day
@@ -1,3 +1,329 @@
-from django.test import TestCase
+import datetime
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.signals import post_delete, post_save
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .downsample import downsample_indices, lttb, minmax, series_indices
+from .models import (
+    DataVersion, DisplacementList, EnrParameter, EnrParameterRollup, IngestionRun, MovementList, ParameterList,
+    PartitionVersion, SeaTrialParameter, VesselList, sync_columnar_store,
+)
+from .signals import VERSIONED_MODELS
+from .storage import ENR_DATASET, SEATRIAL_DATASET, ColumnarStore, partitions_of
+
+
+class SignalTests(TestCase):
+    def version(self, name):
+        return DataVersion.objects.filter(name=name).values_list("version", flat=True).first() or 0
+
+    def test_only_versioned_models_have_receivers(self):
+        # Without receivers the bulk deletes of these models need not fetch and signal every row
+        for model in (EnrParameterRollup, DataVersion, PartitionVersion, IngestionRun):
+            with self.subTest(model=model.__name__):
+                self.assertFalse(post_save.has_listeners(model))
+                self.assertFalse(post_delete.has_listeners(model))
+        for model in VERSIONED_MODELS:
+            with self.subTest(model=model.__name__):
+                self.assertTrue(post_save.has_listeners(model))
+                self.assertTrue(post_delete.has_listeners(model))
+
+    def test_save_and_delete_bump_the_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            vessel = VesselList.objects.create(vesselname="V1", description="")
+        self.assertEqual(self.version(DataVersion.VESSELS), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            vessel.delete()
+        self.assertEqual(self.version(DataVersion.VESSELS), 2)
+
+
+class RecalculationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vessel = VesselList.objects.create(vesselname="V1", description="")
+        cls.power = ParameterList.objects.create(code="010001", description="M/E Power")
+        cls.doubled = ParameterList.objects.create(
+            code="900001", description="Doubled", is_calculated=True, formula="{010001} * 2",
+        )
+
+    def create(self, value, day=1):
+        # The calculated values are written when the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return EnrParameter.objects.create(
+                vessel=self.vessel, date=datetime.date(2024, 1, day), parameter=self.power, value=value,
+            )
+
+    def test_value_is_calculated_on_commit(self):
+        self.create(3.0)
+        self.assertEqual(EnrParameter.objects.get(parameter=self.doubled).value, 6.0)
+
+    def test_stale_value_is_deleted_without_signals(self):
+        row = self.create(3.0)
+        self.assertTrue(EnrParameter.objects.filter(parameter=self.doubled).exists())
+        deleted = mock.Mock()
+        post_delete.connect(deleted, sender=EnrParameter)
+        self.addCleanup(post_delete.disconnect, deleted, sender=EnrParameter)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            row.delete()
+
+        self.assertFalse(EnrParameter.objects.exists())
+        # Only the deleted input, not the calculated value it removed
+        self.assertEqual([call.kwargs["instance"] for call in deleted.call_args_list], [row])
+
+
+
+class BulkChangeTests(TestCase):
+    """Saving or deleting many rows in one transaction refreshes what depends on them once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vessels = [VesselList.objects.create(vesselname=f"V{i}", description="") for i in range(2)]
+        cls.power = ParameterList.objects.create(code="010001", description="M/E Power")
+        cls.doubled = ParameterList.objects.create(
+            code="900001", description="Doubled", is_calculated=True, formula="{010001} * 2",
+        )
+        # Created on first use otherwise, by whichever write comes first
+        DataVersion.objects.create(name=DataVersion.ENR)
+
+    def save_rows(self, vessel, days):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for day in range(days):
+                    EnrParameter.objects.create(
+                        vessel=vessel, date=datetime.date(2024, 1, 1) + datetime.timedelta(days=day),
+                        parameter=self.power, value=float(day),
+                    )
+        return len(queries)
+
+    def delete_rows(self, vessel):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            EnrParameter.objects.filter(vessel=vessel, parameter=self.power).delete()
+        return len(queries)
+
+    def test_queries_do_not_grow_with_the_rows(self):
+        few, many = self.vessels
+        # One INSERT per row, the rest is done once
+        self.assertEqual(self.save_rows(many, 50) - self.save_rows(few, 5), 45)
+        self.assertEqual(EnrParameter.objects.filter(parameter=self.doubled).count(), 55)
+        self.assertEqual(EnrParameterRollup.objects.filter(vessel=many, granularity="month").count(), 4)
+
+        self.assertEqual(self.delete_rows(many), self.delete_rows(few))
+        self.assertFalse(EnrParameter.objects.exists())
+        self.assertFalse(EnrParameterRollup.objects.exists())
+
+
+class ColumnarStoreTests(TestCase):
+    """The Parquet partitions hold the database rows and the PartitionVersion they were written at."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vessels = [VesselList.objects.create(vesselname=f"V{i}", description="") for i in range(2)]
+        cls.parameters = [ParameterList.objects.create(code=f"01000{i}", description="") for i in range(3)]
+        sea = MovementList.objects.create(name="Sea")
+        laden = DisplacementList.objects.create(name="Laden")
+        EnrParameter.objects.bulk_create(
+            EnrParameter(
+                vessel=vessel, date=datetime.date(2024, 1, 20) + datetime.timedelta(days=day),
+                movement=sea if day % 3 else None, displacement=laden, parameter=parameter, value=day * 1.5,
+            )
+            for vessel in cls.vessels for parameter in cls.parameters for day in range(20)
+        )
+        start = datetime.datetime(2024, 2, 29, 23, 50, tzinfo=datetime.timezone.utc)
+        SeaTrialParameter.objects.bulk_create(
+            SeaTrialParameter(
+                vessel=cls.vessels[0], session="S1", timestamp=start + datetime.timedelta(minutes=minute),
+                displacement=laden, parameter=cls.parameters[0], value=float(minute),
+            )
+            for minute in range(20)
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ColumnarStore(directory.name)
+        self.partitions = partitions_of(
+            [vessel.id for vessel in self.vessels] * 2, [datetime.date(2024, 1, 1)] * 2 + [datetime.date(2024, 2, 1)] * 2,
+        )
+
+    def test_read_matches_the_database_rows(self):
+        sync_columnar_store(ENR_DATASET, self.partitions, self.store)
+        vessel, parameters = self.vessels[1], self.parameters[:2]
+        frame = self.store.read(
+            ENR_DATASET, vessels=[vessel.id], start=datetime.date(2024, 1, 25), end=datetime.date(2024, 2, 3),
+            parameters=[parameter.id for parameter in parameters],
+        )
+        expected = EnrParameter.objects.filter(
+            vessel=vessel, parameter__in=parameters, date__range=(datetime.date(2024, 1, 25), datetime.date(2024, 2, 3)),
+        ).values_list("vessel", "date", "movement__name", "displacement__name", "parameter", "value")
+        self.assertEqual(len(frame), 20)
+        self.assertEqual(sorted(frame.itertuples(index=False, name=None)), sorted(expected))
+
+    def test_read_filters_on_labels(self):
+        sync_columnar_store(ENR_DATASET, self.partitions, self.store)
+        frame = self.store.read(ENR_DATASET, equals={"movement": "Sea"})
+        self.assertEqual(len(frame), EnrParameter.objects.filter(movement__name="Sea").count())
+        self.assertEqual(set(frame["movement"]), {"Sea"})
+
+    def test_seatrial_partitions_are_utc_months(self):
+        partitions = partitions_of([self.vessels[0].id] * 2, [datetime.date(2024, 2, 1), datetime.date(2024, 3, 1)])
+        sync_columnar_store(SEATRIAL_DATASET, partitions, self.store)
+        self.assertEqual(self.store.months(SEATRIAL_DATASET, self.vessels[0].id), [month for _, month in partitions])
+        frame = self.store.read(SEATRIAL_DATASET, start=datetime.date(2024, 3, 1), end=datetime.date(2024, 3, 1))
+        self.assertEqual(sorted(frame["value"]), [float(minute) for minute in range(10, 20)])
+
+    def test_partitions_record_their_version(self):
+        vessel = self.vessels[0].id
+        january, february = datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)
+        PartitionVersion.bump(ENR_DATASET.name, [(vessel, january), (vessel, january)])
+        PartitionVersion.bump(ENR_DATASET.name, [(vessel, january)])
+        sync_columnar_store(ENR_DATASET, [(vessel, january), (vessel, february)], self.store)
+        self.assertEqual(self.store.version(ENR_DATASET, vessel, january), 2)
+        # No PartitionVersion yet
+        self.assertEqual(self.store.version(ENR_DATASET, vessel, february), 0)
+        self.assertIsNone(self.store.version(ENR_DATASET, self.vessels[1].id, january))
+
+        versions = {(vessel, january): 2, (vessel, february): 0, (self.vessels[1].id, january): 1}
+        self.assertEqual(self.store.stale_partitions(ENR_DATASET, versions), [(self.vessels[1].id, january)])
+        PartitionVersion.bump(ENR_DATASET.name, [(vessel, january)])
+        versions = PartitionVersion.versions(ENR_DATASET.name, [(vessel, january), (vessel, february)])
+        self.assertEqual(self.store.stale_partitions(ENR_DATASET, versions), [(vessel, january)])
+
+    def test_emptied_partition_keeps_its_version(self):
+        vessel, march = self.vessels[0].id, datetime.date(2024, 3, 1)
+        PartitionVersion.bump(ENR_DATASET.name, [(vessel, march)])
+        sync_columnar_store(ENR_DATASET, [(vessel, march)], self.store)
+        self.assertTrue(os.path.exists(self.store._path(ENR_DATASET, vessel, march)))
+        self.assertEqual(self.store.stale_partitions(ENR_DATASET, {(vessel, march): 1}), [])
+        self.assertTrue(self.store.read(ENR_DATASET, vessels=[vessel], start=march, end=march).empty)
+
+
+class LabelMigrationTests(TransactionTestCase):
+    """0011 moves the movement / displacement text of the existing rows into the lookup tables."""
+
+    before = [("enr", "0010_parameterlist_formula")]
+    after = [("enr", "0011_movement_displacement_lookups")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        apps = self.migrate(self.before)
+        self.addCleanup(self.migrate, MigrationExecutor(connection).loader.graph.leaf_nodes())
+        vessel = apps.get_model("enr", "VesselList").objects.create(vesselname="V1", description="")
+        parameter = apps.get_model("enr", "ParameterList").objects.create(code="010001", description="")
+        enr = apps.get_model("enr", "EnrParameter")
+        labels = [("Sea", "Laden"), ("Port", "Laden"), ("Sea", None), (None, "Ballast"), ("", "")]
+        self.enr_ids = {
+            labels: enr.objects.create(
+                vessel=vessel, date=datetime.date(2024, 1, day + 1), movement=labels[0], displacement=labels[1],
+                parameter=parameter, value=float(day),
+            ).id
+            for day, labels in enumerate(labels)
+        }
+        seatrial = apps.get_model("enr", "SeaTrialParameter")
+        self.seatrial_ids = {
+            displacement: seatrial.objects.create(
+                vessel=vessel, session="S1", timestamp=datetime.datetime(2024, 2, 1, 0, minute, tzinfo=datetime.timezone.utc),
+                displacement=displacement, parameter=parameter, value=1.0,
+            ).id
+            for minute, displacement in enumerate(["Laden", "Scantling", None])
+        }
+
+    def test_labels_become_lookup_rows(self):
+        apps = self.migrate(self.after)
+        movements = apps.get_model("enr", "MovementList").objects
+        displacements = apps.get_model("enr", "DisplacementList").objects
+        # One row per distinct label, none for the null and blank ones
+        self.assertEqual(sorted(movements.values_list("name", flat=True)), ["Port", "Sea"])
+        self.assertEqual(sorted(displacements.values_list("name", flat=True)), ["Ballast", "Laden", "Scantling"])
+
+        enr = apps.get_model("enr", "EnrParameter").objects
+        for (movement, displacement), id_ in self.enr_ids.items():
+            with self.subTest(movement=movement, displacement=displacement):
+                row = enr.get(id=id_)
+                self.assertEqual(row.movement.name if row.movement else None, movement or None)
+                self.assertEqual(row.displacement.name if row.displacement else None, displacement or None)
+        seatrial = apps.get_model("enr", "SeaTrialParameter").objects
+        for displacement, id_ in self.seatrial_ids.items():
+            row = seatrial.get(id=id_)
+            self.assertEqual(row.displacement.name if row.displacement else None, displacement)
+        # Both tables share the displacement lookup
+        self.assertEqual(
+            enr.get(id=self.enr_ids[("Sea", "Laden")]).displacement_id,
+            seatrial.get(id=self.seatrial_ids["Laden"]).displacement_id,
+        )
+
+    def test_reverse_restores_the_labels(self):
+        self.migrate(self.after)
+        apps = self.migrate(self.before)
+        enr = apps.get_model("enr", "EnrParameter").objects
+        self.assertEqual(
+            {row.id: (row.movement, row.displacement) for row in enr.all()},
+            {id_: (movement or None, displacement or None) for (movement, displacement), id_ in self.enr_ids.items()},
+        )
+
+
+class DownsampleTests(TestCase):
+    def setUp(self):
+        self.x = np.arange(100, dtype=float)
+        self.y = np.sin(self.x / 10)
+        # A single peak a bucket average would hide
+        self.y[42] = 50.0
+
+    def test_lttb_keeps_the_ends_and_the_peaks(self):
+        kept = lttb(self.x, self.y, 10)
+        self.assertEqual(len(kept), 10)
+        self.assertEqual((kept[0], kept[-1]), (0, 99))
+        self.assertIn(42, kept)
+        self.assertTrue(np.all(np.diff(kept) > 0))
+
+    def test_minmax_keeps_the_extremes_of_every_bucket(self):
+        kept = minmax(self.x, self.y, 10)
+        self.assertLessEqual(len(kept), 10)
+        self.assertEqual((kept[0], kept[-1]), (0, 99))
+        for bucket in np.array_split(np.arange(100), 4):
+            self.assertIn(bucket[np.argmax(self.y[bucket])], kept)
+            self.assertIn(bucket[np.argmin(self.y[bucket])], kept)
+
+    def test_at_most_n_out_points_are_kept(self):
+        for method in ("lttb", "minmax"):
+            for n_out in (3, 4, 5, 11):
+                with self.subTest(method=method, n_out=n_out):
+                    self.assertLessEqual(len(downsample_indices(self.x, self.y, n_out, method)), n_out)
+
+    def test_short_series_are_kept_whole(self):
+        for method in ("lttb", "minmax"):
+            with self.subTest(method=method):
+                self.assertEqual(downsample_indices(self.x[:5], self.y[:5], 10, method).tolist(), [0, 1, 2, 3, 4])
+
+    def test_missing_values_are_never_kept(self):
+        self.y[::3] = np.nan
+        for method in ("lttb", "minmax"):
+            with self.subTest(method=method):
+                kept = downsample_indices(self.x, self.y, 10, method)
+                self.assertFalse(np.isnan(self.y[kept]).any())
+
+    def test_every_series_is_downsampled_on_its_own(self):
+        groups = np.repeat([1, 2], 50)
+        x = np.tile(np.arange(50, dtype=float), 2)
+        values = np.column_stack([self.y, -self.y])
+        kept = series_indices(groups, x, values, 5)
+        for group in (1, 2):
+            rows = kept[groups[kept] == group]
+            self.assertEqual((rows.min(), rows.max()), ((group - 1) * 50, group * 50 - 1))
+        # At most 5 points for each of the 4 series
+        self.assertLessEqual(len(kept), 20)
+
+    def test_unknown_method_is_rejected(self):
+        with self.assertRaises(ValueError):
+            downsample_indices(self.x, self.y, 10, "average")
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fleetsys.settings')
+# Read endpoints as async views (api/async_views.py), e.g.
+#   uvicorn fleetsys.asgi:application --workers 1
+os.environ.setdefault('API_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
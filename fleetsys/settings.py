@@ -56,7 +56,12 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # Query count and phase timings of every request, first so its total covers
+    # the other middleware; not loaded unless API_INSTRUMENTATION is set
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # brotli / gzip, before the middleware that may read or change the response body
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -85,6 +90,20 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'fleetsys.wsgi.application'
+ASGI_APPLICATION = 'fleetsys.asgi.application'
+
+# Serve the read endpoints with the async views of api/async_views.py. Set by
+# fleetsys/asgi.py, so uvicorn / daphne get them and WSGI servers the sync views.
+API_ASYNC_VIEWS = os.environ.get("API_ASYNC_VIEWS") == "1"
+
+# Per-request instrumentation (api/instrumentation.py): query count, SQL, pivot,
+# serialization and export time, rows read and response bytes of every request,
+# sent in a Server-Timing header and summed per endpoint at /api/metrics/ in the
+# Prometheus text format. Costs a few microseconds per query when enabled.
+API_INSTRUMENTATION = os.environ.get("API_INSTRUMENTATION") == "1"
+# Bearer token Prometheus has to send to read /api/metrics/ (authorization:
+# credentials in the scrape config), the endpoint is open when unset
+API_METRICS_TOKEN = os.environ.get("API_METRICS_TOKEN") or None
 
 
 # Database
@@ -101,6 +120,36 @@ DATABASES = {
     }
 }
 
+# Cached API responses are keyed by DataVersion, so a per-process cache stays correct;
+# point this at Redis or Memcached to share the cache between workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fleetsys-api',
+    },
+    # Results of the performance queries (api/caching.py, cached_by_partitions),
+    # least recently used entries are evicted first. One entry at a time is
+    # evicted when CULL_FREQUENCY equals MAX_ENTRIES.
+    'performance': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fleetsys-performance',
+        'OPTIONS': {'MAX_ENTRIES': 500, 'CULL_FREQUENCY': 500},
+    },
+}
+# Share the performance cache between processes, e.g. redis://127.0.0.1:6379/1
+# (requires redis-py, configure the server with maxmemory-policy allkeys-lru)
+if os.environ.get("API_CACHE_REDIS_URL"):
+    CACHES['performance'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ["API_CACHE_REDIS_URL"],
+    }
+
+# Directory of the optional columnar (Parquet) copy of the performance and
+# sea-trial values, read by the chart, export and regression endpoints instead
+# of the database when set (requires pyarrow, see enr/storage.py).
+# Build it with `manage.py build_columnar_store`.
+ENR_COLUMNAR_STORE = os.environ.get("ENR_COLUMNAR_STORE") or None
+
 
 
 # Password validation
@@ -161,6 +210,11 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # orjson when installed (api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 SIMPLE_JWT = {